@@ -1,7 +1,7 @@
 {
 
     'name': 'efundOpc',
-    'version': '19.0.1',
+    'version': '19.0.1.1',
     'category': 'Finance',
     'summary': 'Gestion de Fonds - Suite',
     'description': """
@@ -22,6 +22,11 @@
     'data': [
         'security/ir.model.access.csv',
         'security/efund_security.xml',
+        'data/efund_account_cash_data.xml',
+        'data/efund_account_part_data.xml',
+        'data/efund_fund_order_batch_data.xml',
+        'data/efund_fund_nav_data.xml',
+        'data/efund_fund_instrument_price_data.xml',
         'views/efund_views_management_company_form.xml',
         'views/efund_action_menu_principal.xml',
         'views/efund_menu_principal.xml',
@@ -50,6 +55,7 @@
         'views/efund_views_valuation.xml',
         'reports/efund_kyc_report.xml',
         'reports/efund_kyc_report_template.xml',
+        'reports/efund_fund_valuation_report.xml',
         'views/efund_fund_instrument_event_views.xml',
         'views/efund_position_adjustment_views.xml',
         'wizard/efund_account_activate_wizard_views.xml',
@@ -61,8 +67,17 @@
         'views/efund_fund_redemption_views.xml',
         'views/efund_cash_withdraw_views.xml',
         'wizard/efund_confirm_wizard_views.xml',
+        'wizard/efund_fund_order_import_wizard_views.xml',
         'views/efund_fund_type_views.xml',
         'views/efund_asset_class_views.xml',
+        'views/efund_fund_order_batch_views.xml',
+        'views/efund_fund_flow_views.xml',
+        'views/efund_fund_nav_run_views.xml',
+        'views/efund_fund_nav_views.xml',
+        'views/efund_stress_test_views.xml',
+        'views/efund_price_import_config_views.xml',
+        'views/efund_fund_instrument_price_import_views.xml',
+        'views/efund_fund_instrument_price_review_views.xml',
 
     ],
 
@@ -0,0 +1,31 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Fusionne les cours en double (instrument, date) avant la création de la contrainte d'unicité.
+
+    Pour chaque clé, on garde le cours validé, à défaut le plus récemment modifié ;
+    les autres sont supprimés (l'index des derniers cours est reconstruit à la mise à jour).
+    """
+    if not version:
+        return
+    cr.execute("SELECT to_regclass('efund_fund_instrument_price')")
+    if not cr.fetchone()[0]:
+        return
+    cr.execute(
+        """
+        DELETE FROM efund_fund_instrument_price price
+         USING (
+                SELECT id, ROW_NUMBER() OVER (
+                           PARTITION BY instrument_id, date
+                           ORDER BY is_validated IS TRUE DESC, write_date DESC NULLS LAST, id DESC
+                       ) AS rank
+                  FROM efund_fund_instrument_price
+               ) ranked
+         WHERE price.id = ranked.id AND ranked.rank > 1
+        """
+    )
+    if cr.rowcount:
+        _logger.info("Cours en double supprimés avant la contrainte (instrument, date) : %s", cr.rowcount)
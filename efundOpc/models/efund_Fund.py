@@ -1,5 +1,9 @@
 import logging
 
+from datetime import datetime, time, timedelta
+
+import pytz
+from dateutil.relativedelta import relativedelta
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 from odoo.models import Constraint
@@ -182,6 +186,24 @@ class Fund(models.Model):
         digits=(16, 4)
     )
 
+    management_fee_rate = fields.Float(
+        string="Frais de gestion (%)",
+        digits=(16, 4),
+        help="Taux annuel appliqué à l'actif du fonds lorsqu'il n'a pas de classe de parts."
+    )
+
+    custody_fee_rate = fields.Float(
+        string="Frais de dépositaire (%)",
+        digits=(16, 4),
+        help="Taux annuel couru chaque jour de valorisation sur l'actif du fonds."
+    )
+
+    fee_payment_date = fields.Date(
+        string="Frais payés jusqu'au",
+        help="Date du dernier paiement des frais : seuls les frais courus après cette date "
+             "restent au passif de la VL."
+    )
+
     subscription_fee_rate = fields.Float(
         string="Frais de souscription (%)",
         digits=(16, 4)
@@ -316,6 +338,19 @@ class Fund(models.Model):
 
         return funds
 
+    def write(self, vals):
+        if 'fee_payment_date' in vals:
+            # Le passif de frais change pour toutes les VL postérieures à l'ancienne ou à la nouvelle date
+            old_dates = {fund: fund.fee_payment_date for fund in self}
+        res = super().write(vals)
+        if 'fee_payment_date' in vals:
+            self.share_class_ids._crystallise_high_water_marks()
+            for fund, old_date in old_dates.items():
+                dates = [d for d in (old_date, fund.fee_payment_date) if d]
+                if dates:
+                    self.env['efund.fund.nav.dirty']._mark(fund.ids, min(dates))
+        return res
+
     def _post_create_setup(self, company):
         """Optional post-creation configuration."""
         return True
@@ -506,12 +541,157 @@ class Fund(models.Model):
             }
         }
 
+    # ------------------------------------------------------------
+    # RÈGLEMENT DES ORDRES
+    # ------------------------------------------------------------
+    def _get_timezone(self):
+        self.ensure_one()
+        return pytz.timezone(self.company_id.partner_id.tz or self.env.user.tz or 'UTC')
+
+    def _get_local_today(self):
+        """Date du jour dans le fuseau horaire du fonds."""
+        return pytz.utc.localize(fields.Datetime.now()).astimezone(self._get_timezone()).date()
+
+    def _get_cutoff_datetime(self, cutoff_date):
+        """Heure de cut-off du jour donné, en UTC (comme les champs Datetime)."""
+        hours = int(self.cutoff_time)
+        minutes = int(round((self.cutoff_time - hours) * 60))
+        local_cutoff = datetime.combine(cutoff_date, time(min(hours, 23), min(minutes, 59)))
+        return self._get_timezone().localize(local_cutoff).astimezone(pytz.utc).replace(tzinfo=None)
+
+    def _get_next_nav_date(self, from_date):
+        """Prochaine date de VL à partir de ``from_date`` (incluse) selon la périodicité du fonds."""
+        self.ensure_one()
+        if self.nav_frequency == 'monthly':
+            nav_date = from_date + relativedelta(day=31)
+        elif self.nav_frequency == 'weekly':
+            nav_date = from_date + timedelta(days=(4 - from_date.weekday()) % 7)
+        else:
+            nav_date = from_date
+        # Pas de VL le week-end
+        if nav_date.weekday() >= 5:
+            if self.nav_frequency == 'monthly':
+                nav_date -= timedelta(days=nav_date.weekday() - 4)
+            else:
+                nav_date += timedelta(days=7 - nav_date.weekday())
+        return nav_date
+
+    def _get_nav_per_share(self, nav_date, share_class=None):
+        """VL publiée pour la date, à défaut la VL saisie sur le fonds.
+
+        Avec ``share_class``, VL de cette classe (sans repli : 0 si elle n'est pas calculée).
+        """
+        self.ensure_one()
+        nav = self.env['efund.fund.nav'].search([
+            ('fund_id', '=', self.id),
+            ('share_class_id', '=', share_class.id if share_class else False),
+            ('date', '=', nav_date),
+            ('status', 'in', ('computed', 'posted')),
+        ], order='status desc', limit=1)
+        if share_class:
+            return nav.nav_per_share
+        return nav.nav_per_share or self.current_vl
+
+    def _group_orders_by_class(self, orders):
+        """Ordres (souscriptions ou rachats) du fonds par classe de parts de leur compte.
+
+        Les comptes sans classe relèvent de la classe principale (voir
+        efund.fund.class._get_class_units) ; sans classes, une seule clé vide.
+
+        :return: {classe (éventuellement vide): ordres}
+        """
+        self.ensure_one()
+        main_class = self.share_class_ids[:1]
+        return orders.grouped(lambda order: order.part_account_id.share_class_id or main_class)
+
+    def settle_subscriptions(self, nav_date, vl=None):
+        """Règle en lot toutes les souscriptions validées du fonds pour la date VL,
+        chacune à la VL de sa classe de parts.
+
+        :return: (souscriptions réglées, {souscription: message d'erreur})
+        """
+        self.ensure_one()
+        subscriptions = self.env['efund.fund.subscription'].search([
+            ('fund_id', '=', self.id),
+            ('state', '=', 'validated'),
+            ('nav_date', '=', nav_date),
+        ])
+        if not subscriptions:
+            return subscriptions, {}
+
+        settled, failures, navs = subscriptions.browse(), {}, []
+        for share_class, orders in self._group_orders_by_class(subscriptions).items():
+            class_vl = vl or self._get_nav_per_share(nav_date, share_class)
+            if not class_vl:
+                failures.update({order: _("%(order)s : VL de la classe %(share_class)s non disponible.",
+                                          order=order.display_name, share_class=share_class.name)
+                                 for order in orders})
+                continue
+            class_settled, class_failures = orders._settle_at_nav(class_vl)
+            settled |= class_settled
+            failures.update(class_failures)
+            navs.append(f"{share_class.name} : {class_vl}" if share_class else str(class_vl))
+        self.env['efund.fund.flow']._net_orders([nav_date], self)
+
+        body = _(
+            "Règlement des souscriptions du %s.<br/>"
+            "VL : %s<br/>"
+            "Ordres réglés : %s<br/>"
+            "Parts créées : %s<br/>"
+            "Montant investi : %s<br/>"
+            "Ordres en erreur : %s"
+        ) % (nav_date, ", ".join(navs) or "-", len(settled), sum(settled.mapped('parts')),
+             sum(settled.mapped('cash_used')), len(failures))
+        if failures:
+            body += "<br/>" + "<br/>".join(failures.values())
+        self.message_post(body=body)
+        return settled, failures
+
+    def action_settle_subscriptions(self):
+        """Règle les souscriptions validées du jour pour chaque fonds sélectionné."""
+        today = fields.Date.context_today(self)
+        settled_count = failure_count = 0
+        for fund in self:
+            settled, failures = fund.settle_subscriptions(today)
+            settled_count += len(settled)
+            failure_count += len(failures)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Règlement des souscriptions'),
+                'message': _('%s souscription(s) réglée(s), %s en erreur.') % (settled_count, failure_count),
+                'type': 'warning' if failure_count else 'success',
+                'sticky': bool(failure_count),
+            }
+        }
+
+    def action_open_order_import_wizard(self):
+        """Ouvre l'assistant d'import en masse des ordres distributeurs."""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Importer des ordres"),
+            'res_model': 'efund.fund.order.import.wizard',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_fund_id': self.id},
+        }
+
+    def get_holdings_at(self, at_date):
+        """Parts détenues par tous les comptes titres des fonds de self à une date.
+
+        Utilisé pour les registres de porteurs, les dividendes à date d'enregistrement
+        et les états réglementaires.
+
+        :return: {part_account_id: parts}
+        """
+        return self.env['efund.account.part']._query_holdings_at(at_date, fund_ids=self.ids)
+
     def get_dashboard_data(self):
         self.ensure_one()
 
-        latest_nav = self.env['efund.fund.nav'].search([
-            ('fund_id', '=', self.id)
-        ], limit=1, order="date desc")
+        series = self.env['efund.fund.nav.series']._get_for_fund(self)
 
         transactions = self.env['efund.fund.transaction'].search([
             ('fund_id', '=', self.id)
@@ -524,8 +704,15 @@ class Fund(models.Model):
                 'risk_level': self.risk_level,
                 'benchmark_index': self.benchmark_index,
                 'aum': self.aum if hasattr(self, 'aum') else 0,
-                'nav_latest': latest_nav.nav_per_share if latest_nav else 0,
-                'perf_ytd': 0,  # calcul à compléter
+                'nav_latest': series.last_nav or self.current_vl,
+                'perf_ytd': round(series.return_ytd, 2),
+                'perf_1m': round(series.return_1m, 2),
+                'perf_3m': round(series.return_3m, 2),
+                'perf_1y': round(series.return_1y, 2),
+                'perf_inception': round(series.return_inception, 2),
+                'volatility_1y': round(series.volatility_1y, 2),
+                'max_drawdown': round(series.max_drawdown, 2),
+                'sharpe_1y': round(series.sharpe_1y, 2),
             },
             'transactions': [{
                 'date': t.date,
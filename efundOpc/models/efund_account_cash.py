@@ -1,5 +1,10 @@
+import logging
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL, float_is_zero
+
+_logger = logging.getLogger(__name__)
 
 class EfundAccountCash(models.Model):
     _name = 'efund.account.cash'
@@ -12,7 +17,8 @@ class EfundAccountCash(models.Model):
     mandate_id = fields.Many2one('efund.mandate', string="Mandat", index=True)
     company_id = fields.Many2one('res.company', related='fund_id.company_id', store=True, index=True, readonly=True)
     investor_id = fields.Many2one('efund.investor', string="Investisseur", ondelete='cascade')
-    balance = fields.Float(string="Solde disponible", compute='_compute_balance',store=False)
+    balance = fields.Float(string="Solde disponible", readonly=True, copy=False, default=0.0,
+                           help="Solde maintenu à chaque création, annulation ou suppression d'un mouvement espèces.")
     date_opened = fields.Date(string="Date d’ouverture", default=fields.Date.today)
     state = fields.Selection([
         ('draft', 'Non Activé'),
@@ -31,15 +37,103 @@ class EfundAccountCash(models.Model):
             'Un investisseur ne peut avoir qu’un compte espèces par fonds'
         )
 
-    def _compute_balance(self):
-        for acc in self:
-            moves = self.env['efund.account.cash.move'].search([
-                ('cash_account_id', '=', acc.id)
-            ])
-            acc.balance = sum(
-                m.amount if m.move_type in('deposit','refund','redemption_net') else -m.amount
-                for m in moves
-            )
+    # -------------------------------------------------
+    # SOLDE MATÉRIALISÉ
+    # -------------------------------------------------
+    @api.model
+    def _apply_balance_deltas(self, deltas):
+        """Applique {cash_account_id: variation} aux soldes stockés en une seule requête.
+
+        L'incrément est fait en SQL (balance = balance + delta) pour rester correct
+        lorsque plusieurs transactions mouvementent le même compte en parallèle.
+        """
+        deltas = {
+            account_id: delta for account_id, delta in deltas.items()
+            if account_id and not float_is_zero(delta, precision_digits=6)
+        }
+        if not deltas:
+            return
+        self.env.cr.execute(SQL(
+            """
+            UPDATE efund_account_cash AS acc
+               SET balance = COALESCE(acc.balance, 0) + v.delta
+              FROM (VALUES %s) AS v(id, delta)
+             WHERE acc.id = v.id
+            """,
+            SQL(", ").join(SQL("(%s, %s::float8)", account_id, delta) for account_id, delta in deltas.items()),
+        ))
+        accounts = self.browse(deltas)
+        accounts.invalidate_recordset(['balance'])
+        accounts.modified(['balance'])
+
+    def _get_balances_from_moves(self):
+        """Recalcule les soldes de self à partir des mouvements (un seul regroupement SQL)."""
+        balances = dict.fromkeys(self.ids, 0.0)
+        groups = self.env['efund.account.cash.move']._read_group(
+            [('cash_account_id', 'in', self.ids), ('state', '=', 'posted')],
+            ['cash_account_id'],
+            ['amount_signed:sum'],
+        )
+        for account, amount_signed in groups:
+            balances[account.id] = amount_signed or 0.0
+        return balances
+
+    @api.model
+    def _rebuild_balances(self, accounts=None):
+        """Reconstruit les soldes stockés de tous les comptes (ou de ``accounts``)."""
+        accounts = self.search([]) if accounts is None else accounts
+        if not accounts:
+            return
+        balances = accounts._get_balances_from_moves()
+        self.env.cr.execute(SQL(
+            """
+            UPDATE efund_account_cash AS acc
+               SET balance = v.balance
+              FROM (VALUES %s) AS v(id, balance)
+             WHERE acc.id = v.id
+            """,
+            SQL(", ").join(SQL("(%s, %s::float8)", account_id, balance) for account_id, balance in balances.items()),
+        ))
+        accounts.invalidate_recordset(['balance'])
+        accounts.modified(['balance'])
+
+    def _check_balance_consistency(self, fix=False):
+        """Compare les soldes stockés aux mouvements et retourne les écarts.
+
+        :return: liste de tuples (compte, solde stocké, solde recalculé)
+        """
+        accounts = self or self.search([])
+        balances = accounts._get_balances_from_moves()
+        mismatches = [
+            (acc, acc.balance, balances[acc.id])
+            for acc in accounts
+            if not float_is_zero(acc.balance - balances[acc.id], precision_digits=2)
+        ]
+        for acc, stored, expected in mismatches:
+            _logger.warning("Solde incohérent sur le compte espèces %s : stocké %s, attendu %s",
+                            acc.account_number, stored, expected)
+        if fix and mismatches:
+            self._rebuild_balances(self.browse([acc.id for acc, __, __ in mismatches]))
+        return mismatches
+
+    def action_check_balances(self):
+        """Contrôle de cohérence des soldes (appelé depuis l'action serveur)."""
+        mismatches = self._check_balance_consistency(fix=self.env.context.get('fix_balances', False))
+        if mismatches:
+            message = _("%s compte(s) avec un solde incohérent : %s") % (
+                len(mismatches), ", ".join(acc.account_number for acc, __, __ in mismatches[:10]))
+        else:
+            message = _("Tous les soldes sont cohérents avec les mouvements.")
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Contrôle des soldes'),
+                'message': message,
+                'type': 'warning' if mismatches else 'success',
+                'sticky': bool(mismatches),
+            }
+        }
 
     def action_open_cash_deposit_wizard(self):
         self.ensure_one()
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 
@@ -6,7 +8,10 @@ class EfundAccountCashMove(models.Model):
     _name = 'efund.account.cash.move'
     _description = 'Mouvements compte espèces'
 
-    cash_account_id = fields.Many2one('efund.account.cash', required=True)
+    # Types de mouvement qui créditent le compte espèces (les autres le débitent)
+    _CREDIT_MOVE_TYPES = ('deposit', 'refund', 'redemption_net')
+
+    cash_account_id = fields.Many2one('efund.account.cash', required=True, index=True)
     fund_id = fields.Many2one(related='cash_account_id.fund_id', store=True)
     mandate_id = fields.Many2one('efund.mandate', string="Mandat", index=True)
     currency_id = fields.Many2one(related='fund_id.currency_id')
@@ -18,4 +23,57 @@ class EfundAccountCashMove(models.Model):
          ('capital_return', 'Remboursement capital'), ], required=True)
 
     amount = fields.Monetary(required=True, currency_field='currency_id')
+    amount_signed = fields.Monetary(string="Montant signé", currency_field='currency_id',
+                                    compute='_compute_amount_signed', store=True,
+                                    help="Montant positif pour un crédit du compte espèces, négatif pour un débit.")
     date = fields.Datetime(default=fields.Datetime.now)
+    state = fields.Selection([('posted', 'Comptabilisé'), ('cancelled', 'Annulé')],
+                             string="Statut", default='posted', required=True, index=True)
+
+    @api.depends('amount', 'move_type')
+    def _compute_amount_signed(self):
+        for move in self:
+            sign = 1 if move.move_type in self._CREDIT_MOVE_TYPES else -1
+            move.amount_signed = sign * (move.amount or 0.0)
+
+    # -------------------------------------------------
+    # MAINTENANCE DU SOLDE DES COMPTES ESPÈCES
+    # -------------------------------------------------
+    def _get_balance_deltas(self):
+        """Retourne {cash_account_id: variation de solde} des mouvements comptabilisés."""
+        deltas = defaultdict(float)
+        for move in self:
+            if move.state != 'posted':
+                continue
+            deltas[move.cash_account_id.id] += move.amount_signed
+        return deltas
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        self.env['efund.account.cash']._apply_balance_deltas(moves._get_balance_deltas())
+        return moves
+
+    def write(self, vals):
+        if not {'amount', 'move_type', 'cash_account_id', 'state'} & set(vals):
+            return super().write(vals)
+
+        old_deltas = self._get_balance_deltas()
+        res = super().write(vals)
+        deltas = self._get_balance_deltas()
+        for account_id, delta in old_deltas.items():
+            deltas[account_id] -= delta
+        self.env['efund.account.cash']._apply_balance_deltas(deltas)
+        return res
+
+    def unlink(self):
+        deltas = {account_id: -delta for account_id, delta in self._get_balance_deltas().items()}
+        res = super().unlink()
+        self.env['efund.account.cash']._apply_balance_deltas(deltas)
+        return res
+
+    def action_cancel(self):
+        """Annule les mouvements : ils ne comptent plus dans le solde du compte."""
+        if self.filtered(lambda m: m.state == 'cancelled'):
+            raise UserError(_("Un mouvement annulé ne peut pas être annulé une seconde fois."))
+        self.write({'state': 'cancelled'})
@@ -1,5 +1,8 @@
+from datetime import datetime, time, timedelta
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
 
 
 class EfundAccountPart(models.Model):
@@ -11,6 +14,9 @@ class EfundAccountPart(models.Model):
     account_number = fields.Char(string="Numéro compte", required=True, copy=False)
     investor_id = fields.Many2one('efund.investor', string="Investisseur", ondelete='cascade')
     fund_id = fields.Many2one('efund.fund', string="Fonds", required=True, ondelete='cascade')
+    share_class_id = fields.Many2one('efund.fund.class', string="Classe de parts", index=True,
+                                     domain="[('fund_id', '=', fund_id)]",
+                                     help="Vide : les parts relèvent de la classe principale du fonds.")
     company_id = fields.Many2one('res.company', related='fund_id.company_id', store=True, index=True, readonly=True)
     date_opened = fields.Date(string="Date d’ouverture")
     total_parts = fields.Float(compute='_compute_total_parts', store=False)
@@ -62,14 +68,140 @@ class EfundAccountPart(models.Model):
         }
 
     def _compute_total_parts(self):
+        holdings = self._query_holdings_at(fields.Date.today(), account_ids=self._origin.ids)
         for acc in self:
-            moves = self.env['efund.account.part.move'].search([
-                ('part_account_id', '=', acc.id)
-            ])
-            acc.total_parts = sum(
-                m.parts if m.move_type in ('subscription','refund') else -m.parts
-                for m in moves
+            acc.total_parts = holdings.get(acc._origin.id, 0.0)
+
+    # -------------------------------------------------
+    # DÉTENTIONS À DATE (ARRÊTÉS + MOUVEMENTS POSTÉRIEURS)
+    # -------------------------------------------------
+    @api.model
+    def _query_holdings_at(self, at_date, account_ids=None, fund_ids=None):
+        """Parts détenues en fin de journée ``at_date``, en une seule requête.
+
+        Pour chaque compte, on part du dernier arrêté antérieur ou égal à la date
+        et on n'ajoute que les mouvements situés entre cet arrêté et la date.
+
+        :param account_ids: restreint aux comptes donnés
+        :param fund_ids: restreint aux comptes des fonds donnés
+        :return: {part_account_id: parts}
+        """
+        if account_ids is not None and not account_ids:
+            return {}
+        self.env.cr.execute(SQL(
+            "SELECT holdings.id, holdings.parts FROM (%s) holdings",
+            self._holdings_query(at_date, account_ids=account_ids, fund_ids=fund_ids),
+        ))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _query_units_by_class(self, at_date, fund_ids):
+        """Parts en circulation par (fonds, classe de parts) en fin de journée ``at_date``.
+
+        :return: {(fund_id, share_class_id ou None): parts}
+        """
+        if not fund_ids:
+            return {}
+        self.env.cr.execute(SQL(
+            """
+            SELECT holdings.fund_id, holdings.share_class_id, SUM(holdings.parts)
+              FROM (%s) holdings
+             GROUP BY holdings.fund_id, holdings.share_class_id
+            """,
+            self._holdings_query(at_date, fund_ids=fund_ids),
+        ))
+        return {(fund_id, class_id): parts for fund_id, class_id, parts in self.env.cr.fetchall()}
+
+    @api.model
+    def _query_units_by_fund(self, at_date, fund_ids):
+        """Parts en circulation par fonds en fin de journée ``at_date``, en une seule requête.
+
+        :return: {fund_id: parts}
+        """
+        if not fund_ids:
+            return {}
+        self.env.cr.execute(SQL(
+            """
+            SELECT holdings.fund_id, SUM(holdings.parts)
+              FROM (%s) holdings
+             GROUP BY holdings.fund_id
+            """,
+            self._holdings_query(at_date, fund_ids=fund_ids),
+        ))
+        return dict(self.env.cr.fetchall())
+
+    def _holdings_query(self, at_date, account_ids=None, fund_ids=None):
+        """Requête (id, fund_id, share_class_id, parts) des avoirs par compte, commune aux lectures à date."""
+        at_date = fields.Date.to_date(at_date)
+        at_limit = datetime.combine(at_date + timedelta(days=1), time.min)
+
+        account_filter = SQL("TRUE")
+        if account_ids is not None:
+            account_filter = SQL("acc.id = ANY(%s)", list(account_ids))
+        fund_filter = SQL("TRUE")
+        if fund_ids is not None:
+            fund_filter = SQL("acc.fund_id = ANY(%s)", list(fund_ids))
+
+        self.env['efund.account.part.move'].flush_model(['part_account_id', 'move_type', 'parts', 'date'])
+        self.env['efund.account.part.checkpoint'].flush_model(['part_account_id', 'date', 'parts'])
+        return SQL(
+            """
+            WITH accounts AS (
+                SELECT acc.id, acc.fund_id, acc.share_class_id FROM efund_account_part acc WHERE %(account_filter)s AND %(fund_filter)s
+            ), checkpoints AS (
+                SELECT DISTINCT ON (cp.part_account_id) cp.part_account_id, cp.date, cp.parts
+                  FROM efund_account_part_checkpoint cp
+                  JOIN accounts ON accounts.id = cp.part_account_id
+                 WHERE cp.date <= %(at_date)s
+                 ORDER BY cp.part_account_id, cp.date DESC
             )
+            SELECT accounts.id, accounts.fund_id, accounts.share_class_id,
+                   COALESCE(cp.parts, 0) + COALESCE(SUM(
+                       CASE WHEN m.move_type IN %(credit_types)s THEN m.parts ELSE -m.parts END
+                   ), 0) AS parts
+              FROM accounts
+              LEFT JOIN checkpoints cp ON cp.part_account_id = accounts.id
+              LEFT JOIN efund_account_part_move m
+                     ON m.part_account_id = accounts.id
+                    AND m.date < %(at_limit)s
+                    AND (cp.date IS NULL OR m.date >= cp.date + 1)
+             GROUP BY accounts.id, accounts.fund_id, accounts.share_class_id, cp.parts
+            """,
+            account_filter=account_filter,
+            fund_filter=fund_filter,
+            at_date=at_date,
+            at_limit=at_limit,
+            credit_types=tuple(self.env['efund.account.part.move']._CREDIT_MOVE_TYPES),
+        )
+
+    def get_parts_at(self, at_date):
+        """Parts détenues par chaque compte de self à la date donnée : {part_account_id: parts}."""
+        return self._query_holdings_at(at_date, account_ids=self.ids)
+
+    @api.model
+    def _generate_checkpoints(self, checkpoint_date, fund_ids=None):
+        """Enregistre (ou remplace) l'arrêté de tous les comptes à ``checkpoint_date``."""
+        checkpoint_date = fields.Date.to_date(checkpoint_date)
+        holdings = self._query_holdings_at(checkpoint_date, fund_ids=fund_ids)
+        if not holdings:
+            return 0
+        Checkpoint = self.env['efund.account.part.checkpoint'].sudo()
+        Checkpoint.search([
+            ('part_account_id', 'in', list(holdings)),
+            ('date', '=', checkpoint_date),
+        ]).unlink()
+        Checkpoint.create([{
+            'part_account_id': account_id,
+            'date': checkpoint_date,
+            'parts': parts,
+        } for account_id, parts in holdings.items()])
+        return len(holdings)
+
+    @api.model
+    def _cron_generate_month_end_checkpoints(self):
+        """Arrêté de fin du mois précédent pour tous les comptes titres."""
+        month_end = fields.Date.today().replace(day=1) - timedelta(days=1)
+        self._generate_checkpoints(month_end)
 
     def action_open_subscription_wizard(self):
         self.ensure_one()
@@ -0,0 +1,20 @@
+from odoo import models, fields
+
+
+class EfundAccountPartCheckpoint(models.Model):
+    _name = 'efund.account.part.checkpoint'
+    _description = 'Arrêté périodique des comptes titres'
+    _order = 'date desc, part_account_id'
+
+    part_account_id = fields.Many2one('efund.account.part', string="Compte titres", required=True,
+                                      index=True, ondelete='cascade')
+    fund_id = fields.Many2one(related='part_account_id.fund_id', store=True, index=True)
+    investor_id = fields.Many2one(related='part_account_id.investor_id', store=True)
+    date = fields.Date(string="Date d'arrêté", required=True, index=True,
+                       help="Parts détenues en fin de journée à cette date.")
+    parts = fields.Float(string="Parts détenues", digits=(16, 4))
+
+    _part_account_date_uniq = models.Constraint(
+        'unique(part_account_id, date)',
+        'Un seul arrêté par compte titres et par date'
+    )
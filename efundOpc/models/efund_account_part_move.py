@@ -4,8 +4,11 @@ class EfundAccountPartMove(models.Model):
     _name = 'efund.account.part.move'
     _description = 'Mouvements compte titres'
 
+    # Types de mouvement qui augmentent le nombre de parts détenues
+    _CREDIT_MOVE_TYPES = ('subscription', 'refund')
+
     part_account_id = fields.Many2one(
-        'efund.account.part', required=True
+        'efund.account.part', required=True, index=True
     )
 
     fund_id = fields.Many2one(
@@ -24,4 +27,37 @@ class EfundAccountPartMove(models.Model):
     ], required=True)
 
     parts = fields.Float(required=True)
-    date = fields.Datetime(default=fields.Datetime.now)
+    date = fields.Datetime(default=fields.Datetime.now, index=True)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        moves._invalidate_checkpoints()
+        return moves
+
+    def write(self, vals):
+        if {'part_account_id', 'move_type', 'parts', 'date'} & set(vals):
+            self._invalidate_checkpoints()
+        res = super().write(vals)
+        if {'part_account_id', 'date'} & set(vals):
+            self._invalidate_checkpoints()
+        return res
+
+    def unlink(self):
+        self._invalidate_checkpoints()
+        return super().unlink()
+
+    def _invalidate_checkpoints(self):
+        """Supprime les arrêtés que ces mouvements (antidatés) rendent faux.
+
+        Les lectures retombent alors sur l'arrêté précédent, qui reste exact.
+        """
+        if not self:
+            return
+        first_date = min(fields.Date.to_date(move.date or fields.Datetime.now()) for move in self)
+        self.env['efund.account.part.checkpoint'].sudo().search([
+            ('part_account_id', 'in', self.part_account_id.ids),
+            ('date', '>=', first_date),
+        ]).unlink()
+        # Le nombre de parts en circulation des VL suivantes change aussi
+        self.env['efund.fund.nav.dirty']._mark(self.fund_id.ids, first_date)
@@ -42,6 +42,19 @@ class EfundBourseOrder(models.Model):
         default=lambda self: self.env.company
     )
 
+    fund_flow_id = fields.Many2one(
+        'efund.fund.flow',
+        string="Flux net souscriptions / rachats",
+        index=True,
+        domain="[('fund_id', '=', fund_id)]",
+        help="Flux net du fonds que cet ordre investit ou désinvestit"
+    )
+    flow_net_cash = fields.Monetary(
+        related='fund_flow_id.net_cash',
+        string="Flux net à traiter",
+        currency_field="currency_id"
+    )
+
     execution_line_ids = fields.One2many(
         'efund.bourse.order.execution.line',
         'order_id',
@@ -1,18 +1,17 @@
 # efund_fund_instrument_price_import.py
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
-import base64
-import io
 import logging
-import csv
 import json
-from datetime import datetime
+
+from ..tools.price_fetcher import PriceFetcher, FetchError
 
 _logger = logging.getLogger(__name__)
 
 
 class FundInstrumentPriceImport(models.Model):
     _name = "efund.fund.instrument.price.import"
+    _inherit = ["efund.price.import.mixin"]
     _description = "Configuration d'import des cours"
 
     name = fields.Char(string="Nom de la configuration", required=True)
@@ -25,15 +24,45 @@ class FundInstrumentPriceImport(models.Model):
     # Configuration pour l'import Excel/CSV
     excel_file = fields.Binary(string="Fichier Excel/CSV")
     filename = fields.Char(string="Nom du fichier")
+    sheet_names = fields.Char(string="Feuilles à importer",
+                              help="Noms des feuilles du classeur, séparés par des virgules (toutes si vide).")
 
     # Configuration pour l'API
     api_url = fields.Char(string="URL de l'API")
     api_key = fields.Char(string="Clé API")
     api_parameters = fields.Text(string="Paramètres API")
+    api_records_path = fields.Char(string="Chemin des cours dans la réponse", default="quoteResponse.result",
+                                   help="Chemin JSON (clés séparées par des points) de la liste des cours.")
+    api_symbol_field = fields.Selection([('ticker', 'Ticker'), ('isin', 'ISIN')], string="Code transmis à l'API",
+                                        default='ticker', required=True)
+    instrument_ids = fields.Many2many('efund.fund.instrument', string="Instruments",
+                                      help="Instruments interrogés lorsque l'URL contient {symbol} ou {symbols} "
+                                           "(tous les instruments actifs codés si vide).")
+    api_batch_size = fields.Integer(string="Symboles par requête", default=50,
+                                    help="Taille des lots de symboles pour une URL contenant {symbols}.")
+    api_max_workers = fields.Integer(string="Requêtes simultanées", default=8)
+    api_rate_limit = fields.Float(string="Débit maximal (req/s)", default=5.0,
+                                  help="Limite commune à toutes les requêtes vers ce fournisseur (0 : illimité).")
+    api_max_retries = fields.Integer(string="Nouvelles tentatives", default=3,
+                                     help="Sur erreur réseau, 429 ou 5xx, avec délai exponentiel.")
+    api_timeout = fields.Integer(string="Délai d'attente (s)", default=10)
+    auto_import = fields.Boolean(string="Import planifié",
+                                 help="Import exécuté par la tâche planifiée « Import automatique des cours ».")
+
+    # Mapping des colonnes / chemins JSON (vide : en-têtes reconnus automatiquement)
+    mapping_ids = fields.One2many('efund.fund.instrument.price.import.mapping', 'import_config_id',
+                                  string="Mapping", copy=True)
+    header_rows = fields.Integer(string="Lignes d'en-tête", default=1,
+                                 help="Lignes précédant les données dans chaque feuille, avec un mapping explicite.")
+    auto_validate = fields.Boolean(string="Valider après contrôle",
+                                   help="Valide les cours importés jugés conformes par le contrôle de vraisemblance ; "
+                                        "les autres sont placés dans la file de revue.")
 
     # Informations d'import
     last_import_date = fields.Datetime(string="Dernier import")
     import_log = fields.Text(string="Log d'import")
+    error_file = fields.Binary(string="Rapport d'erreurs", readonly=True, attachment=False)
+    error_filename = fields.Char(readonly=True)
     active = fields.Boolean(string="Actif", default=True)
 
     def action_import_prices(self):
@@ -48,182 +77,152 @@ class FundInstrumentPriceImport(models.Model):
             raise UserError(_("Méthode d'import non supportée"))
 
     def _import_from_file(self):
-        """Importer depuis un fichier"""
+        """Importer depuis un fichier (lecture en flux, mapping compilé, upsert par lots)"""
         if not self.excel_file:
             raise UserError(_("Veuillez d'abord charger un fichier"))
 
+        sheet_names = [name.strip() for name in (self.sheet_names or '').split(',') if name.strip()]
+        result = self._import_price_file(self.excel_file, self.filename, default_date=fields.Date.today(),
+                                         sheet_names=sheet_names, specs=self.mapping_ids._get_specs(),
+                                         header_rows=self.header_rows)
+        return self._save_import_result(result, _('Cours importés'))
+
+    def _get_api_specs(self):
+        """Mapping de la réponse d'API : celui de la configuration, à défaut le format Yahoo Finance."""
+        return self.mapping_ids._get_specs() or [
+            {'target': 'instrument_code', 'path': 'symbol'},
+            {'target': 'price', 'path': 'regularMarketPrice'},
+            {'target': 'currency', 'path': 'currency'},
+        ]
+
+    def _get_api_fetcher(self):
+        """Client HTTP de l'import : session commune, parallélisme, débit et tentatives de la configuration."""
+        headers = {'Accept': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+        return PriceFetcher(
+            headers=headers,
+            timeout=self.api_timeout or 10,
+            max_workers=self.api_max_workers or 1,
+            max_retries=self.api_max_retries,
+            rate_limit=self.api_rate_limit,
+            burst=self.api_max_workers or 1,
+        )
+
+    def _get_api_params(self):
+        if not self.api_parameters:
+            return {}
         try:
-            file_content = base64.b64decode(self.excel_file)
-            text_content = file_content.decode('utf-8', errors='ignore')
-
-            # Lire le CSV
-            csv_file = io.StringIO(text_content)
-            reader = csv.reader(csv_file, delimiter=',')
-
-            prices_created = []
-            errors = []
-
-            for i, row in enumerate(reader, 1):
-                try:
-                    if i == 1 and len(row) > 0 and 'instrument' in row[0].lower():
-                        continue  # Sauter l'en-tête
-
-                    if len(row) >= 3:
-                        instrument_code = row[0].strip()
-                        price_value = float(row[1].replace(',', '.').strip())
-                        price_date = row[2].strip()
-
-                        # Chercher l'instrument
-                        instrument = self.env['efund.fund.instrument'].search([
-                            '|',
-                            ('isin', '=', instrument_code),
-                            ('ticker', '=', instrument_code),
-                            ('name', 'ilike', instrument_code)
-                        ], limit=1)
-
-                        if not instrument:
-                            errors.append(f"Ligne {i}: Instrument '{instrument_code}' non trouvé")
-                            continue
-
-                        # Convertir la date
-                        try:
-                            date_obj = datetime.strptime(price_date, '%Y-%m-%d').date()
-                        except:
-                            date_obj = fields.Date.today()
-
-                        # Vérifier si le cours existe déjà
-                        existing = self.env['efund.fund.instrument.price'].search([
-                            ('instrument_id', '=', instrument.id),
-                            ('date', '=', date_obj)
-                        ], limit=1)
-
-                        if existing:
-                            existing.write({
-                                'price': price_value,
-                                'currency_id': instrument.currency_id.id
-                            })
-                            prices_created.append(existing.id)
-                        else:
-                            # Créer un nouveau prix
-                            price = self.env['efund.fund.instrument.price'].create({
-                                'instrument_id': instrument.id,
-                                'date': date_obj,
-                                'price': price_value,
-                                'currency_id': instrument.currency_id.id,
-                                'is_validated': False,
-                            })
-                            prices_created.append(price.id)
-
-                except Exception as e:
-                    errors.append(f"Ligne {i}: {str(e)}")
-
-            # Mettre à jour le log
-            log_message = f"Import terminé le {fields.Datetime.now()}\n"
-            log_message += f"Cours importés/mis à jour: {len(prices_created)}\n"
-            log_message += f"Erreurs: {len(errors)}\n"
-
-            if errors:
-                log_message += "\nErreurs:\n"
-                for error in errors[:10]:
-                    log_message += f"- {error}\n"
-
-            self.import_log = log_message
-            self.last_import_date = fields.Datetime.now()
-
-            # Retourner les prix créés
-            if prices_created:
-                return {
-                    'name': _('Cours importés'),
-                    'type': 'ir.actions.act_window',
-                    'res_model': 'efund.fund.instrument.price',
-                    'view_mode': 'tree,form',
-                    'domain': [('id', 'in', prices_created)],
-                    'context': {'create': False},
-                }
-            else:
-                raise UserError(_("Aucun cours n'a été importé. Vérifiez les erreurs dans le log."))
-
-        except Exception as e:
-            _logger.error(f"Erreur lors de l'import: {str(e)}", exc_info=True)
-            raise UserError(_("Erreur lors de l'import du fichier: %s") % str(e))
+            return json.loads(self.api_parameters)
+        except ValueError:
+            raise UserError(_("Les paramètres API doivent être un objet JSON."))
+
+    def _get_api_jobs(self):
+        """Requêtes à exécuter : [(symboles, url, paramètres)].
+
+        L'URL peut contenir {symbol} (une requête par instrument) ou {symbols} (symboles
+        séparés par des virgules, par lots de api_batch_size) ; sinon une requête unique.
+        """
+        params = self._get_api_params()
+        if '{symbol}' not in self.api_url and '{symbols}' not in self.api_url:
+            return [((), self.api_url, params)]
+        instruments = self.instrument_ids or self.env['efund.fund.instrument'].search(
+            [(self.api_symbol_field, '!=', False)])
+        symbols = sorted({(instrument[self.api_symbol_field] or '').strip()
+                          for instrument in instruments} - {''})
+        if '{symbol}' in self.api_url:
+            return [((symbol,), self.api_url.replace('{symbol}', symbol), params) for symbol in symbols]
+        size = max(self.api_batch_size, 1)
+        return [(tuple(batch), self.api_url.replace('{symbols}', ','.join(batch)), params)
+                for batch in (symbols[i:i + size] for i in range(0, len(symbols), size))]
+
+    def _fetch_api_records(self):
+        """Interroge l'API en parallèle.
+
+        :return: ([(code par défaut, enregistrement)], erreurs [(ligne, code, message)], statistiques)
+        """
+        jobs = self._get_api_jobs()
+        get_records = self._compile_getter({'target': 'records', 'path': self.api_records_path}, None) \
+            if self.api_records_path else None
+        records, errors = [], []
+        with self._get_api_fetcher() as fetcher:
+            for symbols, data, error in fetcher.fetch_all(jobs):
+                label = ','.join(symbols) or self.api_url
+                if error:
+                    errors.append(('API', label, error))
+                    continue
+                found = get_records(data) if get_records else data
+                if isinstance(found, dict):
+                    found = [found]
+                if not isinstance(found, list):
+                    errors.append(('API', label, _("Aucune liste de cours trouvée au chemin « %s » de la réponse.")
+                                   % self.api_records_path))
+                    continue
+                # Une requête par instrument : le symbole vaut code par défaut de la réponse
+                default_code = symbols[0] if len(symbols) == 1 else None
+                records += [(default_code, record) for record in found]
+            stats = dict(fetcher.stats)
+        _logger.info("Import API %s : %s requêtes (%s nouvelles tentatives, %s échecs), %s cours reçus",
+                     self.name, stats['requests'], stats['retries'], stats['failures'], len(records))
+        return records, errors, stats
 
     def _import_from_api(self):
-        """Importer depuis une API"""
+        """Importer depuis une API (requêtes parallèles, mapping compilé sur les chemins JSON, upsert)"""
         if not self.api_url:
             raise UserError(_("URL API non configurée"))
 
-        try:
-            import requests
-
-            headers = {}
-            if self.api_key:
-                headers['Authorization'] = f"Bearer {self.api_key}"
-
-            params = {}
-            if self.api_parameters:
-                try:
-                    params = json.loads(self.api_parameters)
-                except:
-                    pass
-
-            response = requests.get(
-                self.api_url,
-                headers=headers,
-                params=params,
-                timeout=30
-            )
-
-            if response.status_code != 200:
-                raise UserError(_("Erreur API: %s - %s") % (response.status_code, response.text))
-
-            # Traiter la réponse (à adapter selon l'API)
-            data = response.json()
-
-            # Exemple de traitement pour Yahoo Finance style
-            prices_created = []
-
-            if 'quoteResponse' in data and 'result' in data['quoteResponse']:
-                for item in data['quoteResponse']['result']:
-                    symbol = item.get('symbol', '')
-                    price_value = item.get('regularMarketPrice', 0)
-
-                    if symbol and price_value:
-                        instrument = self.env['efund.fund.instrument'].search([
-                            ('ticker', '=', symbol)
-                        ], limit=1)
-
-                        if instrument:
-                            price = self.env['efund.fund.instrument.price'].create({
-                                'instrument_id': instrument.id,
-                                'date': fields.Date.today(),
-                                'price': price_value,
-                                'currency_id': instrument.currency_id.id,
-                                'is_validated': False,
-                            })
-                            prices_created.append(price.id)
-
-            # Mettre à jour le log
-            log_message = f"Import API terminé le {fields.Datetime.now()}\n"
-            log_message += f"Cours importés: {len(prices_created)}\n"
-
-            self.import_log = log_message
-            self.last_import_date = fields.Datetime.now()
-
-            if prices_created:
-                return {
-                    'name': _('Cours importés via API'),
-                    'type': 'ir.actions.act_window',
-                    'res_model': 'efund.fund.instrument.price',
-                    'view_mode': 'tree,form',
-                    'domain': [('id', 'in', prices_created)],
-                    'context': {'create': False},
-                }
-            else:
-                raise UserError(_("Aucun cours n'a été importé depuis l'API."))
-
-        except Exception as e:
-            _logger.error(f"Erreur lors de l'import API: {str(e)}", exc_info=True)
-            raise UserError(_("Erreur lors de l'import API: %s") % str(e))
+        records, errors, stats = self._fetch_api_records()
+        if not records and errors:
+            raise UserError(_("Erreur API: %s") % errors[0][2])
+        result = self._import_price_records(records, self._get_api_specs(), default_date=fields.Date.today(),
+                                            keyed=True)
+        result['errors'] = errors + result['errors']
+        return self._save_import_result(result, _('Cours importés via API'))
+
+    @api.model
+    def _cron_import_prices(self):
+        """Exécute les imports planifiés ; l'échec d'une configuration n'empêche pas les autres."""
+        for config in self.search([('auto_import', '=', True), ('import_method', '!=', 'manual')]):
+            try:
+                with self.env.cr.savepoint():
+                    config.action_import_prices()
+            except Exception as e:
+                _logger.error("Erreur lors de l'import automatique %s : %s", config.name, e, exc_info=True)
+                config.import_log = f"Échec de l'import planifié le {fields.Datetime.now()}\n{e}"
+
+    def _save_import_result(self, result, title):
+        """Consigne le résultat d'un import (log, rapport d'erreurs) et ouvre les cours importés."""
+        errors = result['errors']
+        log_message = f"Import terminé le {fields.Datetime.now()}\n"
+        log_message += self._format_price_import_summary(result) + "\n"
+        if self.auto_validate and (result['created'] or result['updated']):
+            clean, flagged = self.env['efund.fund.instrument.price'].browse(
+                result['created'] + result['updated'])._screen()
+            clean._validate()
+            log_message += f"{len(clean)} cours validés, {len(flagged)} placés en revue.\n"
+        if errors:
+            log_message += "\nErreurs:\n"
+            for line_number, code, message in errors[:10]:
+                log_message += f"- Ligne {line_number} ({code}): {message}\n"
+
+        self.write({
+            'import_log': log_message,
+            'last_import_date': fields.Datetime.now(),
+            'error_file': self._make_error_report(errors) if errors else False,
+            'error_filename': 'erreurs_%s.csv' % (self.filename or 'cours').rsplit('.', 1)[0] if errors else False,
+        })
+
+        prices = result['created'] + result['updated']
+        if not prices:
+            raise UserError(_("Aucun cours n'a été importé. Vérifiez les erreurs dans le log."))
+        return {
+            'name': title,
+            'type': 'ir.actions.act_window',
+            'res_model': 'efund.fund.instrument.price',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', prices)],
+            'context': {'create': False},
+        }
 
     def action_test_connection(self):
         """Tester la connexion API"""
@@ -231,53 +230,37 @@ class FundInstrumentPriceImport(models.Model):
 
         if self.import_method != 'api':
             raise UserError(_("Cette action n'est disponible que pour les imports API"))
+        if not self.api_url:
+            raise UserError(_("URL API non configurée"))
 
-        try:
-            import requests
-
-            headers = {}
-            if self.api_key:
-                headers['Authorization'] = f"Bearer {self.api_key}"
-
-            params = {}
-            if self.api_parameters:
-                try:
-                    params = json.loads(self.api_parameters)
-                except:
-                    pass
-
-            response = requests.get(
-                self.api_url,
-                headers=headers,
-                params=params,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'display_notification',
-                    'params': {
-                        'title': _('Connexion réussie'),
-                        'message': _('La connexion à l\'API a réussi. Code: %s') % response.status_code,
-                        'type': 'success',
-                        'sticky': False,
-                    }
-                }
-            else:
-                raise UserError(_("Erreur de connexion: %s") % response.status_code)
-
-        except Exception as e:
-            raise UserError(_("Erreur de connexion: %s") % str(e))
-
-
+        jobs = self._get_api_jobs()
+        if not jobs:
+            raise UserError(_("Aucun instrument à interroger : renseignez les instruments ou leurs codes."))
+        __, url, params = jobs[0]
+        with self._get_api_fetcher() as fetcher:
+            try:
+                fetcher.get_json(url, params)
+            except FetchError as e:
+                raise UserError(_("Erreur de connexion: %s") % e)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Connexion réussie'),
+                'message': _("La connexion à l'API a réussi (%s).") % url,
+                'type': 'success',
+                'sticky': False,
+            }
+        }
 
 
 class FundInstrumentPriceImportMapping(models.Model):
     _name = "efund.fund.instrument.price.import.mapping"
     _description = "Mapping des colonnes pour l'import"
+    _order = "sequence, id"
 
-    import_config_id = fields.Many2one('efund.fund.instrument.price.import', required=True)
+    import_config_id = fields.Many2one('efund.fund.instrument.price.import', required=True, ondelete='cascade')
+    sequence = fields.Integer(default=10)
     field_name = fields.Selection([
         ('instrument_code', 'Code de l\'instrument'),
         ('instrument_name', 'Nom de l\'instrument'),
@@ -291,7 +274,28 @@ class FundInstrumentPriceImportMapping(models.Model):
         ('close', 'Clôture'),
     ], string="Champ Odoo", required=True)
 
-    column_name = fields.Char(string="Nom de la colonne dans le fichier", required=True)
+    column_name = fields.Char(string="Nom de la colonne dans le fichier")
     column_index = fields.Integer(string="Index de la colonne (0-based)")
+    json_path = fields.Char(string="Chemin JSON", help="Clés séparées par des points, ex. : quote.close.0")
+    date_format = fields.Char(string="Format de date", help="Format strptime, ex. : %d/%m/%Y (détection si vide).")
+    decimal_separator = fields.Selection([('.', 'Point'), (',', 'Virgule')], string="Séparateur décimal",
+                                         help="Détection automatique si vide.")
+    thousands_separator = fields.Selection([(' ', 'Espace'), ('.', 'Point'), (',', 'Virgule'), ("'", 'Apostrophe')],
+                                           string="Séparateur de milliers")
+    scale = fields.Float(string="Échelle", default=1.0, digits=(16, 6),
+                         help="Multiplicateur appliqué à la valeur (ex. : 0.01 pour des centimes, 1000 pour des milliers).")
     required = fields.Boolean(string="Requis", default=True)
 
+    def _get_specs(self):
+        """Définition du mapping pour le moteur d'import (voir efund.price.import.mixin)."""
+        return [{
+            'target': mapping.field_name,
+            'column_name': mapping.column_name,
+            'column_index': mapping.column_index,
+            'path': mapping.json_path,
+            'date_format': mapping.date_format,
+            'decimal_separator': mapping.decimal_separator,
+            'thousands_separator': mapping.thousands_separator,
+            'scale': mapping.scale,
+            'required': mapping.required,
+        } for mapping in self]
@@ -1,5 +1,6 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
 
 class FundClass(models.Model):
     _name = "efund.fund.class"
@@ -120,15 +121,32 @@ class FundClass(models.Model):
         string='Total Shares Outstanding',
         digits=(16, 2),
         compute='_compute_share_statistics',
-        store=True,
-        help="Nombre total de parts en circulation"
+        help="Nombre total de parts en circulation à la dernière VL de la classe"
     )
 
     total_net_assets = fields.Float(
         string='Total Net Assets',
         compute='_compute_share_statistics',
-        store=True,
-        help="Actifs nets attribués à cette classe"
+        help="Actifs nets attribués à cette classe à sa dernière VL"
+    )
+
+    last_nav_date = fields.Date(
+        string='Last NAV Date',
+        compute='_compute_share_statistics',
+    )
+
+    high_water_mark = fields.Float(
+        string='High-Water Mark',
+        digits=(16, 4),
+        readonly=True,
+        help="VL publiée à la dernière cristallisation (à défaut, VL de lancement) : la commission "
+             "de performance ne court qu'au-delà"
+    )
+
+    crystallisation_date = fields.Date(
+        string='Dernière cristallisation',
+        help="Date de la dernière cristallisation de la commission de performance : seule la "
+             "commission courue après cette date reste au passif de la VL."
     )
 
     current_nav = fields.Float(
@@ -139,14 +157,14 @@ class FundClass(models.Model):
 
 
     # === Computed Methods ===
-    @api.depends('fund_id')
     def _compute_share_statistics(self):
-        """Calcule les statistiques de parts en circulation et actifs nets"""
-        # Note: Cette méthode serait complétée avec la logique réelle de calcul
+        """Parts et actifs nets de la dernière VL calculée de chaque classe (une requête)."""
+        latest = self._get_latest_class_navs(self._origin.ids)
         for share_class in self:
-            # Exemple de calcul - à adapter avec la logique métier réelle
-            share_class.total_shares = 0.0
-            share_class.total_net_assets = 0.0
+            nav_date, total_shares, total_net_assets = latest.get(share_class._origin.id, (False, 0.0, 0.0))
+            share_class.last_nav_date = nav_date
+            share_class.total_shares = total_shares
+            share_class.total_net_assets = total_net_assets
 
     @api.depends('total_net_assets', 'total_shares')
     def _compute_current_nav(self):
@@ -157,6 +175,218 @@ class FundClass(models.Model):
             else:
                 share_class.current_nav = 0.0
 
+    @api.model
+    def _get_latest_class_navs(self, class_ids, at_date=None):
+        """Dernière VL calculée ou publiée par classe, à ``at_date`` inclus si elle est donnée.
+
+        :return: {class_id: (date, parts, actif net)}
+        """
+        if not class_ids:
+            return {}
+        self.env['efund.fund.nav'].flush_model(['share_class_id', 'date', 'status', 'total_shares', 'nav_total'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT DISTINCT ON (share_class_id) share_class_id, date, total_shares, nav_total
+              FROM efund_fund_nav
+             WHERE share_class_id = ANY(%s) AND status IN ('computed', 'posted') AND %s
+             ORDER BY share_class_id, date DESC, id DESC
+            """,
+            list(class_ids),
+            SQL("date <= %s", at_date) if at_date else SQL("TRUE"),
+        ))
+        return {class_id: (nav_date, shares, net) for class_id, nav_date, shares, net in self.env.cr.fetchall()}
+
+    # === Répartition de la VL par classe ===
+    @api.model
+    def _get_previous_class_navs(self, nav_date, class_ids):
+        """Dernière VL antérieure à ``nav_date`` par classe.
+
+        :return: {class_id: (date, vl)}
+        """
+        if not class_ids:
+            return {}
+        self.env['efund.fund.nav'].flush_model(['share_class_id', 'date', 'status', 'nav_per_share'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT DISTINCT ON (share_class_id) share_class_id, date, nav_per_share
+              FROM efund_fund_nav
+             WHERE share_class_id = ANY(%s) AND date < %s AND status IN ('computed', 'posted')
+             ORDER BY share_class_id, date DESC, id DESC
+            """,
+            list(class_ids), nav_date,
+        ))
+        return {class_id: (prev_date, nav) for class_id, prev_date, nav in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_launch_class_navs(self, class_ids):
+        """Première VL publiée par classe, référence de performance avant toute cristallisation.
+
+        :return: {class_id: vl}
+        """
+        if not class_ids:
+            return {}
+        self.env['efund.fund.nav'].flush_model(['share_class_id', 'date', 'status', 'nav_per_share'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT DISTINCT ON (share_class_id) share_class_id, nav_per_share
+              FROM efund_fund_nav
+             WHERE share_class_id = ANY(%s) AND status = 'posted'
+             ORDER BY share_class_id, date, id
+            """,
+            list(class_ids),
+        ))
+        return dict(self.env.cr.fetchall())
+
+    def _crystallise_high_water_marks(self):
+        """Relève le high-water mark des classes à la VL publiée à leur dernière cristallisation.
+
+        La date retenue est la cristallisation de la classe, à défaut le dernier paiement
+        des frais du fonds. Le high-water mark ne baisse jamais.
+        """
+        Nav = self.env['efund.fund.nav']
+        for share_class in self:
+            crystallisation_date = share_class.crystallisation_date or share_class.fund_id.fee_payment_date
+            if not crystallisation_date:
+                continue
+            nav = Nav.search([
+                ('share_class_id', '=', share_class.id),
+                ('status', '=', 'posted'),
+                ('date', '<=', crystallisation_date),
+            ], order='date desc, id desc', limit=1)
+            if nav.nav_per_share > share_class.high_water_mark:
+                share_class.high_water_mark = nav.nav_per_share
+
+    def _get_class_units(self, fund_id, units_by_class):
+        """Parts par classe d'un fonds (self) ; les comptes sans classe relèvent de la classe principale.
+
+        :param units_by_class: résultat de efund.account.part._query_units_by_class
+        :return: {class_id: parts}
+        """
+        units = {c.id: units_by_class.get((fund_id, c.id), 0.0) for c in self}
+        if self:
+            units[self[0].id] += units_by_class.get((fund_id, None), 0.0)
+        return units
+
+    def _get_allocation_weights(self, units, previous):
+        """Clé de répartition de l'actif d'un fonds entre ses classes (self).
+
+        Nombre de parts de chaque classe, pondéré par sa VL précédente dès que toutes
+        les classes en ont une (sinon, parts seules).
+
+        :return: {class_id: quote-part entre 0 et 1}
+        """
+        classes = self.filtered(lambda c: units.get(c.id, 0.0) > 0)
+        if all(previous.get(c.id, (None, 0.0))[1] > 0 for c in classes):
+            weights = {c.id: units[c.id] * previous[c.id][1] for c in classes}
+        else:
+            weights = {c.id: units[c.id] for c in classes}
+        total_weight = sum(weights.values())
+        return {c.id: weights[c.id] / total_weight if c in classes else 0.0 for c in self}
+
+    def _split_fund_nav(self, net_assets, units, previous, class_fees):
+        """Répartit l'actif net d'un fonds entre ses classes (self) et déduit leurs frais propres.
+
+        :param net_assets: actif du fonds après ses frais communs (dépositaire, TAF...)
+        :param units: {class_id: parts en circulation}
+        :param previous: résultat de :meth:`_get_previous_class_navs`
+        :param class_fees: {class_id: {type de frais: montant}} courus pour la date
+        :return: {class_id: valeurs de efund.fund.nav}
+        """
+        weights = self._get_allocation_weights(units, previous)
+        result = {}
+        for share_class in self:
+            class_units = units.get(share_class.id, 0.0)
+            gross_assets = net_assets * weights[share_class.id]
+            fees = class_fees.get(share_class.id, {})
+            management_fee = fees.get('management', 0.0)
+            performance_fee = fees.get('performance', 0.0)
+            class_net_assets = gross_assets - management_fee - performance_fee
+            result[share_class.id] = {
+                'total_assets': gross_assets,
+                'management_fee_accrual': management_fee,
+                'performance_fee_accrual': performance_fee,
+                'accrued_fees': management_fee + performance_fee,
+                'nav_total': class_net_assets,
+                'total_shares': class_units,
+                'nav_per_share': class_net_assets / class_units if class_units else 0.0,
+            }
+        return result
+
+    @api.model
+    def _allocate_nav(self, nav_date, funds=None):
+        """Calcule et enregistre la VL de toutes les classes des fonds donnés à ``nav_date``.
+
+        Une passe unique : actif net des fonds, frais courus des classes, parts par classe,
+        VL précédentes et VL existantes sont chacunes lues en une requête pour l'ensemble des fonds.
+        Les VL de classe déjà publiées ne sont pas modifiées.
+
+        :return: efund.fund.nav des classes calculées
+        """
+        nav_date = fields.Date.to_date(nav_date)
+        if funds is None:
+            funds = self.env['efund.fund'].search([('state', '=', 'active')])
+        classes = self.search([('fund_id', 'in', funds.ids)])
+        funds = classes.fund_id
+        if not funds:
+            return self.env['efund.fund.nav']
+
+        Nav = self.env['efund.fund.nav']
+        fund_values = Nav._compute_nav_values(nav_date, funds)
+        class_fees = Nav._query_class_fees(nav_date, classes.ids)
+        units_by_class = self.env['efund.account.part']._query_units_by_class(nav_date, funds.ids)
+        previous = self._get_previous_class_navs(nav_date, classes.ids)
+        existing = {nav.share_class_id.id: nav for nav in Nav.search([
+            ('share_class_id', 'in', classes.ids),
+            ('date', '=', nav_date),
+        ])}
+
+        now = fields.Datetime.now()
+        to_create = []
+        computed = Nav
+        for fund, fund_classes in classes.grouped('fund_id').items():
+            units = fund_classes._get_class_units(fund.id, units_by_class)
+            # L'actif net du fonds est déjà diminué des frais propres aux classes : on les réintègre
+            # avant répartition, chaque classe ne supportant que les siens
+            own_fees = sum(sum(class_fees.get(c.id, {}).values()) for c in fund_classes)
+            split = fund_classes._split_fund_nav(fund_values[fund.id]['nav_total'] + own_fees, units, previous,
+                                                 class_fees)
+            for class_id, values in split.items():
+                values.update(status='computed', computed_by=self.env.uid, computed_at=now)
+                nav = existing.get(class_id)
+                if not nav:
+                    to_create.append(dict(values, fund_id=fund.id, share_class_id=class_id, date=nav_date,
+                                          is_initial_valuation=False))
+                elif nav.status != 'posted':
+                    nav.write(values)
+                    computed |= nav
+        return computed | Nav.create(to_create)
+
+    def action_allocate_nav(self):
+        """Calcule la VL du jour de toutes les classes des fonds sélectionnés."""
+        navs = self._allocate_nav(fields.Date.context_today(self), self.fund_id)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('VL par classe'),
+                'message': _('%s VL de classe calculée(s).') % len(navs),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    def write(self, vals):
+        if 'crystallisation_date' in vals:
+            old_dates = {share_class: share_class.crystallisation_date for share_class in self}
+        res = super().write(vals)
+        if 'crystallisation_date' in vals:
+            self._crystallise_high_water_marks()
+            for share_class, old_date in old_dates.items():
+                dates = [d for d in (old_date, share_class.crystallisation_date) if d]
+                if dates:
+                    self.env['efund.fund.nav.dirty']._mark(share_class.fund_id.ids, min(dates))
+        return res
+
     # === Constraints ===
     @api.constrains('management_fee_rate', 'subscription_fee_rate', 'redemption_fee_rate', 'performance_fee_rate')
     def _check_fee_rates(self):
@@ -228,13 +458,13 @@ class FundClass(models.Model):
         return {
             'type': 'ir.actions.act_window',
             'name': f'NAV History - {self.name}',
-            'res_model': 'fund.nav',
-            'view_mode': 'tree,form,graph',
+            'res_model': 'efund.fund.nav',
+            'view_mode': 'list,form,graph',
             'domain': [('share_class_id', '=', self.id)],
             'context': {
+                'default_fund_id': self.fund_id.id,
                 'default_share_class_id': self.id,
-                'search_default_share_class_id': self.id,
-                'graph_group_by': ['nav_date'],
+                'graph_groupbys': ['date:day'],
             }
         }
 
@@ -0,0 +1,151 @@
+from odoo import models, fields, api, _
+
+
+class FundFlow(models.Model):
+    _name = 'efund.fund.flow'
+    _description = 'Flux net de souscriptions / rachats par fonds et date VL'
+    _order = 'nav_date desc, fund_id'
+
+    name = fields.Char(string="Référence", compute='_compute_name', store=True)
+    fund_id = fields.Many2one('efund.fund', string="Fonds", required=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one(related='fund_id.company_id', store=True)
+    currency_id = fields.Many2one(related='fund_id.currency_id')
+    nav_date = fields.Date(string="Date VL", required=True, index=True)
+    state = fields.Selection([
+        ('provisional', 'Provisoire'),
+        ('final', 'Définitif'),
+    ], string="Statut", default='provisional', required=True,
+        help="Provisoire tant que des ordres validés restent à régler à la VL.")
+
+    subscription_count = fields.Integer(string="Souscriptions")
+    subscription_units = fields.Float(string="Parts souscrites", digits=(16, 4))
+    subscription_amount = fields.Monetary(string="Montant investi", currency_field='currency_id')
+    subscription_fee_amount = fields.Monetary(string="Frais de souscription", currency_field='currency_id')
+
+    redemption_count = fields.Integer(string="Rachats")
+    redemption_units = fields.Float(string="Parts rachetées", digits=(16, 4))
+    redemption_amount = fields.Monetary(string="Montant versé", currency_field='currency_id')
+    redemption_fee_amount = fields.Monetary(string="Frais de rachat", currency_field='currency_id')
+
+    net_units = fields.Float(string="Parts nettes", digits=(16, 4), compute='_compute_net', store=True)
+    net_cash = fields.Monetary(string="Flux net de trésorerie", currency_field='currency_id',
+                               compute='_compute_net', store=True,
+                               help="Positif : liquidités à investir. Négatif : actifs à céder.")
+
+    bourse_order_ids = fields.One2many('efund.bourse.order', 'fund_flow_id', string="Ordres de bourse")
+
+    _fund_nav_date_uniq = models.Constraint(
+        'unique(fund_id, nav_date)',
+        'Un seul flux net par fonds et par date VL'
+    )
+
+    @api.depends('fund_id', 'nav_date')
+    def _compute_name(self):
+        for flow in self:
+            flow.name = f"{flow.fund_id.code or ''}/{flow.nav_date or ''}"
+
+    @api.depends('subscription_units', 'redemption_units', 'subscription_amount', 'redemption_amount')
+    def _compute_net(self):
+        for flow in self:
+            flow.net_units = flow.subscription_units - flow.redemption_units
+            flow.net_cash = flow.subscription_amount - flow.redemption_amount
+
+    # -------------------------------------------------
+    # COMPENSATION
+    # -------------------------------------------------
+    @api.model
+    def _net_orders(self, nav_dates, funds=None):
+        """Agrège les ordres validés ou réglés par fonds et date VL et enregistre les flux nets.
+
+        Une requête groupée par modèle d'ordre, quel que soit le nombre d'ordres. Les flux
+        existants sans plus aucun ordre sont remis à zéro.
+
+        :param nav_dates: dates VL à compenser
+        :param funds: fonds à compenser (tous par défaut)
+        :return: les flux nets créés ou mis à jour
+        """
+        domain = [('nav_date', 'in', list(nav_dates)), ('state', 'in', ('validated', 'accounted'))]
+        if funds is not None:
+            domain.append(('fund_id', 'in', funds.ids))
+
+        totals = {}
+        for fund, nav_date, state, count, parts, amount, cash_used, cash_refund in self.env[
+                'efund.fund.subscription']._read_group(
+                domain, ['fund_id', 'nav_date', 'state'],
+                ['__count', 'parts:sum', 'amount:sum', 'cash_used:sum', 'cash_refund:sum']):
+            values = totals.setdefault((fund.id, nav_date), self._empty_flow_values())
+            values['subscription_count'] += count
+            values['subscription_units'] += parts or 0.0
+            values['subscription_amount'] += cash_used or 0.0
+            values['subscription_fee_amount'] += (amount or 0.0) - (cash_used or 0.0) - (cash_refund or 0.0)
+            if state == 'validated':
+                values['state'] = 'provisional'
+
+        for fund, nav_date, state, count, parts, net_amount, fee in self.env[
+                'efund.fund.redemption']._read_group(
+                domain, ['fund_id', 'nav_date', 'state'],
+                ['__count', 'parts_to_redeem:sum', 'estimated_amount:sum', 'redemption_fee_amount:sum']):
+            values = totals.setdefault((fund.id, nav_date), self._empty_flow_values())
+            values['redemption_count'] += count
+            values['redemption_units'] += parts or 0.0
+            values['redemption_amount'] += net_amount or 0.0
+            values['redemption_fee_amount'] += fee or 0.0
+            if state == 'validated':
+                values['state'] = 'provisional'
+
+        flow_domain = [('nav_date', 'in', list(nav_dates))]
+        if funds is not None:
+            flow_domain.append(('fund_id', 'in', funds.ids))
+        existing = {(flow.fund_id.id, flow.nav_date): flow for flow in self.search(flow_domain)}
+
+        # Flux dont tous les ordres ont été annulés ou retirés : remis à zéro
+        emptied = self.browse().union(*(flow for key, flow in existing.items() if key not in totals))
+        if emptied:
+            emptied.write(self._empty_flow_values())
+
+        flows = emptied
+        to_create = []
+        for (fund_id, nav_date), values in totals.items():
+            flow = existing.get((fund_id, nav_date))
+            if flow:
+                flow.write(values)
+                flows |= flow
+            else:
+                to_create.append(dict(values, fund_id=fund_id, nav_date=nav_date))
+        return flows | self.create(to_create)
+
+    @api.model
+    def _empty_flow_values(self):
+        return {
+            'state': 'final',
+            'subscription_count': 0,
+            'subscription_units': 0.0,
+            'subscription_amount': 0.0,
+            'subscription_fee_amount': 0.0,
+            'redemption_count': 0,
+            'redemption_units': 0.0,
+            'redemption_amount': 0.0,
+            'redemption_fee_amount': 0.0,
+        }
+
+    def action_refresh(self):
+        for nav_date, flows in self.grouped('nav_date').items():
+            self._net_orders([nav_date], flows.fund_id)
+
+    def action_create_bourse_order(self):
+        """Ouvre un ordre de bourse pré-rempli pour investir ou désinvestir le flux net."""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Ordre de bourse"),
+            'res_model': 'efund.bourse.order',
+            'view_mode': 'form',
+            'target': 'current',
+            'context': {
+                'default_fund_id': self.fund_id.id,
+                'default_company_id': self.company_id.id,
+                'default_fund_flow_id': self.id,
+                'default_is_buy': self.net_cash > 0,
+                'default_is_sell': self.net_cash < 0,
+            }
+        }
@@ -1,4 +1,5 @@
 import logging
+import math
 from datetime import date
 from email.policy import default
 
@@ -8,6 +9,9 @@ from odoo.exceptions import ValidationError, UserError
 
 _logger = logging.getLogger(__name__)
 
+# Nombre de coupons par an selon la périodicité (0 : remboursement in fine)
+COUPONS_PER_YEAR = {'annual': 1, 'semi_annual': 2, 'quarterly': 4, 'monthly': 12, 'at_maturity': 0}
+
 
 class FundInstrument(models.Model):
     _name = "efund.fund.instrument"
@@ -38,6 +42,8 @@ class FundInstrument(models.Model):
     #  RELATIONS
     #--------------------------------------------------------
     price_ids = fields.One2many('efund.fund.instrument.price', 'instrument_id', string="Prix")
+    last_price_ids = fields.One2many('efund.fund.instrument.last.price', 'instrument_id',
+                                     string="Dernier cours validé (index)")
     issuer_id = fields.Many2one("efund.instrument.issuer",string="Émetteur",help="Institution ou entreprise qui émet l'instrument financier.")
     market = fields.Selection([('brvm', 'BRVM'), ('bvmac', 'BVMAC'), ('other', 'Autre marché'), ],string="Marché Principal", default='bvmac')
     custodian = fields.Selection([('dcbr', 'DC/BR'), ('bceao', 'BCEAO'), ('autre', 'Autre'), ], default='dcbr',string="Dépositaire", )
@@ -280,19 +286,12 @@ class FundInstrument(models.Model):
 
     # === MÉTHODES DE CALCUL ===
     # === MÉTHODE UNIFIÉE ===
-    @api.depends('price_ids')
+    @api.depends('last_price_ids.price', 'last_price_ids.date')
     def _compute_last_validated_price(self):
+        # Une requête sur l'index des derniers cours pour tous les instruments affichés
+        latest = self.env['efund.fund.instrument.last.price']._get_latest(self.ids)
         for instrument in self:
-            last_price = instrument.price_ids.filtered(
-                lambda p: p.is_validated
-            ).sorted('date', reverse=True)
-
-            if last_price:
-                instrument.last_validated_price = last_price[0].price
-                instrument.last_price_date = last_price[0].date
-            else:
-                instrument.last_validated_price = 0.0
-                instrument.last_price_date = False
+            instrument.last_validated_price, instrument.last_price_date = latest.get(instrument.id, (0.0, False))
 
     @api.depends('issue_date', 'maturity_date')
     def _compute_maturity_years(self):
@@ -408,6 +407,62 @@ class FundInstrument(models.Model):
             else:
                 bond.accrued_interest = 0.0
 
+    def _get_modified_duration(self, at_date):
+        """Duration modifiée (en années) d'une obligation ou d'un TCN à ``at_date``.
+
+        Calculée sur les flux restants, actualisés au taux facial (cours au pair).
+        Renvoie 0 pour les autres instruments et les titres échus.
+        """
+        self.ensure_one()
+        if self.instrument_type == 'bond':
+            maturity, rate = self.maturity_date, self.coupon_rate / 100
+            frequency = COUPONS_PER_YEAR.get(self.coupon_frequency, 1)
+        elif self.instrument_type == 'tcn':
+            maturity, rate, frequency = self.tcn_maturity_date, self.tcn_rate / 100, 0
+        else:
+            return 0.0
+        if not maturity or maturity <= at_date:
+            return 0.0
+        years = (maturity - at_date).days / 365.25
+        if not frequency or not rate:
+            return years / (1 + rate)
+
+        period_rate = rate / frequency
+        periods = max(1, math.ceil(years * frequency))
+        weighted = present_value = 0.0
+        for k in range(1, periods + 1):
+            t = years - (periods - k) / frequency
+            cash_flow = period_rate + (1 if k == periods else 0)
+            discounted = cash_flow / (1 + period_rate) ** (t * frequency)
+            weighted += t * discounted
+            present_value += discounted
+        return weighted / present_value / (1 + period_rate)
+
+    def _get_accrued_coupon(self, at_date):
+        """Coupon couru d'une obligation à ``at_date``, pour un titre (Actual/360).
+
+        Court depuis la dernière échéance de coupon (ou la date de jouissance) ;
+        renvoie 0 pour les autres instruments, hors période de vie du titre.
+        """
+        self.ensure_one()
+        start = self.value_date or self.issue_date
+        if self.instrument_type != 'bond' or not self.coupon_rate or not start or at_date <= start \
+                or (self.maturity_date and at_date > self.maturity_date):
+            return 0.0
+        frequency = COUPONS_PER_YEAR.get(self.coupon_frequency, 1)
+        if frequency:
+            months, periods = 12 // frequency, 0
+            while start + relativedelta(months=months * (periods + 1)) <= at_date:
+                periods += 1
+            start += relativedelta(months=months * periods)
+        return self.face_value * self.coupon_rate / 100 * (at_date - start).days / 360
+
+    def _get_accrued_coupons(self, at_date):
+        """Coupon couru par titre de chaque instrument (self) à ``at_date`` : {instrument_id: montant}."""
+        self.fetch(["instrument_type", "coupon_rate", "coupon_frequency", "face_value",
+                    "value_date", "issue_date", "maturity_date"])
+        return {instrument.id: instrument._get_accrued_coupon(at_date) for instrument in self}
+
     # ----------------------------------------------------
     # CONTRAINTES
     # ----------------------------------------------------
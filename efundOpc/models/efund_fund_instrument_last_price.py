@@ -0,0 +1,356 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from odoo import models, fields, api, _
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+# Séquence incrémentée après chaque commit modifiant des cours validés : les workers
+# qui la voient avancer vident leur cache (même principe que la signalisation du registre)
+CACHE_SIGNALING_SEQUENCE = 'efund_price_cache_signaling'
+
+
+class PriceCache:
+    """Cache LRU des cours par (instrument, date), commun aux requêtes d'un worker.
+
+    Les valeurs sont des (cours, date) ou None (aucun cours validé). ``date`` vaut None
+    pour le dernier cours validé.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.sequence = None
+        self.hits = self.misses = self.invalidations = 0
+        self.lock = threading.RLock()
+
+    def get_many(self, keys):
+        """:return: ({clé: valeur} trouvées, clés absentes)"""
+        found, missing = {}, []
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+                else:
+                    missing.append(key)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, values, sequence):
+        """Enregistre des valeurs lues sous la séquence ``sequence`` ; ignoré si le cache a
+        été invalidé depuis (les valeurs viennent alors d'un instantané dépassé)."""
+        with self.lock:
+            if self.sequence != sequence:
+                return
+            self.entries.update(values)
+            for key in values:
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self, sequence=None):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+            # Jamais de retour en arrière : un thread peut avoir lu la séquence avant un autre
+            if sequence is not None and (self.sequence is None or sequence > self.sequence):
+                self.sequence = sequence
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'sequence': self.sequence,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _get_price_cache(dbname, max_size=100000):
+    with _caches_lock:
+        cache = _caches.get(dbname)
+        if cache is None:
+            cache = _caches[dbname] = PriceCache(max_size)
+        cache.max_size = max_size
+        return cache
+
+
+class FundInstrumentLastPrice(models.Model):
+    _name = 'efund.fund.instrument.last.price'
+    _description = 'Dernier cours validé par instrument'
+    _order = 'instrument_id'
+
+    instrument_id = fields.Many2one('efund.fund.instrument', string="Instrument", required=True, index=True,
+                                    ondelete='cascade')
+    price_id = fields.Many2one('efund.fund.instrument.price', string="Cours", ondelete='set null')
+    date = fields.Date(string="Date du cours", required=True)
+    price = fields.Float(string="Cours", digits=(16, 4))
+    currency_id = fields.Many2one('res.currency', string="Devise du cours")
+
+    _instrument_uniq = models.Constraint(
+        'unique(instrument_id)',
+        'Un seul dernier cours par instrument'
+    )
+
+    def init(self):
+        self.env.cr.execute(SQL("CREATE SEQUENCE IF NOT EXISTS %s", SQL.identifier(CACHE_SIGNALING_SEQUENCE)))
+
+    # -------------------------
+    # MISE À JOUR
+    # -------------------------
+    @api.model
+    def _refresh(self, instrument_ids):
+        """Recalcule l'index des instruments donnés depuis leurs cours validés et réévalue leurs positions.
+
+        Une requête met l'index à jour (upsert des entrées qui changent, suppression des
+        instruments sans cours validé) ; une seconde réévalue en bloc toutes les positions
+        des instruments dont le dernier cours a changé.
+
+        :return: ids des instruments dont le dernier cours a changé
+        """
+        instrument_ids = [instrument_id for instrument_id in set(instrument_ids) if instrument_id]
+        if not instrument_ids:
+            return []
+        self.env['efund.fund.instrument.price'].flush_model(
+            ['instrument_id', 'date', 'price', 'currency_id', 'is_validated'])
+        self.flush_model()
+        self.env.cr.execute(SQL(
+            """
+            WITH latest AS (
+                SELECT DISTINCT ON (instrument_id) instrument_id, id, date, price, currency_id
+                  FROM efund_fund_instrument_price
+                 WHERE is_validated AND instrument_id = ANY(%(ids)s)
+                 ORDER BY instrument_id, date DESC, id DESC
+            ), removed AS (
+                DELETE FROM efund_fund_instrument_last_price
+                 WHERE instrument_id = ANY(%(ids)s)
+                   AND instrument_id NOT IN (SELECT instrument_id FROM latest)
+             RETURNING instrument_id
+            ), upserted AS (
+                INSERT INTO efund_fund_instrument_last_price
+                       (instrument_id, price_id, date, price, currency_id, create_uid, create_date, write_uid, write_date)
+                SELECT instrument_id, id, date, price, currency_id,
+                       %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+                  FROM latest
+                    ON CONFLICT (instrument_id) DO UPDATE
+                   SET price_id = EXCLUDED.price_id, date = EXCLUDED.date, price = EXCLUDED.price,
+                       currency_id = EXCLUDED.currency_id, write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                 WHERE (efund_fund_instrument_last_price.price_id, efund_fund_instrument_last_price.date,
+                        efund_fund_instrument_last_price.price, efund_fund_instrument_last_price.currency_id)
+                       IS DISTINCT FROM (EXCLUDED.price_id, EXCLUDED.date, EXCLUDED.price, EXCLUDED.currency_id)
+             RETURNING instrument_id
+            )
+            SELECT instrument_id FROM removed
+             UNION
+            SELECT instrument_id FROM upserted
+            """,
+            ids=instrument_ids,
+            uid=self.env.uid,
+        ))
+        changed = [instrument_id for instrument_id, in self.env.cr.fetchall()]
+        # Une correction d'un cours historique ne change pas l'index mais les cours à date
+        self._invalidate_price_cache()
+        self.invalidate_model()
+        self.env['efund.fund.instrument'].invalidate_model(['last_price_ids', 'last_validated_price', 'last_price_date'])
+        self._reprice_positions(changed)
+        return changed
+
+    @api.model
+    def _reprice_positions(self, instrument_ids):
+        """Réévalue en une mise à jour groupée les positions des instruments donnés.
+
+        Reprend en SQL les champs calculés de efund.fund.position qui dépendent du
+        dernier cours : last_price, valeur de marché, plus-value latente et sa décoration.
+        """
+        if not instrument_ids:
+            return
+        Position = self.env['efund.fund.position']
+        Position.flush_model(['instrument_id', 'quantity', 'avg_cost'])
+        self.env.cr.execute(SQL(
+            """
+            UPDATE efund_fund_position pos
+               SET last_price = v.price,
+                   last_price_date = v.date,
+                   market_value = v.market_value,
+                   unrealized_pl = CASE WHEN v.cost != 0 THEN v.market_value - v.cost ELSE 0 END,
+                   unrealized_pl_percent = CASE WHEN v.cost != 0 THEN (v.market_value - v.cost) / v.cost * 100
+                                                ELSE 0 END,
+                   decoration_state = CASE WHEN v.cost != 0 AND v.market_value > v.cost THEN 'success'
+                                           WHEN v.cost != 0 AND v.market_value < v.cost THEN 'danger'
+                                           ELSE 'normal' END
+              FROM (
+                    SELECT p.id, COALESCE(lp.price, 0) AS price, lp.date,
+                           COALESCE(p.quantity, 0) * COALESCE(lp.price, 0) AS market_value,
+                           COALESCE(p.quantity, 0) * COALESCE(p.avg_cost, 0) AS cost
+                      FROM efund_fund_position p
+                      LEFT JOIN efund_fund_instrument_last_price lp ON lp.instrument_id = p.instrument_id
+                     WHERE p.instrument_id = ANY(%s)
+                   ) v
+             WHERE pos.id = v.id
+            """,
+            list(instrument_ids),
+        ))
+        _logger.info("Positions réévaluées pour %s instrument(s) : %s ligne(s)", len(instrument_ids),
+                     self.env.cr.rowcount)
+        Position.invalidate_model(['last_price', 'last_price_date', 'market_value', 'unrealized_pl',
+                                   'unrealized_pl_percent', 'decoration_state'])
+
+    def action_rebuild(self):
+        """Reconstruit tout l'index (après une reprise de données par SQL, par exemple)."""
+        instruments = self.env['efund.fund.instrument'].with_context(active_test=False).search([])
+        self._refresh(instruments.ids)
+        _logger.info("Index des derniers cours reconstruit pour %s instruments", len(instruments))
+        return True
+
+    # -------------------------
+    # CACHE DES COURS
+    # -------------------------
+    @api.model
+    def _get_cache(self):
+        """Cache des cours de la base, vidé si un autre worker a signalé une modification.
+
+        :return: (cache, séquence lue en début de transaction, ou None si les entrées ne
+                 peuvent être ni lues ni complétées dans cette transaction)
+        """
+        max_size = int(self.env['ir.config_parameter'].sudo().get_param('efundOpc.price_cache_size', 100000))
+        cache = _get_price_cache(self.env.cr.dbname, max_size)
+        data = self.env.cr.precommit.data
+        usable = data.get('efund.price.cache.usable')
+        if usable is None:
+            # Une vérification de la séquence par transaction
+            self.env.cr.execute(SQL("SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM %s",
+                                    SQL.identifier(CACHE_SIGNALING_SEQUENCE)))
+            sequence = self.env.cr.fetchone()[0]
+            usable = cache.sequence == sequence
+            if not usable:
+                # L'instantané de cette transaction peut précéder la modification signalée :
+                # le cache est vidé mais ne sera complété que par les transactions suivantes
+                cache.clear(sequence)
+            data['efund.price.cache.usable'] = usable
+            data['efund.price.cache.sequence'] = sequence
+        return cache, data['efund.price.cache.sequence'] if usable else None
+
+    @api.model
+    def _invalidate_price_cache(self):
+        """Invalide les caches de tous les workers au commit de la transaction en cours.
+
+        Jusqu'au commit, la transaction ne lit plus le cache (elle voit des cours que les
+        autres ne voient pas) ; après le commit, la séquence de signalisation est avancée
+        et le cache local vidé. En cas de rollback, rien n'est signalé.
+        """
+        cr = self.env.cr
+        if cr.precommit.data.get('efund.price.cache.dirty'):
+            return
+        cr.precommit.data['efund.price.cache.usable'] = False
+        cr.precommit.data['efund.price.cache.dirty'] = True
+        dbname, registry = cr.dbname, self.env.registry
+
+        @cr.postcommit.add
+        def signal_price_change():
+            with registry.cursor() as signal_cr:
+                signal_cr.execute(SQL("SELECT nextval(%s)", CACHE_SIGNALING_SEQUENCE))
+                sequence = signal_cr.fetchone()[0]
+            _get_price_cache(dbname).clear(sequence)
+
+    @api.model
+    def _cached_prices(self, instrument_ids, at_date, read):
+        """Cours des instruments donnés par (instrument, date), via le cache du worker.
+
+        :param read: fonction(ids absents) -> {instrument_id: (cours, date)} lisant la base
+        """
+        instrument_ids = [instrument_id for instrument_id in set(instrument_ids) if instrument_id]
+        if not instrument_ids:
+            return {}
+        cache, sequence = self._get_cache()
+        if sequence is None:
+            return read(instrument_ids)
+        found, missing = cache.get_many([(instrument_id, at_date) for instrument_id in instrument_ids])
+        result = {instrument_id: values for (instrument_id, __), values in found.items() if values}
+        if missing:
+            prices = read([instrument_id for instrument_id, __ in missing])
+            # Un autre thread du processus a pu vider le cache depuis la lecture de la séquence
+            cache.set_many({key: prices.get(key[0]) for key in missing}, sequence)
+            result.update(prices)
+        return result
+
+    @api.model
+    def _get_cache_stats(self):
+        """Compteurs du cache des cours de ce worker (à agréger entre workers pour le réglage)."""
+        cache, __ = self._get_cache()
+        return cache.stats()
+
+    @api.model
+    def action_show_cache_stats(self):
+        stats = self._get_cache_stats()
+        _logger.info("Cache des cours : %s", stats)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Cache des cours (worker courant)'),
+                'message': _("%(hits)s succès, %(misses)s défauts (%(hit_ratio)s %%), %(size)s/%(max_size)s entrées, "
+                             "%(invalidations)s invalidations.", **stats),
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+
+    # -------------------------
+    # LECTURE
+    # -------------------------
+    @api.model
+    def _get_latest(self, instrument_ids):
+        """:return: {instrument_id: (cours, date)} des derniers cours validés (cache, sinon une requête)."""
+        return self._cached_prices(instrument_ids, None, self._read_latest)
+
+    @api.model
+    def _read_latest(self, instrument_ids):
+        self.flush_model(['instrument_id', 'date', 'price'])
+        self.env.cr.execute(SQL(
+            "SELECT instrument_id, price, date FROM efund_fund_instrument_last_price WHERE instrument_id = ANY(%s)",
+            instrument_ids,
+        ))
+        return {instrument_id: (price, price_date) for instrument_id, price, price_date in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_prices_at(self, instrument_ids, at_date):
+        """Dernier cours validé à ``at_date`` de chaque instrument : {instrument_id: (cours, date)}.
+
+        Servi par le cache lorsque possible ; sinon l'index répond seul lorsque son cours
+        est antérieur à la date (cas courant de la valorisation du jour) et les autres
+        instruments sont lus dans l'historique des cours.
+        """
+        return self._cached_prices(instrument_ids, at_date, lambda ids: self._read_prices_at(ids, at_date))
+
+    @api.model
+    def _read_prices_at(self, instrument_ids, at_date):
+        result = {instrument_id: values for instrument_id, values in self._get_latest(instrument_ids).items()
+                  if values[1] <= at_date}
+        remaining = [instrument_id for instrument_id in instrument_ids if instrument_id not in result]
+        if remaining:
+            self.env['efund.fund.instrument.price'].flush_model(['instrument_id', 'date', 'price', 'is_validated'])
+            self.env.cr.execute(SQL(
+                """
+                SELECT DISTINCT ON (instrument_id) instrument_id, price, date
+                  FROM efund_fund_instrument_price
+                 WHERE is_validated AND instrument_id = ANY(%s) AND date <= %s
+                 ORDER BY instrument_id, date DESC, id DESC
+                """,
+                remaining, at_date,
+            ))
+            result.update({instrument_id: (price, price_date)
+                           for instrument_id, price, price_date in self.env.cr.fetchall()})
+        return result
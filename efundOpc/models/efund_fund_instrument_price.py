@@ -1,7 +1,26 @@
 # efund_fund_instrument_price.py
+import logging
+import math
+from array import array
+from bisect import bisect_left
+from datetime import datetime, date, timedelta
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-from datetime import datetime, date
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+# Paramètres du contrôle de vraisemblance (ir.config_parameter) et valeurs par défaut
+SCREENING_PARAMS = {
+    'max_jump_pct': ('efundOpc.price_max_jump_pct', 15.0),
+    'zscore_limit': ('efundOpc.price_zscore_limit', 4.0),
+    'stale_count': ('efundOpc.price_stale_count', 5),
+    'history_days': ('efundOpc.price_history_days', 90),
+}
+
+# Nombre minimal de rendements historiques pour calculer un z-score
+MIN_ZSCORE_RETURNS = 10
 
 
 class FundInstrumentPrice(models.Model):
@@ -12,62 +31,313 @@ class FundInstrumentPrice(models.Model):
 
     instrument_id = fields.Many2one('efund.fund.instrument', string="Instrument", required=True, index=True)
     date = fields.Date(string="Date du cours", required=True, default=fields.Date.today, index=True)
-    price = fields.Float(string="Cours", digits=(16, 4), required=True)
+    price = fields.Float(string="Cours", digits=(16, 4), required=True, help="Cours de clôture.")
+    open_price = fields.Float(string="Ouverture", digits=(16, 4))
+    high_price = fields.Float(string="Plus haut", digits=(16, 4))
+    low_price = fields.Float(string="Plus bas", digits=(16, 4))
+    volume = fields.Float(string="Volume", digits=(16, 0))
     currency_id = fields.Many2one('res.currency', string="Devise du cours", required=True)
     is_validated = fields.Boolean(string="Validé", default=False)
     validated_date = fields.Date(string="Date de validation")
     validated_by = fields.Many2one('res.users', string="Validé par")
 
+    # Contrôle de vraisemblance avant validation
+    screening_state = fields.Selection([
+        ('pending', 'À contrôler'),
+        ('clean', 'Conforme'),
+        ('review', 'À revoir'),
+        ('accepted', 'Accepté après revue'),
+        ('rejected', 'Rejeté'),
+    ], string="Contrôle", default='pending', index=True, copy=False)
+    screening_flags = fields.Char(string="Anomalies", readonly=True, copy=False)
+    screening_note = fields.Text(string="Détail du contrôle", readonly=True, copy=False)
+
     # Champs calculés
     display_name = fields.Char(string="Nom", compute='_compute_display_name', store=True)
 
+    # Recherche du dernier cours à date (valorisation, VL)
+    _instrument_date_idx = models.Index("(instrument_id, date DESC, id DESC)")
+
+    # Clé des imports en masse (upsert)
+    _instrument_date_uniq = models.Constraint(
+        'unique(instrument_id, date)',
+        'Un seul cours par instrument et par date'
+    )
+
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        prices = super().create(vals_list)
+        prices._mark_navs_dirty()
+        self.env['efund.fund.instrument.last.price']._refresh(prices.filtered('is_validated').instrument_id.ids)
+        return prices
+
+    def write(self, vals):
+        if {'instrument_id', 'date', 'price'} & set(vals) and 'screening_state' not in vals:
+            # Un cours corrigé doit être contrôlé à nouveau
+            vals = dict(vals, screening_state='pending', screening_flags=False, screening_note=False)
+        tracked = {'instrument_id', 'date', 'price', 'currency_id', 'is_validated'} & set(vals)
+        if tracked:
+            self._mark_navs_dirty()
+            instrument_ids = self.filtered('is_validated').instrument_id.ids
+        res = super().write(vals)
+        if tracked:
+            self._mark_navs_dirty()
+            self.env['efund.fund.instrument.last.price']._refresh(
+                instrument_ids + self.filtered('is_validated').instrument_id.ids)
+        return res
+
+    def unlink(self):
+        self._mark_navs_dirty()
+        instrument_ids = self.filtered('is_validated').instrument_id.ids
+        res = super().unlink()
+        self.env['efund.fund.instrument.last.price']._refresh(instrument_ids)
+        return res
+
+    @api.model
+    def _upsert_prices(self, vals_list):
+        """Crée ou met à jour des cours en une requête, sur la clé (instrument, date).
+
+        Les cours déjà validés ne sont jamais modifiés par un import. ``vals_list`` contient
+        instrument_id, date, price, currency_id et display_name, et éventuellement open_price,
+        high_price, low_price et volume ; une même clé ne doit apparaître qu'une fois.
+
+        :return: (ids créés, ids mis à jour, clés (instrument_id, date) ignorées car validées)
+        """
+        if not vals_list:
+            return [], [], []
+        self.flush_model()
+        now = fields.Datetime.now()
+        rows = SQL(", ").join(
+            SQL("(%s, %s, %s, %s, %s, %s, %s, %s, %s, FALSE, 'pending', %s, %s, %s, %s)",
+                vals['instrument_id'], vals['date'], vals['price'], vals.get('open_price'), vals.get('high_price'),
+                vals.get('low_price'), vals.get('volume'), vals['currency_id'], vals['display_name'],
+                self.env.uid, now, self.env.uid, now)
+            for vals in vals_list
+        )
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO efund_fund_instrument_price
+                   (instrument_id, date, price, open_price, high_price, low_price, volume, currency_id,
+                    display_name, is_validated, screening_state,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (instrument_id, date) DO UPDATE
+               SET price = EXCLUDED.price,
+                   open_price = EXCLUDED.open_price,
+                   high_price = EXCLUDED.high_price,
+                   low_price = EXCLUDED.low_price,
+                   volume = EXCLUDED.volume,
+                   currency_id = EXCLUDED.currency_id,
+                   display_name = EXCLUDED.display_name,
+                   screening_state = 'pending',
+                   screening_flags = NULL,
+                   screening_note = NULL,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+             WHERE NOT efund_fund_instrument_price.is_validated
+            RETURNING id, instrument_id, date, xmax = 0
+            """,
+            rows,
+        ))
+        created, updated, written = [], [], set()
+        for price_id, instrument_id, price_date, inserted in self.env.cr.fetchall():
+            (created if inserted else updated).append(price_id)
+            written.add((instrument_id, price_date))
+        self.invalidate_model()
+        skipped = [(vals['instrument_id'], vals['date']) for vals in vals_list
+                   if (vals['instrument_id'], vals['date']) not in written]
+        return created, updated, skipped
+
+    def _mark_navs_dirty(self):
+        """Marque les VL des fonds détenant ces instruments à partir de la date des cours validés."""
+        validated = self.filtered('is_validated')
+        for price_date, prices in validated.grouped('date').items():
+            self.env['efund.fund.nav.dirty']._mark_instruments(prices.instrument_id.ids, price_date)
 
     @api.depends('instrument_id', 'date', 'price')
     def _compute_display_name(self):
         for rec in self:
             rec.display_name = f"{rec.instrument_id.name} - {rec.date} - {rec.price:.4f}"
 
-    def action_validate(self):
-        """Valider un cours et mettre à jour les positions"""
-        for price in self:
-            if not price.is_validated:
-                price.is_validated = True
-                price.validated_date = fields.Date.today()
-                price.validated_by = self.env.user
-
-                # Mettre à jour les positions des fonds
-                self._update_fund_positions(price)
-
-    def _update_fund_positions(self, price):
-        """Mettre à jour le market_value des positions basé sur le nouveau cours"""
-        # Récupérer toutes les positions pour cet instrument
-        positions = self.env['efund.fund.position'].search([
-            ('instrument_id', '=', price.instrument_id.id),
-        ])
-
-        # Mettre à jour le dernier cours dans l'instrument
-        price.instrument_id.write({
-            'last_validated_price': price.price,
-            'last_price_date': price.date,
+    def _validate(self):
+        """Valider des cours en une écriture : l'index des derniers cours des instruments
+        concernés est mis à jour ensemble et leurs positions réévaluées en bloc.
+
+        Sans contrôle de vraisemblance : réservé aux cours conformes ou acceptés en revue.
+        """
+        to_validate = self.filtered(lambda p: not p.is_validated)
+        to_validate.write({
+            'is_validated': True,
+            'validated_date': fields.Date.today(),
+            'validated_by': self.env.user.id,
         })
+        return to_validate
 
-        # Recalculer la valeur de marché pour toutes les positions
-        for position in positions:
-            position._compute_market_value()
+    def action_validate(self):
+        """Valider des cours après contrôle de vraisemblance"""
+        return self.action_validate_batch()
 
     def action_validate_batch(self):
-        """Valider plusieurs cours en une fois"""
-        unvalidated = self.filtered(lambda p: not p.is_validated)
-        for price in unvalidated:
-            price.action_validate()
+        """Valider plusieurs cours en une fois, après contrôle de vraisemblance.
+
+        Les cours déjà acceptés en revue sont validés tels quels, les cours rejetés ignorés.
+        """
+        to_validate = self.filtered(lambda p: not p.is_validated and p.screening_state != 'rejected')
+        accepted = to_validate.filtered(lambda p: p.screening_state == 'accepted')
+        clean, flagged = (to_validate - accepted)._screen()
+        validated = (clean | accepted)._validate()
 
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': _('Validation terminée'),
-                'message': _('%s cours ont été validés.') % len(unvalidated),
-                'type': 'success',
-                'sticky': False,
+                'message': _('%(validated)s cours ont été validés, %(flagged)s placés en revue.',
+                             validated=len(validated), flagged=len(flagged)),
+                'type': 'warning' if flagged else 'success',
+                'sticky': bool(flagged),
             }
-        }
\ No newline at end of file
+        }
+
+    # -------------------------
+    # CONTRÔLE DE VRAISEMBLANCE
+    # -------------------------
+    @api.model
+    def _get_screening_params(self):
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        return {key: type(default)(get_param(name, default)) for key, (name, default) in SCREENING_PARAMS.items()}
+
+    def _load_price_series(self, history_days):
+        """Série de cours de chaque instrument du lot, en une requête.
+
+        La série réunit l'historique récent des cours validés et les cours du lot
+        lui-même : un cours est comparé au cours de la veille, même si celui-ci fait
+        partie du même import et n'est pas encore validé.
+
+        :return: {instrument_id: (dates ordinales, cours)} triés par date
+        """
+        start = min(self.mapped('date')) - timedelta(days=history_days)
+        self.flush_model(['instrument_id', 'date', 'price', 'is_validated'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT instrument_id, date, price
+              FROM efund_fund_instrument_price
+             WHERE (is_validated OR id = ANY(%s)) AND instrument_id = ANY(%s) AND date >= %s AND date <= %s
+             ORDER BY instrument_id, date, id
+            """,
+            self.ids, list(set(self.instrument_id.ids)), start, max(self.mapped('date')),
+        ))
+        series = {}
+        for instrument_id, price_date, price in self.env.cr.fetchall():
+            dates, values = series.setdefault(instrument_id, (array('l'), array('d')))
+            if dates and dates[-1] == price_date.toordinal():
+                values[-1] = price
+                continue
+            dates.append(price_date.toordinal())
+            values.append(price)
+        return series
+
+    @api.model
+    def _get_series_statistics(self, values):
+        """Cumuls d'une série de cours, calculés en un seul passage.
+
+        Pour chaque rang k : nombre, somme et somme des carrés des rendements jusqu'au
+        cours k, et longueur du palier de cours identiques qui s'achève en k.
+
+        :return: (nombres, sommes, sommes des carrés, paliers)
+        """
+        counts, sums, squares, runs = array('l'), array('d'), array('d'), array('l')
+        count, total, square, run = 0, 0.0, 0.0, 0
+        previous = None
+        for value in values:
+            if previous is not None and previous > 0:
+                ret = value / previous - 1
+                count, total, square = count + 1, total + ret, square + ret * ret
+            run = run + 1 if value == previous else 1
+            counts.append(count)
+            sums.append(total)
+            squares.append(square)
+            runs.append(run)
+            previous = value
+        return counts, sums, squares, runs
+
+    @api.model
+    def _check_price(self, price, index, values, statistics, params):
+        """Anomalies du cours de rang ``index`` de la série au regard des cours qui le précèdent.
+
+        :param statistics: cumuls de la série (voir ``_get_series_statistics``)
+        :return: liste de (code, message)
+        """
+        anomalies = []
+        if price <= 0:
+            return [('non_positive', _("Cours nul ou négatif."))]
+        if not index:
+            return anomalies
+        counts, sums, squares, runs = statistics
+        previous = values[index - 1]
+        if previous > 0:
+            change = price / previous - 1
+            if abs(change) * 100 > params['max_jump_pct']:
+                anomalies.append(('jump', _("Variation de %(change).1f %% depuis le cours précédent (seuil %(limit)s %%).",
+                                            change=change * 100, limit=params['max_jump_pct'])))
+            count = counts[index - 1]
+            if count >= MIN_ZSCORE_RETURNS:
+                mean = sums[index - 1] / count
+                std = math.sqrt(max(squares[index - 1] - count * mean * mean, 0.0) / (count - 1))
+                if std and abs(change - mean) / std > params['zscore_limit']:
+                    anomalies.append(('outlier', _("Rendement atypique : z-score de %(zscore).1f (seuil %(limit)s).",
+                                                   zscore=(change - mean) / std, limit=params['zscore_limit'])))
+        stale_count = params['stale_count']
+        if stale_count > 1 and previous == price and runs[index - 1] >= stale_count - 1:
+            anomalies.append(('stale', _("Cours inchangé sur %s cotations.") % stale_count))
+        return anomalies
+
+    def _screen(self):
+        """Contrôle de vraisemblance des cours (self) sur leurs séries chargées en tableaux.
+
+        Détecte cours nuls ou négatifs, variations au-delà du seuil, rendements atypiques
+        (z-score) et cours figés. Rendements, moyennes et écarts-types sont cumulés une fois
+        par instrument ; chaque cours est ensuite contrôlé en temps constant. Les cours
+        conformes sont marqués « Conforme », les autres placés dans la file de revue.
+
+        :return: (cours conformes, cours à revoir)
+        """
+        prices = self.filtered(lambda p: p.screening_state not in ('accepted', 'rejected'))
+        if not prices:
+            return self.browse(), self.browse()
+        params = self._get_screening_params()
+        series = prices._load_price_series(params['history_days'])
+        statistics = {instrument_id: self._get_series_statistics(values)
+                      for instrument_id, (__, values) in series.items()}
+        clean, flagged = self.browse(), self.browse()
+        for price in prices:
+            dates, values = series[price.instrument_id.id]
+            # Rang du cours dans sa série : les cours antérieurs forment son historique
+            index = bisect_left(dates, price.date.toordinal())
+            anomalies = self._check_price(price.price, index, values, statistics[price.instrument_id.id], params)
+            if anomalies:
+                flagged |= price
+                price.write({
+                    'screening_state': 'review',
+                    'screening_flags': ', '.join(code for code, __ in anomalies),
+                    'screening_note': '\n'.join(message for __, message in anomalies),
+                })
+            else:
+                clean |= price
+        clean.write({'screening_state': 'clean', 'screening_flags': False, 'screening_note': False})
+        _logger.info("Contrôle de %s cours : %s conformes, %s à revoir", len(prices), len(clean), len(flagged))
+        return clean, flagged
+
+    def action_accept_review(self):
+        """Accepter des cours signalés après vérification, et les valider"""
+        self.write({'screening_state': 'accepted'})
+        self._validate()
+        return True
+
+    def action_reject_review(self):
+        """Rejeter des cours signalés : ils ne seront pas validés"""
+        if any(price.is_validated for price in self):
+            raise UserError(_("Un cours déjà validé ne peut pas être rejeté."))
+        self.write({'screening_state': 'rejected'})
+        return True
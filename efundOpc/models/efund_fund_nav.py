@@ -1,5 +1,10 @@
+import logging
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
 
 
 class FundNAV(models.Model):
@@ -18,57 +23,258 @@ class FundNAV(models.Model):
     accounting_move_id = fields.Many2one('account.move')
     is_initial_valuation = fields.Boolean(default=True)
     total_shares = fields.Float(string="Total shares")
+    total_assets = fields.Float(string="Actifs valorisés")
+    accrued_fees = fields.Float(string="Frais courus")
+    position_count = fields.Integer(string="Lignes valorisées")
+    management_fee_accrual = fields.Float(string="Frais de gestion de la classe")
+    performance_fee_accrual = fields.Float(string="Commission de performance de la classe")
+    missing_price_count = fields.Integer(string="Lignes sans cours",
+                                         help="Positions sans cours validé à la date, valorisées à zéro.")
 
 
-    def compute_nav(self):
-        # Simplified placeholder: aggregate market_value from positions
-        positions = self.env['fund.position'].search([('fund_id','=',self.fund_id.id),('valuation_date','=',self.date)])
-        total = sum(positions.mapped('market_value') or [0.0])
-        self.nav_total = total
-        if self.class_id and self.class_id.shares_outstanding:
-            self.nav_per_share = total / self.class_id.shares_outstanding
-        else:
-            self.nav_per_share = 0.0
-        self.status = 'computed'
-        self.computed_by = self.env.user
-        self.computed_at = fields.Datetime.now()
+    @api.model_create_multi
+    def create(self, vals_list):
+        navs = super().create(vals_list)
+        self.env['efund.fund.nav.series']._add_navs(navs)
+        return navs
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.get('status') == 'posted' or ('nav_per_share' in vals and any(n.status == 'posted' for n in self)):
+            self.env['efund.fund.nav.series']._add_navs(self)
+        return res
+
+    def action_post(self):
+        """Publie les VL calculées : elles alimentent l'historique et les indicateurs de performance."""
+        if any(nav.status != 'computed' for nav in self):
+            raise UserError(_("Seules les VL calculées peuvent être publiées."))
+        self.write({'status': 'posted'})
+        return True
 
+    # -------------------------
+    # MOTEUR DE VL
+    # -------------------------
     @api.model
-    def compute_nav_batch(self):
-        funds = self.env['res.company'].search([('company_type','=','fonds')])
-        for fund in funds:
-            nav = self.create({'fund_id': fund.id, 'date': fields.Date.today()})
-            try:
-                nav.compute_nav()
-            except Exception as e:
-                pass
+    def _position_lines_query(self, nav_date, fund_ids):
+        """Requête (fund_id, instrument_id, quantity, price) des lignes de portefeuille à ``nav_date``.
 
-    def calculate_nav(self):
-        """Calcule la NAV pour une classe de parts"""
-        self.ensure_one()
+        Pour chaque (fonds, instrument) on retient la dernière position connue à la date,
+        avec le dernier cours validé à la date (NULL si aucun).
+        """
+        self.env['efund.fund.position'].flush_model(['fund_id', 'instrument_id', 'quantity', 'valuation_date', 'state'])
+        self.env['efund.fund.instrument.price'].flush_model(['instrument_id', 'date', 'price', 'is_validated'])
+        self.env['efund.fund.instrument.last.price'].flush_model(['instrument_id', 'date', 'price'])
+        return SQL(
+            """
+            WITH positions AS (
+                SELECT DISTINCT ON (pos.fund_id, pos.instrument_id)
+                       pos.fund_id, pos.instrument_id, pos.quantity, pos.state
+                  FROM efund_fund_position pos
+                 WHERE pos.fund_id = ANY(%(fund_ids)s) AND pos.valuation_date <= %(nav_date)s
+                 ORDER BY pos.fund_id, pos.instrument_id, pos.valuation_date DESC, pos.id DESC
+            ), indexed AS (
+                -- Index des derniers cours : suffit dès que le dernier cours précède la date
+                SELECT lp.instrument_id, lp.price
+                  FROM efund_fund_instrument_last_price lp
+                 WHERE lp.date <= %(nav_date)s
+                   AND lp.instrument_id IN (SELECT instrument_id FROM positions)
+            ), prices AS (
+                SELECT instrument_id, price FROM indexed
+                 UNION ALL
+               (SELECT DISTINCT ON (price.instrument_id) price.instrument_id, price.price
+                  FROM efund_fund_instrument_price price
+                 WHERE price.is_validated AND price.date <= %(nav_date)s
+                   AND price.instrument_id IN (SELECT instrument_id FROM positions)
+                   AND price.instrument_id NOT IN (SELECT instrument_id FROM indexed)
+                 ORDER BY price.instrument_id, price.date DESC, price.id DESC)
+            )
+            SELECT positions.fund_id, positions.instrument_id, positions.quantity, prices.price
+              FROM positions
+              LEFT JOIN prices ON prices.instrument_id = positions.instrument_id
+             WHERE positions.state != 'closed' AND positions.quantity != 0
+            """,
+            fund_ids=list(fund_ids),
+            nav_date=nav_date,
+        )
 
-        # 1. Valorisation des actifs
-        positions = self.env['fund.position'].search([
-            ('fund_id', '=', self.fund_id.id)
-        ])
-        total_assets = sum(pos.market_value for pos in positions)
+    @api.model
+    def _query_position_lines(self, nav_date, fund_ids):
+        """:return: [(fund_id, instrument_id, quantité, cours ou None)] des portefeuilles à ``nav_date``."""
+        self.env.cr.execute(self._position_lines_query(nav_date, fund_ids))
+        return self.env.cr.fetchall()
 
-        # 2. Calcul des passifs
-        fees_payable = self._calculate_accrued_fees()
-        other_liabilities = self._calculate_other_liabilities()
-        total_liabilities = fees_payable + other_liabilities
+    @api.model
+    def _get_position_lines(self, nav_date, fund_ids):
+        """Lignes de portefeuille valorisées à ``nav_date``, communes à la VL et aux valorisations.
+
+        :return: [(fund_id, instrument_id, quantité, cours ou None, coupon couru de la ligne)]
+        """
+        lines = self._query_position_lines(nav_date, fund_ids)
+        accrued = self.env['efund.fund.instrument'].browse(
+            {instrument_id for __, instrument_id, __, __ in lines})._get_accrued_coupons(nav_date)
+        return [(fund_id, instrument_id, quantity, price, quantity * accrued[instrument_id])
+                for fund_id, instrument_id, quantity, price in lines]
+
+    @api.model
+    def _query_position_values(self, nav_date, fund_ids):
+        """Valeur des portefeuilles à ``nav_date`` : cours et coupons courus, cumulés par fonds.
+
+        Les lignes viennent de ``_get_position_lines`` (une requête pour les positions et
+        les cours, une lecture des instruments pour les coupons courus).
 
-        # 3. Nombre de parts
-        total_shares = self._calculate_outstanding_shares()
+        :return: {fund_id: (valeur de marché, lignes valorisées, lignes sans cours)}
+        """
+        result = {}
+        for fund_id, __, quantity, price, accrued_interest in self._get_position_lines(nav_date, fund_ids):
+            value, count, missing = result.get(fund_id, (0.0, 0, 0))
+            result[fund_id] = (value + quantity * (price or 0.0) + accrued_interest, count + 1,
+                               missing + (price is None))
+        return result
 
-        # 4. Calcul final
-        net_assets = total_assets - total_liabilities
-        nav_per_share = net_assets / total_shares if total_shares > 0 else 0
+    @api.model
+    def _outstanding_fees_query(self, nav_date):
+        """Requête des frais restant dus à ``nav_date`` (fund_id, share_class_id, fee_type, amount).
+
+        Passif cumulé des lignes de frais des valorisations non annulées, depuis le dernier
+        paiement des frais du fonds (ou, pour la commission de performance, depuis la
+        dernière cristallisation de la classe) jusqu'à ``nav_date`` incluse.
+        """
+        self.env['efund.fund.valuation.fee'].flush_model(['valuation_id', 'share_class_id', 'fee_type', 'amount'])
+        self.env['efund.fund.valuation'].flush_model(['fund_id', 'valuation_date', 'state'])
+        self.env['efund.fund'].flush_model(['fee_payment_date'])
+        self.env['efund.fund.class'].flush_model(['crystallisation_date'])
+        return SQL(
+            """
+            SELECT val.fund_id, fee.share_class_id, fee.fee_type, fee.amount
+              FROM efund_fund_valuation_fee fee
+              JOIN efund_fund_valuation val ON val.id = fee.valuation_id
+              JOIN efund_fund fund ON fund.id = val.fund_id
+              LEFT JOIN efund_fund_class cls ON cls.id = fee.share_class_id
+             WHERE val.valuation_date <= %(nav_date)s AND val.state != 'cancelled'
+               AND val.valuation_date > COALESCE(
+                       CASE WHEN fee.fee_type = 'performance' THEN cls.crystallisation_date END,
+                       fund.fee_payment_date, '-infinity'::date)
+            """,
+            nav_date=nav_date,
+        )
+
+    @api.model
+    def _query_accrued_fees(self, nav_date, fund_ids):
+        """Frais courus restant dus par les fonds à ``nav_date`` (voir :meth:`_outstanding_fees_query`).
 
+        :return: {fund_id: montant}
+        """
+        self.env.cr.execute(SQL(
+            """
+            SELECT fees.fund_id, SUM(fees.amount)
+              FROM (%s) fees
+             WHERE fees.fund_id = ANY(%s)
+             GROUP BY fees.fund_id
+            """,
+            self._outstanding_fees_query(nav_date), list(fund_ids),
+        ))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _query_class_fees(self, nav_date, class_ids):
+        """Frais courus propres à chaque classe de parts restant dus à ``nav_date``, par type.
+
+        :return: {class_id: {fee_type: montant}}
+        """
+        if not class_ids:
+            return {}
+        self.env.cr.execute(SQL(
+            """
+            SELECT fees.share_class_id, fees.fee_type, SUM(fees.amount)
+              FROM (%s) fees
+             WHERE fees.share_class_id = ANY(%s)
+             GROUP BY fees.share_class_id, fees.fee_type
+            """,
+            self._outstanding_fees_query(nav_date), list(class_ids),
+        ))
+        result = {}
+        for class_id, fee_type, amount in self.env.cr.fetchall():
+            result.setdefault(class_id, {})[fee_type] = amount
+        return result
+
+    @api.model
+    def _compute_nav_values(self, nav_date, funds):
+        """Actif net et VL de plusieurs fonds à une date.
+
+        Chaque composante (portefeuille, frais courus, parts en circulation) provient
+        d'une requête groupée unique, quel que soit le nombre de fonds ou de lignes.
+
+        :return: {fund_id: valeurs de efund.fund.nav}
+        """
+        fund_ids = funds.ids
+        assets = self._query_position_values(nav_date, fund_ids)
+        fees = self._query_accrued_fees(nav_date, fund_ids)
+        units = self.env['efund.account.part']._query_units_by_fund(nav_date, fund_ids)
+        result = {}
+        for fund_id in fund_ids:
+            market_value, position_count, missing_count = assets.get(fund_id, (0.0, 0, 0))
+            accrued_fees = fees.get(fund_id, 0.0)
+            total_shares = units.get(fund_id, 0.0)
+            net_assets = market_value - accrued_fees
+            result[fund_id] = {
+                'total_assets': market_value,
+                'accrued_fees': accrued_fees,
+                'nav_total': net_assets,
+                'total_shares': total_shares,
+                'nav_per_share': net_assets / total_shares if total_shares > 0 else 0.0,
+                'position_count': position_count,
+                'missing_price_count': missing_count,
+            }
+        return result
+
+    def compute_nav(self):
+        """Calcule l'actif net et la VL de chaque enregistrement à sa date."""
+        if any(nav.status == 'posted' for nav in self):
+            raise UserError(_("Une VL publiée ne peut pas être recalculée."))
+        # Les VL de classe sont réparties à partir de l'actif net du fonds
+        for nav_date, navs in self.filtered('share_class_id').grouped('date').items():
+            self.env['efund.fund.class']._allocate_nav(nav_date, navs.fund_id)
+        now = fields.Datetime.now()
+        for nav_date, navs in self.filtered(lambda n: not n.share_class_id).grouped('date').items():
+            values = self._compute_nav_values(nav_date, navs.fund_id)
+            for nav in navs:
+                fund_values = values[nav.fund_id.id]
+                if fund_values['missing_price_count']:
+                    _logger.warning("VL %s au %s : %s ligne(s) sans cours validé",
+                                    nav.fund_id.name, nav_date, fund_values['missing_price_count'])
+                nav.write(dict(fund_values, status='computed', computed_by=self.env.uid, computed_at=now))
+
+    @api.model
+    def _compute_fund_nav(self, fund_id, nav_date):
+        """Calcule (en la créant au besoin) la VL d'un fonds et de ses classes à une date."""
+        nav = self.search([
+            ('fund_id', '=', fund_id),
+            ('date', '=', nav_date),
+            ('share_class_id', '=', False),
+        ], limit=1)
+        if nav.status == 'posted':
+            return nav
+        if not nav:
+            nav = self.create({'fund_id': fund_id, 'date': nav_date, 'is_initial_valuation': False})
+        self.env['efund.fund.valuation']._accrue_daily_fees(nav_date, nav.fund_id)
+        nav.compute_nav()
+        if nav.fund_id.share_class_ids:
+            self.env['efund.fund.class']._allocate_nav(nav_date, nav.fund_id)
+        return nav
+
+    @api.model
+    def compute_nav_batch(self):
+        """Calcule la VL du jour de tous les fonds actifs (voir efund.fund.nav.run)."""
+        return self.env['efund.fund.nav.run']._run(fields.Date.context_today(self))
+
+    def calculate_nav(self):
+        """Calcule la NAV pour une classe de parts"""
+        self.ensure_one()
+        values = self._compute_nav_values(self.date, self.fund_id)[self.fund_id.id]
         return {
-            'total_net_assets': net_assets,
-            'nav_per_share': nav_per_share,
-            'total_shares': total_shares
+            'total_net_assets': values['nav_total'],
+            'nav_per_share': values['nav_per_share'],
+            'total_shares': values['total_shares'],
         }
 
     """
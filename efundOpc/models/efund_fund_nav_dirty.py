@@ -0,0 +1,109 @@
+import logging
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+
+class FundNavDirty(models.Model):
+    _name = 'efund.fund.nav.dirty'
+    _description = 'VL à recalculer'
+    _order = 'nav_date, fund_id'
+
+    fund_id = fields.Many2one('efund.fund', string="Fonds", required=True, index=True, ondelete='cascade')
+    nav_date = fields.Date(string="Date VL", required=True, index=True)
+
+    _fund_nav_date_uniq = models.Constraint(
+        'unique(fund_id, nav_date)',
+        'Une seule demande de recalcul par fonds et par date'
+    )
+
+    # -------------------------
+    # MARQUAGE
+    # -------------------------
+    @api.model
+    def _mark(self, fund_ids, from_date, to_date=None):
+        """Marque à recalculer les VL non publiées des fonds donnés, de ``from_date`` à ``to_date``.
+
+        Seules les dates pour lesquelles une VL (fonds ou classe) existe déjà sont retenues :
+        les VL futures seront de toute façon calculées sur les données à jour.
+        """
+        fund_ids = [fund_id for fund_id in set(fund_ids) if fund_id]
+        if not fund_ids or not from_date:
+            return
+        self.env['efund.fund.nav'].flush_model(['fund_id', 'date', 'status'])
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO efund_fund_nav_dirty (fund_id, nav_date, create_uid, create_date, write_uid, write_date)
+            SELECT DISTINCT nav.fund_id, nav.date, %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM efund_fund_nav nav
+             WHERE nav.fund_id = ANY(%(fund_ids)s)
+               AND nav.date >= %(from_date)s
+               AND %(to_filter)s
+               AND nav.status != 'posted'
+            ON CONFLICT (fund_id, nav_date) DO NOTHING
+            """,
+            uid=self.env.uid,
+            fund_ids=fund_ids,
+            from_date=fields.Date.to_date(from_date),
+            to_filter=SQL("nav.date <= %s", fields.Date.to_date(to_date)) if to_date else SQL("TRUE"),
+        ))
+        if self.env.cr.rowcount:
+            self.env.invalidate_model(['fund_id', 'nav_date'])
+
+    @api.model
+    def _mark_instruments(self, instrument_ids, from_date):
+        """Marque les VL des seuls fonds ayant une position sur ces instruments."""
+        if not instrument_ids:
+            return
+        groups = self.env['efund.fund.position'].sudo()._read_group(
+            [('instrument_id', 'in', list(instrument_ids))], ['fund_id'])
+        self._mark([fund.id for fund, in groups], from_date)
+
+    # -------------------------
+    # RECALCUL
+    # -------------------------
+    @api.model
+    def _cron_recompute_dirty_navs(self):
+        """Recalcule uniquement les VL marquées, date par date (les VL de classe s'appuient sur les précédentes).
+
+        Les marques sont réclamées d'emblée (DELETE ... RETURNING) dans la transaction du
+        recalcul : une erreur les restaure pour le passage suivant, et une modification
+        concurrente recrée sa marque une fois le recalcul validé au lieu de se perdre sur
+        une ligne en cours de suppression.
+
+        Les dates étant traitées dans l'ordre, une marque posée pendant le passage sur une
+        date réclamée est déjà couverte par son recalcul : elle est retirée en fin de passage.
+        """
+        self.flush_model()
+        self.env.cr.execute(SQL("DELETE FROM efund_fund_nav_dirty RETURNING fund_id, nav_date"))
+        claimed = self.env.cr.fetchall()
+        self.invalidate_model()
+        if not claimed:
+            return
+        fund_ids_by_date = {}
+        for fund_id, nav_date in claimed:
+            fund_ids_by_date.setdefault(nav_date, set()).add(fund_id)
+        Nav = self.env['efund.fund.nav']
+        for nav_date, fund_ids in sorted(fund_ids_by_date.items()):
+            navs = Nav.search([
+                ('fund_id', 'in', list(fund_ids)),
+                ('date', '=', nav_date),
+                ('status', '!=', 'posted'),
+            ])
+            # L'assiette des frais courus suit la valorisation : on les recalcule d'abord
+            self.env['efund.fund.valuation']._accrue_daily_fees(nav_date, navs.fund_id)
+            navs.compute_nav()
+            _logger.info("VL recalculées au %s : %s fonds, %s enregistrement(s)",
+                         nav_date, len(fund_ids), len(navs))
+        self.flush_model()
+        self.env.cr.execute(SQL(
+            """
+            DELETE FROM efund_fund_nav_dirty dirty
+             USING unnest(%s::int[], %s::date[]) AS done(fund_id, nav_date)
+             WHERE dirty.fund_id = done.fund_id AND dirty.nav_date = done.nav_date
+            """,
+            [fund_id for fund_id, __ in claimed], [nav_date for __, nav_date in claimed],
+        ))
+        self.invalidate_model()
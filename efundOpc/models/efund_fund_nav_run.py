@@ -0,0 +1,139 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+
+class FundNavRun(models.Model):
+    _name = 'efund.fund.nav.run'
+    _description = 'Calcul groupé des VL'
+    _inherit = ['mail.thread']
+    _order = 'started_at desc, id desc'
+
+    name = fields.Char(string="Référence", compute='_compute_name', store=True)
+    nav_date = fields.Date(string="Date VL", required=True, index=True)
+    state = fields.Selection([
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('partial', 'Terminé avec erreurs'),
+    ], string="Statut", default='running', required=True, tracking=True)
+    worker_count = fields.Integer(string="Workers", readonly=True)
+    started_at = fields.Datetime(string="Début", readonly=True)
+    ended_at = fields.Datetime(string="Fin", readonly=True)
+    duration = fields.Float(string="Durée totale (s)", digits=(16, 2), readonly=True)
+    slowest_duration = fields.Float(string="Fonds le plus lent (s)", digits=(16, 2), readonly=True)
+    line_ids = fields.One2many('efund.fund.nav.run.line', 'run_id', string="Fonds", readonly=True)
+    fund_count = fields.Integer(string="Fonds", compute='_compute_counts', store=True)
+    failed_count = fields.Integer(string="Échecs", compute='_compute_counts', store=True)
+
+    @api.depends('nav_date')
+    def _compute_name(self):
+        for run in self:
+            run.name = _("Calcul VL du %s") % run.nav_date if run.nav_date else _("Calcul VL")
+
+    @api.depends('line_ids.state')
+    def _compute_counts(self):
+        for run in self:
+            run.fund_count = len(run.line_ids)
+            run.failed_count = len(run.line_ids.filtered(lambda l: l.state == 'failed'))
+
+    # -------------------------
+    # EXÉCUTION
+    # -------------------------
+    @api.model
+    def _get_worker_count(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('efundOpc.nav_batch_workers', 4))
+
+    @api.model
+    def _run(self, nav_date, funds=None, max_retries=2):
+        """Calcule la VL de chaque fonds en parallèle et consigne le résultat dans un run.
+
+        Chaque fonds est traité par un worker disposant de son propre curseur : sa VL
+        est validée ou annulée indépendamment des autres. Les fonds en échec sont
+        ensuite relancés un par un, jusqu'à ``max_retries`` fois.
+        """
+        nav_date = fields.Date.to_date(nav_date)
+        if funds is None:
+            funds = self.env['efund.fund'].search([('state', '=', 'active')])
+        if not funds:
+            raise UserError(_("Aucun fonds actif à valoriser."))
+
+        workers = max(1, min(self._get_worker_count(), len(funds)))
+        run = self.create({
+            'nav_date': nav_date,
+            'worker_count': workers,
+            'started_at': fields.Datetime.now(),
+        })
+        start = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='efund_nav') as executor:
+            results = dict(executor.map(lambda fund_id: self._compute_in_worker(fund_id, nav_date), funds.ids))
+        for fund_id in results:
+            results[fund_id]['attempts'] = 1
+
+        for attempt in range(2, max_retries + 2):
+            failed = [fund_id for fund_id, result in results.items() if result['state'] == 'failed']
+            for fund_id in failed:
+                __, result = self._compute_in_worker(fund_id, nav_date)
+                results[fund_id] = dict(result, attempts=attempt)
+
+        run.write({
+            'line_ids': [(0, 0, dict(result, fund_id=fund_id)) for fund_id, result in results.items()],
+            'ended_at': fields.Datetime.now(),
+            'duration': time.monotonic() - start,
+            'slowest_duration': max(result['duration'] for result in results.values()),
+        })
+        run.state = 'partial' if run.failed_count else 'done'
+        _logger.info("Calcul VL du %s : %s fonds, %s échec(s), %.2fs (%s workers)",
+                     nav_date, run.fund_count, run.failed_count, run.duration, workers)
+        return run
+
+    def _compute_in_worker(self, fund_id, nav_date):
+        """Calcule la VL d'un fonds dans une transaction dédiée (appelé depuis un thread).
+
+        :return: (fund_id, résultat pour efund.fund.nav.run.line)
+        """
+        start = time.monotonic()
+        try:
+            with self.env.registry.cursor() as cr:
+                env = api.Environment(cr, self.env.uid, self.env.context)
+                nav = env['efund.fund.nav']._compute_fund_nav(fund_id, nav_date)
+                result = {'state': 'done', 'nav_id': nav.id, 'nav_per_share': nav.nav_per_share, 'error': False}
+        except Exception as e:
+            _logger.warning("Échec du calcul de la VL du fonds %s au %s", fund_id, nav_date, exc_info=True)
+            result = {'state': 'failed', 'nav_id': False, 'nav_per_share': 0.0, 'error': str(e)}
+        result['duration'] = time.monotonic() - start
+        return fund_id, result
+
+    @api.model
+    def _cron_compute_daily_navs(self):
+        self._run(fields.Date.context_today(self))
+
+    def action_retry_failed(self):
+        """Relance le calcul des seuls fonds en échec de ce run."""
+        self.ensure_one()
+        failed_lines = self.line_ids.filtered(lambda l: l.state == 'failed')
+        for line in failed_lines:
+            __, result = self._compute_in_worker(line.fund_id.id, self.nav_date)
+            line.write(dict(result, attempts=line.attempts + 1))
+        self.state = 'partial' if self.failed_count else 'done'
+        return True
+
+
+class FundNavRunLine(models.Model):
+    _name = 'efund.fund.nav.run.line'
+    _description = 'Calcul groupé des VL - résultat par fonds'
+    _order = 'state, duration desc'
+
+    run_id = fields.Many2one('efund.fund.nav.run', required=True, index=True, ondelete='cascade')
+    fund_id = fields.Many2one('efund.fund', string="Fonds", required=True)
+    state = fields.Selection([('done', 'Calculée'), ('failed', 'Échec')], string="Statut", required=True)
+    nav_id = fields.Many2one('efund.fund.nav', string="VL")
+    nav_per_share = fields.Float(string="VL par part")
+    attempts = fields.Integer(string="Tentatives", default=1)
+    duration = fields.Float(string="Durée (s)", digits=(16, 3))
+    error = fields.Text(string="Erreur")
@@ -0,0 +1,186 @@
+import base64
+import math
+from array import array
+from bisect import bisect_right
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api
+
+# Rendements glissants précalculés (en %) et durée de leur période en mois
+RETURN_PERIODS = {
+    'return_1m': 1,
+    'return_3m': 3,
+    'return_1y': 12,
+}
+
+
+class FundNavSeries(models.Model):
+    _name = 'efund.fund.nav.series'
+    _description = 'Historique des VL publiées et indicateurs de performance'
+    _order = 'fund_id, share_class_id'
+
+    fund_id = fields.Many2one('efund.fund', string="Fonds", required=True, index=True, ondelete='cascade')
+    share_class_id = fields.Many2one('efund.fund.class', string="Classe de parts", index=True, ondelete='cascade')
+
+    # Série compacte : dates (ordinaux) et VL en tableaux binaires, triés par date
+    dates_data = fields.Binary(string="Dates", attachment=False)
+    values_data = fields.Binary(string="VL", attachment=False)
+
+    nav_count = fields.Integer(string="Nombre de VL", readonly=True)
+    first_date = fields.Date(string="Première VL", readonly=True)
+    last_date = fields.Date(string="Dernière VL", readonly=True)
+    last_nav = fields.Float(string="Dernière VL publiée", readonly=True)
+    return_ytd = fields.Float(string="Perf. YTD (%)", digits=(16, 2), readonly=True)
+    return_1m = fields.Float(string="Perf. 1 mois (%)", digits=(16, 2), readonly=True)
+    return_3m = fields.Float(string="Perf. 3 mois (%)", digits=(16, 2), readonly=True)
+    return_1y = fields.Float(string="Perf. 1 an (%)", digits=(16, 2), readonly=True)
+    return_inception = fields.Float(string="Perf. depuis l'origine (%)", digits=(16, 2), readonly=True)
+    volatility_1y = fields.Float(string="Volatilité 1 an (%)", digits=(16, 2), readonly=True,
+                                 help="Écart-type annualisé des rendements sur un an glissant.")
+    max_drawdown = fields.Float(string="Perte maximale (%)", digits=(16, 2), readonly=True,
+                                help="Plus forte baisse depuis un plus haut, sur tout l'historique.")
+    sharpe_1y = fields.Float(string="Ratio de Sharpe 1 an", digits=(16, 2), readonly=True)
+
+    _fund_class_uniq = models.UniqueIndex("(fund_id, COALESCE(share_class_id, 0))")
+
+    # -------------------------
+    # SÉRIE
+    # -------------------------
+    def _get_arrays(self):
+        """:return: (dates ordinales, VL) de la série."""
+        self.ensure_one()
+        dates, values = array('l'), array('d')
+        if self.dates_data:
+            dates.frombytes(base64.b64decode(self.dates_data))
+            values.frombytes(base64.b64decode(self.values_data))
+        return dates, values
+
+    def _set_arrays(self, dates, values):
+        """Enregistre la série et recalcule tous ses indicateurs."""
+        self.ensure_one()
+        self.write(dict(
+            self._compute_analytics(dates, values),
+            dates_data=base64.b64encode(dates.tobytes()),
+            values_data=base64.b64encode(values.tobytes()),
+        ))
+
+    @api.model
+    def _load_posted_navs(self, fund_id, share_class_id):
+        """Reconstruit les tableaux depuis les VL publiées (une requête)."""
+        rows = self.env['efund.fund.nav'].search_read([
+            ('fund_id', '=', fund_id),
+            ('share_class_id', '=', share_class_id or False),
+            ('status', '=', 'posted'),
+        ], ['date', 'nav_per_share'], order='date, id')
+        by_date = {row['date']: row['nav_per_share'] for row in rows}
+        return array('l', (d.toordinal() for d in by_date)), array('d', by_date.values())
+
+    @api.model
+    def _add_navs(self, navs):
+        """Intègre des VL publiées aux séries de leurs (fonds, classe) et met à jour les indicateurs.
+
+        Les VL postérieures à la fin de la série sont simplement ajoutées ; une VL
+        antidatée ou republiée déclenche la reconstruction de la seule série concernée.
+        """
+        navs = navs.filtered(lambda n: n.status == 'posted')
+        if not navs:
+            return
+        series_by_key = {
+            (series.fund_id.id, series.share_class_id.id): series
+            for series in self.search([('fund_id', 'in', navs.fund_id.ids)])
+        }
+        for (fund, share_class), key_navs in navs.grouped(lambda n: (n.fund_id, n.share_class_id)).items():
+            series = series_by_key.get((fund.id, share_class.id))
+            if not series:
+                series = self.create({'fund_id': fund.id, 'share_class_id': share_class.id})
+            dates, values = series._get_arrays()
+            points = sorted((nav.date.toordinal(), nav.nav_per_share) for nav in key_navs)
+            if not dates or points[0][0] > dates[-1]:
+                for ordinal, nav_per_share in points:
+                    if dates and ordinal == dates[-1]:
+                        values[-1] = nav_per_share
+                    else:
+                        dates.append(ordinal)
+                        values.append(nav_per_share)
+            else:
+                dates, values = self._load_posted_navs(fund.id, share_class.id)
+            series._set_arrays(dates, values)
+
+    def action_rebuild(self):
+        for series in self:
+            series._set_arrays(*self._load_posted_navs(series.fund_id.id, series.share_class_id.id))
+        return True
+
+    # -------------------------
+    # INDICATEURS
+    # -------------------------
+    @api.model
+    def _value_at(self, dates, values, target):
+        """VL de la dernière date antérieure ou égale à ``target`` (None si la série commence après)."""
+        index = bisect_right(dates, target.toordinal()) - 1
+        return values[index] if index >= 0 else None
+
+    @api.model
+    def _compute_analytics(self, dates, values):
+        """Indicateurs de performance et de risque, en un seul parcours des tableaux.
+
+        Les performances se lisent par recherche dichotomique ; perte maximale, moyenne
+        et variance des rendements sur un an sont cumulées dans la même boucle.
+
+        Les rendements sont exprimés en %, la volatilité est annualisée d'après
+        l'espacement moyen des VL, le Sharpe utilise le taux sans risque paramétré
+        (efundOpc.risk_free_rate, en %).
+        """
+        result = dict.fromkeys(['return_ytd', 'return_inception', 'volatility_1y', 'max_drawdown', 'sharpe_1y',
+                                *RETURN_PERIODS], 0.0)
+        result.update(nav_count=len(dates), first_date=False, last_date=False, last_nav=0.0)
+        if not dates:
+            return result
+        last_date, last_nav = date.fromordinal(dates[-1]), values[-1]
+        result.update(first_date=date.fromordinal(dates[0]), last_date=last_date, last_nav=last_nav)
+
+        def performance(base):
+            return (last_nav / base - 1) * 100 if base else 0.0
+
+        result['return_inception'] = performance(values[0])
+        ytd_base = self._value_at(dates, values, date(last_date.year - 1, 12, 31))
+        result['return_ytd'] = performance(ytd_base if ytd_base is not None else values[0])
+        for field_name, months in RETURN_PERIODS.items():
+            base = self._value_at(dates, values, last_date - relativedelta(months=months))
+            result[field_name] = performance(base) if base is not None else 0.0
+
+        # Rendements périodiques sur un an glissant, à partir du rang ``start``
+        start = max(bisect_right(dates, (last_date - relativedelta(years=1)).toordinal()) - 1, 0)
+        peak, drawdown = values[0], 0.0
+        count, total, squares = 0, 0.0, 0.0
+        previous = None
+        for index, value in enumerate(values):
+            peak = max(peak, value)
+            if peak:
+                drawdown = min(drawdown, value / peak - 1)
+            if index > start and previous:
+                ret = value / previous - 1
+                count, total, squares = count + 1, total + ret, squares + ret * ret
+            previous = value
+        result['max_drawdown'] = drawdown * 100
+
+        if count >= 2:
+            mean = total / count
+            variance = max(squares - count * mean * mean, 0.0) / (count - 1)
+            periods_per_year = 365.25 * count / (dates[-1] - dates[start])
+            volatility = math.sqrt(variance * periods_per_year)
+            result['volatility_1y'] = volatility * 100
+            if volatility and values[start] > 0 and last_nav > 0:
+                years = (dates[-1] - dates[start]) / 365.25
+                annual_return = (last_nav / values[start]) ** (1 / years) - 1
+                risk_free = float(self.env['ir.config_parameter'].sudo().get_param('efundOpc.risk_free_rate', 0)) / 100
+                result['sharpe_1y'] = (annual_return - risk_free) / volatility
+        return result
+
+    @api.model
+    def _get_for_fund(self, fund):
+        """Série du fonds, à défaut celle de sa classe principale."""
+        return self.search([('fund_id', '=', fund.id), ('share_class_id', '=', False)], limit=1) or \
+            self.search([('fund_id', '=', fund.id), ('share_class_id', '=', fund.share_class_ids[:1].id)], limit=1)
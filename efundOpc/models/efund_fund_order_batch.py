@@ -0,0 +1,201 @@
+import logging
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+
+class FundOrderBatch(models.Model):
+    _name = 'efund.fund.order.batch'
+    _description = "Lot d'ordres figé au cut-off"
+    _inherit = ['mail.thread']
+    _order = 'cutoff_date desc, fund_id'
+
+    name = fields.Char(string="Référence", readonly=True)
+    fund_id = fields.Many2one('efund.fund', string="Fonds", required=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one(related='fund_id.company_id', store=True)
+    currency_id = fields.Many2one(related='fund_id.currency_id')
+    initial_price = fields.Selection(related='fund_id.initial_price', string="Type de Souscription")
+
+    cutoff_date = fields.Date(string="Date du cut-off", required=True, readonly=True)
+    cutoff_datetime = fields.Datetime(string="Heure du cut-off", required=True, readonly=True)
+    nav_date = fields.Date(string="Date VL appliquée", required=True, readonly=True, index=True)
+    nav_per_share = fields.Float(string="VL appliquée", readonly=True)
+    settled_date = fields.Datetime(string="Date de règlement", readonly=True)
+
+    state = fields.Selection([
+        ('frozen', 'Figé'),
+        ('settled', 'Réglé'),
+    ], string="Statut", default='frozen', required=True, tracking=True)
+
+    subscription_ids = fields.One2many('efund.fund.subscription', 'order_batch_id', string="Souscriptions")
+    redemption_ids = fields.One2many('efund.fund.redemption', 'order_batch_id', string="Rachats")
+    subscription_count = fields.Integer(compute='_compute_order_counts', string="Nombre de souscriptions")
+    redemption_count = fields.Integer(compute='_compute_order_counts', string="Nombre de rachats")
+    failure_log = fields.Text(string="Ordres en erreur", readonly=True)
+
+    _fund_cutoff_date_uniq = models.Constraint(
+        'unique(fund_id, cutoff_date)',
+        'Un seul lot par fonds et par cut-off'
+    )
+
+    @api.depends('subscription_ids', 'redemption_ids')
+    def _compute_order_counts(self):
+        for batch in self:
+            batch.subscription_count = len(batch.subscription_ids)
+            batch.redemption_count = len(batch.redemption_ids)
+
+    # -------------------------------------------------
+    # ORDONNANCEMENT
+    # -------------------------------------------------
+    @api.model
+    def _cron_process_cutoffs(self):
+        """Fige les ordres des fonds dont le cut-off est passé puis règle les lots dont la VL est connue.
+
+        Un lot n'est ouvert qu'au cut-off d'un jour de VL (ni week-end, ni jour hors
+        périodicité du fonds) : les ordres des autres jours rejoignent le lot suivant.
+        Chaque fonds et chaque lot est traité dans son propre savepoint : une erreur est
+        journalisée sans empêcher le traitement des autres.
+        """
+        now = fields.Datetime.now()
+        for fund in self.env['efund.fund'].search([('state', '=', 'active')]):
+            cutoff_date = fund._get_local_today()
+            if fund._get_next_nav_date(cutoff_date) != cutoff_date:
+                continue
+            cutoff_datetime = fund._get_cutoff_datetime(cutoff_date)
+            if now < cutoff_datetime:
+                continue
+            if self.search_count([('fund_id', '=', fund.id), ('cutoff_date', '=', cutoff_date)]):
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    self._freeze(fund, cutoff_date, cutoff_datetime)
+            except Exception as e:
+                _logger.error("Échec du cut-off %s du %s : %s", fund.code, cutoff_date, e, exc_info=True)
+
+        for batch in self.search([('state', '=', 'frozen')]):
+            try:
+                with self.env.cr.savepoint():
+                    navs = batch._get_batch_navs()
+                    if navs:
+                        batch._settle(navs)
+            except Exception as e:
+                _logger.error("Échec du règlement du lot %s : %s", batch.name, e, exc_info=True)
+                batch.failure_log = f"Échec du règlement planifié le {fields.Datetime.now()}\n{e}"
+
+    @api.model
+    def _freeze(self, fund, cutoff_date, cutoff_datetime):
+        """Rattache au lot les ordres soumis ou validés reçus avant le cut-off et fixe leur date VL.
+
+        Les ordres soumis sont validés par le gel : en cours inconnu, la VL n'est connue
+        qu'au règlement, et les soldes et parts disponibles sont contrôlés à ce moment-là.
+        """
+        nav_date = fund._get_next_nav_date(cutoff_date)
+        order_domain = [
+            ('fund_id', '=', fund.id),
+            ('state', 'in', ('submitted', 'validated')),
+            ('order_batch_id', '=', False),
+            ('date_operation', '<=', cutoff_datetime),
+        ]
+        subscriptions = self.env['efund.fund.subscription'].search(order_domain)
+        redemptions = self.env['efund.fund.redemption'].search(order_domain)
+
+        batch = self.create({
+            'name': f"{fund.code}/{cutoff_date}",
+            'fund_id': fund.id,
+            'cutoff_date': cutoff_date,
+            'cutoff_datetime': cutoff_datetime,
+            'nav_date': nav_date,
+        })
+        subscriptions.write({'order_batch_id': batch.id, 'nav_date': nav_date, 'state': 'validated'})
+        redemptions.write({'order_batch_id': batch.id, 'nav_date': nav_date, 'state': 'validated'})
+        _logger.info("Cut-off %s : %s souscription(s) et %s rachat(s) figés pour la VL du %s",
+                     batch.name, len(subscriptions), len(redemptions), nav_date)
+        return batch
+
+    def _get_batch_nav(self, share_class=None):
+        """VL publiée applicable au lot (ou à une de ses classes), 0 si elle n'est pas encore disponible.
+
+        Cours inconnu : VL de la date de règlement (forward pricing).
+        Cours connu : dernière VL publiée avant le cut-off.
+        """
+        self.ensure_one()
+        domain = [
+            ('fund_id', '=', self.fund_id.id),
+            ('share_class_id', '=', share_class.id if share_class else False),
+            ('status', '=', 'posted'),
+        ]
+        if self.fund_id.initial_price == 'Cours Connu':
+            domain.append(('date', '<', self.cutoff_date))
+        else:
+            domain.append(('date', '=', self.nav_date))
+        nav = self.env['efund.fund.nav'].search(domain, order='date desc, id desc', limit=1)
+        return nav.nav_per_share
+
+    def _get_orders_by_class(self):
+        """Ordres validés du lot par classe de parts : ({classe: souscriptions}, {classe: rachats})."""
+        self.ensure_one()
+        return (
+            self.fund_id._group_orders_by_class(self.subscription_ids.filtered(lambda s: s.state == 'validated')),
+            self.fund_id._group_orders_by_class(self.redemption_ids.filtered(lambda r: r.state == 'validated')),
+        )
+
+    def _get_batch_navs(self):
+        """VL applicable à chaque classe de parts des ordres du lot.
+
+        :return: {classe (vide pour un fonds sans classes): VL}, vide tant qu'une VL manque
+        """
+        self.ensure_one()
+        sub_groups, red_groups = self._get_orders_by_class()
+        share_classes = set(sub_groups) | set(red_groups) or {self.env['efund.fund.class']}
+        navs = {share_class: self._get_batch_nav(share_class) for share_class in share_classes}
+        return navs if all(navs.values()) else {}
+
+    def _settle(self, navs):
+        """Règle en une passe par classe de parts tous les ordres du lot.
+
+        :param navs: {classe: VL}, voir :meth:`_get_batch_navs`
+        """
+        self.ensure_one()
+        if self.state != 'frozen':
+            raise UserError(_("Le lot %s est déjà réglé.") % self.name)
+
+        sub_groups, red_groups = self._get_orders_by_class()
+        subscriptions = self.env['efund.fund.subscription']
+        redemptions = self.env['efund.fund.redemption']
+        failures = []
+        for share_class, orders in sub_groups.items():
+            settled, order_failures = orders._settle_at_nav(navs[share_class])
+            subscriptions |= settled
+            failures += order_failures.values()
+        for share_class, orders in red_groups.items():
+            settled, order_failures = orders._settle_at_nav(navs[share_class])
+            redemptions |= settled
+            failures += order_failures.values()
+        vl = ", ".join(f"{share_class.name} : {nav}" if share_class else str(nav)
+                       for share_class, nav in navs.items())
+
+        self.write({
+            'state': 'settled',
+            'nav_per_share': next(iter(navs.values())) if len(navs) == 1 else 0.0,
+            'settled_date': fields.Datetime.now(),
+            'failure_log': "\n".join(failures) or False,
+        })
+        self.env['efund.fund.flow']._net_orders([self.nav_date], self.fund_id)
+        self.fund_id.message_post(body=_(
+            "Lot %s réglé à la VL du %s.<br/>"
+            "VL : %s<br/>"
+            "Souscriptions réglées : %s<br/>"
+            "Rachats réglés : %s<br/>"
+            "Ordres en erreur : %s"
+        ) % (self.name, self.nav_date, vl, len(subscriptions), len(redemptions), len(failures)))
+        return subscriptions, redemptions, failures
+
+    def action_settle(self):
+        """Règlement manuel des lots dont la VL est publiée."""
+        for batch in self:
+            navs = batch._get_batch_navs()
+            if not navs:
+                raise UserError(_("La VL applicable au lot %s n'est pas encore publiée.") % batch.name)
+            batch._settle(navs)
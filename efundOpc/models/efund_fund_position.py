@@ -134,6 +134,33 @@ class FundPosition(models.Model):
         string="Ajustements"
     )
 
+    # Recherche de la dernière position à date par fonds et instrument
+    _fund_instrument_date_idx = models.Index("(fund_id, instrument_id, valuation_date DESC, id DESC)")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        positions = super().create(vals_list)
+        positions._mark_navs_dirty()
+        return positions
+
+    def write(self, vals):
+        tracked = {'fund_id', 'instrument_id', 'quantity', 'valuation_date', 'state'} & set(vals)
+        if tracked:
+            self._mark_navs_dirty()
+        res = super().write(vals)
+        if tracked:
+            self._mark_navs_dirty()
+        return res
+
+    def unlink(self):
+        self._mark_navs_dirty()
+        return super().unlink()
+
+    def _mark_navs_dirty(self):
+        """Marque les VL du fonds à partir de la date de valorisation de la position."""
+        for valuation_date, positions in self.grouped('valuation_date').items():
+            self.env['efund.fund.nav.dirty']._mark(positions.fund_id.ids, valuation_date)
+
     # les méthodes de dépendances
 
     @api.depends('unrealized_pl')
@@ -149,24 +176,13 @@ class FundPosition(models.Model):
 
     @api.depends('instrument_id')
     def _compute_last_price(self):
-        """Récupère le dernier cours validé pour l'instrument"""
+        """Récupère le dernier cours validé de l'instrument (index des derniers cours, une requête).
+
+        Les changements de cours sont répercutés en bloc par efund.fund.instrument.last.price._reprice_positions.
+        """
+        latest = self.env['efund.fund.instrument.last.price']._get_latest(self.instrument_id.ids)
         for pos in self:
-            if pos.instrument_id:
-                # Chercher le dernier cours validé
-                last_price = self.env['efund.fund.instrument.price'].search([
-                    ('instrument_id', '=', pos.instrument_id.id),
-                    ('is_validated', '=', True)
-                ], order='date desc', limit=1)
-
-                if last_price:
-                    pos.last_price = last_price.price
-                    pos.last_price_date = last_price.date
-                else:
-                    pos.last_price = 0.0
-                    pos.last_price_date = False
-            else:
-                pos.last_price = 0.0
-                pos.last_price_date = False
+            pos.last_price, pos.last_price_date = latest.get(pos.instrument_id.id, (0.0, False))
 
     @api.depends('quantity', 'avg_cost', 'last_price')
     def _compute_market_value(self):
@@ -22,6 +22,8 @@ class FundRedemption(models.Model):
     currency_id = fields.Many2one(related='company_id.currency_id', store=True)
     date_operation = fields.Datetime(string="Date de l'opération", default=fields.Datetime.now)
     date_valeur = fields.Datetime(string="Date de valeur")
+    order_batch_id = fields.Many2one('efund.fund.order.batch', string="Lot de règlement", readonly=True,
+                                     index=True, copy=False)
     allow_fractional_parts = fields.Boolean(string="Parts fractionnées",
                                             related='part_account_id.fund_id.allow_fractional_parts', )
     # rachat
@@ -30,7 +32,7 @@ class FundRedemption(models.Model):
     parts_to_redeem = fields.Float(string="Nombre de parts", digits=(16, 4))
 
     # info VL (prévisionnelle)
-    nav_date = fields.Date(string="Date VL appliquée", default=fields.Date.context_today, required=True)
+    nav_date = fields.Date(string="Date VL appliquée", default=fields.Date.context_today, required=True, index=True)
     estimated_nav = fields.Float(string="VL estimée", help="VL indicative (à confirmer)", readonly=True)
     estimated_amount = fields.Monetary(string="Montant à percevoir", compute="_compute_estimated_amount", store=True, )
     # frais rachat
@@ -85,55 +87,113 @@ class FundRedemption(models.Model):
             if rec.state != 'validated':
                 raise UserError(_("Le rachat doit être validée avant exécution."))
 
-            fund = rec.cash_account_id.fund_id
-
             # 🔒 Récupération de la VL validée (Juste pour les test et recuperer dans le modèle VL
-            vl = fund.current_vl
+            vl = rec.fund_id.current_vl
             if not vl or vl <= 0:
                 raise UserError(_("Aucune VL valide disponible."))
 
-            # Parts suffisantes
-            if self.total_parts_available < self.parts_to_redeem:
-                raise UserError(_("Nombre de parts insuffisant."))
+        for fund, redemptions in self.grouped('fund_id').items():
+            settled, failures = redemptions._settle_at_nav(fund.current_vl)
+            if failures:
+                raise UserError("\n".join(failures.values()))
+
+            # 🧠 Traçabilité : un message de synthèse par fonds
+            fund.message_post(body=_(
+                "Rachats exécutés : %s<br/>"
+                "Parts rachetées : %s<br/>"
+                "VL : %s<br/>"
+                "Montant généré : %s<br/>"
+                "Montant reçu : %s<br/>"
+                "Frais rachat : %s"
+            ) % (len(settled), sum(settled.mapped('parts_to_redeem')), fund.current_vl,
+                 sum(settled.mapped('amount')), sum(settled.mapped('estimated_amount')),
+                 sum(settled.mapped('redemption_fee_amount'))))
+
+    # -------------------------------------------------
+    # RÈGLEMENT EN LOT À LA VL
+    # -------------------------------------------------
+    def _get_settlement_values(self, vl, parts_available):
+        """Calcule le règlement d'un rachat à la VL donnée.
+
+        Lève une UserError si l'ordre ne peut pas être réglé.
+        """
+        self.ensure_one()
+        if self.state != 'validated':
+            raise UserError(_("%s : le rachat doit être validé avant exécution.") % self.display_name)
+
+        parts = parts_available if self.redemption_type == 'total' else self.parts_to_redeem
+        if parts <= 0:
+            raise UserError(_("%s : aucune part à racheter.") % self.display_name)
+
+        # Parts suffisantes
+        if parts_available < parts:
+            raise UserError(_("%s : nombre de parts insuffisant.") % self.display_name)
+
+        amount = parts * vl
+        fee = amount * self.fund_id.redemption_fee_rate / 100
+        return {
+            'estimated_nav': vl,
+            'parts_to_redeem': parts,
+            'amount': amount,
+            'redemption_fee_amount': fee,
+            'estimated_amount': amount - fee,
+        }
+
+    def _settle_at_nav(self, vl):
+        """Règle en une passe les rachats validés de self (un seul fonds) à la VL donnée.
+
+        Les parts détenues sont lues en une requête, tous les mouvements sont créés en
+        un seul ``create`` par modèle, les champs communs des ordres réglés sont écrits en
+        un ``write`` et leurs montants propres en une requête. Un ordre en erreur est écarté sans empêcher
+        le règlement des autres. Le compte espèces est crédité du montant net de frais.
+
+        :return: (rachats réglés, {rachat: message d'erreur})
+        """
+        if len(self.fund_id) > 1:
+            raise UserError(_("Le règlement en lot se fait fonds par fonds."))
+        if not vl or vl <= 0:
+            raise UserError(_("Aucune VL valide disponible."))
+
+        holdings = self.part_account_id.get_parts_at(fields.Date.today())
+        now = fields.Datetime.now()
+        settled = self.browse()
+        failures = {}
+        order_values = {}
+        cash_move_vals = []
+        part_move_vals = []
+
+        for rec in self:
+            try:
+                values = rec._get_settlement_values(vl, holdings.get(rec.part_account_id.id, 0.0))
+            except UserError as e:
+                failures[rec] = e.args[0]
+                continue
 
+            holdings[rec.part_account_id.id] -= values['parts_to_redeem']
+            settled |= rec
 
-            # 🧾 Mise à jour de l’ordre
-            rec.write({
-                'date_valeur': fields.Datetime.now(),
-                'state': 'accounted',
-            })
+            # 🧾 Montants propres à l’ordre, écrits en lot après la boucle
+            order_values[rec] = {fname: amount for fname, amount in values.items() if fname != 'estimated_nav'}
 
             # 💸 MOUVEMENTS COMPTABLES
-            # 1️⃣ Sortie espèces (montant reçu)
-            self.env['efund.account.cash.move'].create({
+            cash_move_vals.append({
                 'cash_account_id': rec.cash_account_id.id,
                 'move_type': 'redemption_net',
-                'amount': self.estimated_amount,
+                'amount': values['estimated_amount'],
+                'date': now,
             })
-            # 1️⃣ Sortie espèces (montant frais rachat)
-            self.env['efund.account.cash.move'].create({
-                'cash_account_id': rec.cash_account_id.id,
-                'move_type': 'redemption_fee',
-                'amount': self.redemption_fee_amount,
-            })
-
-            # 2️⃣ Sortie de parts
-            self.env['efund.account.part.move'].create({
+            part_move_vals.append({
                 'part_account_id': rec.part_account_id.id,
                 'move_type': 'redemption',
-                'parts': self.parts_to_redeem,
+                'parts': values['parts_to_redeem'],
+                'date': now,
             })
 
-            # 🧠 Traçabilité
-            rec.message_post(
-                body=_(
-                    "Rachat exécuté: %s<br/>"
-                    "VL : %s<br/>"                   
-                    "Montant générée : %s<br/>"
-                    "Monant reçu : %s"
-                    "Frais rachat : %s"
-                ) % (rec.parts_to_redeem,rec.estimated_nav,rec.amount,rec.estimated_amount, rec.redemption_fee_amount)
-            )
+        settled.write({'estimated_nav': vl, 'date_valeur': now, 'state': 'accounted'})
+        self._write_settlement_values(order_values)
+        self.env['efund.account.cash.move'].create(cash_move_vals)
+        self.env['efund.account.part.move'].create(part_move_vals)
+        return settled, failures
 
     def action_validate_redemption(self):
         for rec in self:
@@ -105,6 +105,20 @@ class FundReportRegulatory(models.Model):
             ws.append(["Market Exposure (%)", rec.ratio_exposure])
             ws.append(["Hedging Coverage (%)", rec.ratio_coverage])
 
+            series = self.env['efund.fund.nav.series']._get_for_fund(rec.fund_id)
+            if series:
+                ws.append([])
+                ws.append(["Performance", series.last_date and series.last_date.strftime('%Y-%m-%d')])
+                ws.append(["Last NAV", series.last_nav])
+                ws.append(["YTD Return (%)", series.return_ytd])
+                ws.append(["1 Month Return (%)", series.return_1m])
+                ws.append(["3 Months Return (%)", series.return_3m])
+                ws.append(["1 Year Return (%)", series.return_1y])
+                ws.append(["Since Inception (%)", series.return_inception])
+                ws.append(["1 Year Volatility (%)", series.volatility_1y])
+                ws.append(["Max Drawdown (%)", series.max_drawdown])
+                ws.append(["1 Year Sharpe Ratio", series.sharpe_1y])
+
             output = io.BytesIO()
             wb.save(output)
             output.seek(0)
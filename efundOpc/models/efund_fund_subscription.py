@@ -23,6 +23,9 @@ class FundSubscription(models.Model):
     currency_id = fields.Many2one(related='cash_account_id.fund_id.currency_id')
     date_operation=fields.Datetime(string="Date de l'opération",default=fields.Datetime.now)
     date_valeur = fields.Datetime(string="Date de valeur")
+    order_batch_id = fields.Many2one('efund.fund.order.batch', string="Lot de règlement", readonly=True,
+                                     index=True, copy=False)
+    nav_date = fields.Date(string="Date VL appliquée", default=fields.Date.context_today, index=True)
     amount = fields.Monetary(string="montant",currency_field="currency_id")
     parts = fields.Float(string="Nombre de parts")
     unit_value = fields.Monetary(string="VL appliquée",readonly=True,currency_field="currency_id")
@@ -65,93 +68,143 @@ class FundSubscription(models.Model):
 
     def action_account(self):
         for rec in self:
-            if rec.date_valeur < rec.date_operation:
-                raise UserError(_("La date de l'opération ne peut pas être supérieure à la date de valeur"))
-
             if rec.state != 'validated':
                 raise UserError(_("La souscription doit être validée avant exécution."))
 
-            fund = rec.cash_account_id.fund_id
-
             # 🔒 Récupération de la VL validée (Juste pour les test et recuperer dans le modèle VL
-            vl = fund.current_vl
-            if vl != self.unit_value:
-                raise UserError(_("La valeur de la VL a changé avant la comptabilisation."))
-
+            vl = rec.fund_id.current_vl
             if not vl or vl <= 0:
                 raise UserError(_("Aucune VL valide disponible."))
 
-            # Solde disponible suffisant
-            if self.cash_account_id.balance < self.amount:
-                raise UserError(_("Solde espèces insuffisant."))
-
-            # 🔢 Calcul théorique
-            theoretical_parts = rec.amount / vl
-
-            if fund.allow_fractional_parts:
-                parts = theoretical_parts
-                cash_used = rec.amount
-                cash_refund = 0.0
-            else:
-                parts = floor(theoretical_parts)
-                cash_used = parts * vl
-                cash_refund = rec.amount - cash_used
+            if vl != rec.unit_value:
+                raise UserError(_("La valeur de la VL a changé avant la comptabilisation."))
 
-            if parts <= 0:
-                raise UserError(
-                    _("Le montant est insuffisant pour souscrire au moins une part.")
-                )
+        for fund, subscriptions in self.grouped('fund_id').items():
+            settled, failures = subscriptions._settle_at_nav(fund.current_vl)
+            if failures:
+                raise UserError("\n".join(failures.values()))
+
+            # 🧠 Traçabilité : un message de synthèse par fonds
+            fund.message_post(body=_(
+                "Souscriptions exécutées : %s<br/>"
+                "VL : %s<br/>"
+                "Parts créées : %s<br/>"
+                "Montant utilisé : %s<br/>"
+                "Montant restitué : %s"
+            ) % (len(settled), fund.current_vl, sum(settled.mapped('parts')),
+                 sum(settled.mapped('cash_used')), sum(settled.mapped('cash_refund'))))
+
+    # -------------------------------------------------
+    # RÈGLEMENT EN LOT À LA VL
+    # -------------------------------------------------
+    def _get_settlement_values(self, vl, balance):
+        """Calcule le règlement d'une souscription à la VL donnée.
+
+        Lève une UserError si l'ordre ne peut pas être réglé.
+        """
+        self.ensure_one()
+        if self.state != 'validated':
+            raise UserError(_("%s : la souscription doit être validée avant exécution.") % self.display_name)
+
+        if self.date_valeur and self.date_valeur < self.date_operation:
+            raise UserError(_("%s : la date de l'opération ne peut pas être supérieure à la date de valeur.")
+                            % self.display_name)
+
+        # Solde disponible suffisant
+        if balance < self.amount:
+            raise UserError(_("%s : solde espèces insuffisant.") % self.display_name)
+
+        # 🔢 Prix unitaire frais de souscription inclus
+        fee_rate = self.fund_id.subscription_fee_rate
+        unit_price = vl * (1 + fee_rate / 100)
+        if self.fund_id.allow_fractional_parts:
+            parts = round(self.amount / unit_price, 4)
+        else:
+            parts = floor(self.amount / unit_price)
+
+        if parts <= 0:
+            raise UserError(_("%s : le montant est insuffisant pour souscrire au moins une part.")
+                            % self.display_name)
+
+        cash_used = parts * vl
+        fee = cash_used * fee_rate / 100
+        return {
+            'unit_value': vl,
+            'parts': parts,
+            'cash_used': cash_used,
+            'fee': fee,
+            'cash_refund': self.amount - cash_used - fee,
+        }
+
+    def _settle_at_nav(self, vl):
+        """Règle en une passe les souscriptions validées de self (un seul fonds) à la VL donnée.
+
+        Les soldes sont lus une seule fois, tous les mouvements espèces et titres sont
+        créés en un seul ``create`` par modèle, les champs communs des ordres réglés sont
+        écrits en un ``write`` et leurs montants propres en une requête. Un ordre en erreur est écarté sans
+        empêcher le règlement des autres.
+
+        Seuls le montant investi et les frais sont débités : le reliquat n'ayant jamais
+        quitté le compte espèces, il n'y a pas de mouvement de remboursement.
+
+        :return: (souscriptions réglées, {souscription: message d'erreur})
+        """
+        if len(self.fund_id) > 1:
+            raise UserError(_("Le règlement en lot se fait fonds par fonds."))
+        if not vl or vl <= 0:
+            raise UserError(_("Aucune VL valide disponible."))
+
+        balances = {account.id: account.balance for account in self.cash_account_id}
+        now = fields.Datetime.now()
+        settled = self.browse()
+        failures = {}
+        order_values = {}
+        cash_move_vals = []
+        part_move_vals = []
 
-            # 🧾 Mise à jour de l’ordre
-            rec.write({
-                'unit_value': vl,
-                'parts': parts,
-                'cash_used': cash_used,
-                'cash_refund': cash_refund,
-                'date_valeur': fields.Datetime.now(),
-                'state': 'accounted',
-            })
+        for rec in self:
+            try:
+                values = rec._get_settlement_values(vl, balances[rec.cash_account_id.id])
+            except UserError as e:
+                failures[rec] = e.args[0]
+                continue
+
+            balances[rec.cash_account_id.id] -= values['cash_used'] + values['fee']
+            settled |= rec
+
+            # 🧾 Montants propres à l’ordre, écrits en lot après la boucle
+            order_values[rec] = {
+                'parts': values['parts'],
+                'cash_used': values['cash_used'],
+                'cash_refund': values['cash_refund'],
+            }
 
             # 💸 MOUVEMENTS COMPTABLES
-            # 1️⃣ Sortie espèces (montant utilisé)
-            # Enregistrement du montant investi
-            self.env['efund.account.cash.move'].create({
+            cash_move_vals.append({
                 'cash_account_id': rec.cash_account_id.id,
                 'move_type': 'subscription_net',
-                'amount': cash_used,
-            })
-            # Enregistrement des frais de souscription
-            self.env['efund.account.cash.move'].create({
-                'cash_account_id': rec.cash_account_id.id,
-                'move_type': 'subscription_fee',
-                'amount': self.subscription_fee_amount,
+                'amount': values['cash_used'],
+                'date': now,
             })
-
-            # 2️⃣ Entrée parts
-            self.env['efund.account.part.move'].create({
+            if values['fee']:
+                cash_move_vals.append({
+                    'cash_account_id': rec.cash_account_id.id,
+                    'move_type': 'subscription_fee',
+                    'amount': values['fee'],
+                    'date': now,
+                })
+            part_move_vals.append({
                 'part_account_id': rec.part_account_id.id,
                 'move_type': 'subscription',
-                'parts': parts,
+                'parts': values['parts'],
+                'date': now,
             })
 
-            # 3️⃣ Remboursement du reliquat (si nécessaire)
-            if cash_refund > 0:
-                self.env['efund.account.cash.move'].create({
-                    'cash_account_id': rec.cash_account_id.id,
-                    'move_type': 'refund',
-                    'amount': cash_refund,
-                })
-
-            # 🧠 Traçabilité
-            rec.message_post(
-                body=_(
-                    "Souscription exécutée.<br/>"
-                    "VL : %s<br/>"
-                    "Parts créées : %s<br/>"
-                    "Montant utilisé : %s<br/>"
-                    "Montant restitué : %s"
-                ) % (vl, parts, cash_used, cash_refund)
-            )
+        settled.write({'unit_value': vl, 'date_valeur': now, 'state': 'accounted'})
+        self._write_settlement_values(order_values)
+        self.env['efund.account.cash.move'].create(cash_move_vals)
+        self.env['efund.account.part.move'].create(part_move_vals)
+        return settled, failures
 
     def action_validate_subscription(self):
         for rec in self:
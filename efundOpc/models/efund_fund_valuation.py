@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
-from datetime import datetime
+from odoo.tools import SQL
+from odoo.tools import html_escape
+from collections import Counter
+from datetime import datetime, timedelta
+import base64
+import hashlib
+import json
 import logging
+import zlib
 
 _logger = logging.getLogger(__name__)
 
@@ -48,6 +55,12 @@ class FundValuation(models.Model):
 
     notes = fields.Text(string="Comments / Observations")
 
+    # Instantané figé à la validation : positions, cours, change et frais utilisés
+    snapshot_data = fields.Binary(string="Snapshot", attachment=False, readonly=True, copy=False)
+    snapshot_hash = fields.Char(string="Snapshot Fingerprint", readonly=True, copy=False,
+                                help="Empreinte SHA-256 du contenu de l'instantané.")
+    snapshot_html = fields.Html(string="Snapshot Content", compute="_compute_snapshot_html", sanitize=False)
+
     def _prepare_vals_sequence(self, vals):
         """Prépare les valeurs avec séquence automatique"""
         if vals.get("name", "/") == "/":
@@ -62,15 +75,13 @@ class FundValuation(models.Model):
             vals = self._prepare_vals_sequence(vals)
 
         records = super().create(vals)
-        for rec in records:
-            rec._log_action("create", _("Valuation created."))
+        records._log_action("create", _("Valuation created."))
         return records
 
     def write(self, vals):
         res = super().write(vals)
-        # log update
-        for rec in self:
-            rec._log_action("write", _("Valuation updated."))
+        # log update (fusionné par valorisation jusqu'à la fin de la transaction)
+        self._log_action("write", changed_fields=vals)
         return res
 
 
@@ -85,40 +96,35 @@ class FundValuation(models.Model):
             rec.nav_per_share = rec.net_assets / rec.total_shares if rec.total_shares else 0.0
 
     def action_refresh_lines(self):
+        """Reconstruit les lignes de valorisation depuis les positions des fonds.
+
+        Positions, derniers cours validés et coupons courus à la date de valorisation
+        proviennent de efund.fund.nav._get_position_lines, qui sert aussi au calcul de la
+        VL : les deux valorisent le portefeuille à l'identique. Les lignes sont créées en
+        un seul lot.
         """
-        Refresh valuation lines from positions.
-        Expected existing model: fund.position with fields: fund_id, instrument_id, quantity, currency_id.
-        If fund.position doesn't exist, fallback is no-op.
-        """
-        Position = self.env.get("efund.fund.position")
-        Instrument = self.env.get("efund.fund.instrument")
-        for rec in self:
-            # clear lines
-            rec.valuation_line_ids.unlink()
-            if not Position:
-                _logger.debug("model fund.position not found, skipping refresh lines")
-                rec._log_action("refresh_lines", "No fund.position model found - refresh skipped")
-                continue
-            positions = Position.search([("fund_id", "=", rec.fund_id.id)])
-            lines = []
-            for pos in positions:
-                # attempt to get market price - prefer instrument last_price if available
-                unit_price = 0.0
-                if hasattr(pos, "market_price") and pos.market_price:
-                    unit_price = pos.market_price
-                elif Instrument and pos.instrument_id:
-                    unit_price = Instrument.get_market_price(pos.instrument_id.id, rec.valuation_date) if hasattr(Instrument, "get_market_price") else getattr(pos, "unit_price", 0.0)
-                else:
-                    unit_price = getattr(pos, "unit_price", 0.0)
-                lines.append((0, 0, {
-                    "instrument_id": pos.instrument_id.id if pos.instrument_id else False,
-                    "quantity": pos.quantity,
-                    "unit_price": unit_price,
-                    "currency_id": rec.currency_id.id,
-                }))
-            if lines:
-                rec.valuation_line_ids = lines
-                rec._log_action("refresh_lines", _("Refreshed %s valuation lines from positions.") % len(lines))
+        Line = self.env["efund.fund.valuation.line"]
+        to_refresh = self.filtered(lambda v: v.state not in ("validated", "cancelled"))
+        to_refresh.valuation_line_ids.unlink()
+        for valuation_date, valuations in to_refresh.grouped("valuation_date").items():
+            positions = self.env["efund.fund.nav"]._get_position_lines(valuation_date, valuations.fund_id.ids)
+            valuation_by_fund = {val.fund_id.id: val for val in valuations}
+            vals_list = [{
+                "valuation_id": valuation_by_fund[fund_id].id,
+                "instrument_id": instrument_id,
+                "quantity": quantity,
+                "unit_price": price or 0.0,
+                "accrued_interest": accrued_interest,
+            } for fund_id, instrument_id, quantity, price, accrued_interest in positions]
+            Line.create(vals_list)
+            counts = Counter(pos[0] for pos in positions)
+            missing_counts = Counter(pos[0] for pos in positions if pos[3] is None)
+            for valuation in valuations:
+                count, missing = counts[valuation.fund_id.id], missing_counts[valuation.fund_id.id]
+                message = _("Refreshed %s valuation lines from positions.") % count
+                if missing:
+                    message += " " + _("%s line(s) without validated price.") % missing
+                valuation._log_action("refresh_lines", message)
         return True
 
     def action_compute(self):
@@ -158,9 +164,12 @@ class FundValuation(models.Model):
             # business checks
             if not rec.valuation_line_ids:
                 raise ValidationError(_("Valuation lines are empty. Cannot validate."))
-            rec.state = "validated"
-            rec.validated_by = self.env.user.id
-            rec.validation_date = fields.Datetime.now()
+            rec.write(dict(
+                rec._freeze_snapshot(),
+                state="validated",
+                validated_by=self.env.user.id,
+                validation_date=fields.Datetime.now(),
+            ))
             rec._log_action("validate", _("Valuation validated by %s") % (self.env.user.name))
         return True
 
@@ -170,6 +179,264 @@ class FundValuation(models.Model):
             rec._log_action("cancel", _("Valuation cancelled."))
         return True
 
+    # ------------------------------
+    # Frozen snapshot
+    # ------------------------------
+    def _build_snapshot(self):
+        """Contenu de l'instantané : toutes les données d'entrée de la valorisation, en colonnes."""
+        self.ensure_one()
+        lines = self.valuation_line_ids
+        lines.instrument_id.fetch(["name", "isin", "currency_id"])
+        currencies = lines.instrument_id.currency_id | self.currency_id
+        company = self.company_id or self.env.company
+        return {
+            "version": 1,
+            "valuation_date": str(self.valuation_date),
+            "currency": self.currency_id.name,
+            "total_shares": self.total_shares,
+            "totals": {
+                "total_assets": self.total_assets,
+                "total_liabilities": self.total_liabilities,
+                "net_assets": self.net_assets,
+                "nav_per_share": self.nav_per_share,
+            },
+            # Taux de conversion vers la devise de la valorisation à la date
+            "fx": {
+                currency.name: currency._get_conversion_rate(currency, self.currency_id, company, self.valuation_date)
+                for currency in currencies if self.currency_id
+            },
+            "lines": {
+                "instrument_id": [line.instrument_id.id for line in lines],
+                "instrument": [line.instrument_id.name for line in lines],
+                "isin": [line.instrument_id.isin or "" for line in lines],
+                "currency": [line.instrument_id.currency_id.name or "" for line in lines],
+                "quantity": lines.mapped("quantity"),
+                "unit_price": lines.mapped("unit_price"),
+                "accrued_interest": lines.mapped("accrued_interest"),
+                "market_value": lines.mapped("market_value"),
+            },
+            "fees": [{
+                "fee_type": fee.fee_type,
+                "share_class_id": fee.share_class_id.id,
+                "description": fee.description or "",
+                "amount": fee.amount,
+                "base_amount": fee.base_amount,
+                "rate": fee.rate,
+                "days": fee.days,
+            } for fee in self.fee_line_ids],
+        }
+
+    def _freeze_snapshot(self):
+        """:return: valeurs des champs de l'instantané (JSON compressé et son empreinte)."""
+        payload = json.dumps(self._build_snapshot(), separators=(",", ":"), sort_keys=True).encode()
+        return {
+            "snapshot_data": base64.b64encode(zlib.compress(payload, 9)),
+            "snapshot_hash": hashlib.sha256(payload).hexdigest(),
+        }
+
+    def _get_snapshot(self):
+        """Instantané décodé (None tant que la valorisation n'est pas validée)."""
+        self.ensure_one()
+        if not self.snapshot_data:
+            return None
+        return json.loads(zlib.decompress(base64.b64decode(self.snapshot_data)))
+
+    def _get_valuation_data(self):
+        """Données de la valorisation pour les états : l'instantané figé si elle est validée,
+        sinon les lignes courantes (même structure)."""
+        self.ensure_one()
+        return self._get_snapshot() or self._build_snapshot()
+
+    @api.depends("snapshot_data")
+    def _compute_snapshot_html(self):
+        for rec in self:
+            snapshot = rec._get_snapshot()
+            if not snapshot:
+                rec.snapshot_html = False
+                continue
+            lines = snapshot["lines"]
+            rows = "".join(
+                "<tr><td>%s</td><td>%s</td><td class='text-end'>%s</td><td class='text-end'>%s</td>"
+                "<td class='text-end'>%s</td><td class='text-end'>%s</td></tr>" % (
+                    html_escape(lines["instrument"][i]), html_escape(lines["isin"][i]),
+                    lines["quantity"][i], lines["unit_price"][i],
+                    lines["accrued_interest"][i], lines["market_value"][i])
+                for i in range(len(lines["instrument"]))
+            )
+            rec.snapshot_html = (
+                "<table class='table table-sm'><thead><tr><th>%s</th><th>ISIN</th><th>%s</th><th>%s</th>"
+                "<th>%s</th><th>%s</th></tr></thead><tbody>%s</tbody></table>" % (
+                    _("Instrument"), _("Quantity"), _("Market Price"), _("Accrued Interest"),
+                    _("Market Value"), rows)
+            )
+
+    def _check_not_frozen(self):
+        """Les lignes et frais d'une valorisation validée sont figés par son instantané."""
+        if any(rec.state == "validated" for rec in self):
+            raise ValidationError(_("A validated valuation is frozen: its lines and fees can no longer change."))
+
+    # ------------------------------
+    # Daily fee accrual engine
+    # ------------------------------
+    @api.model
+    def _get_previous_fund_navs(self, accrual_date, fund_ids):
+        """Dernière VL (fonds) calculée ou publiée avant ``accrual_date``: {fund_id: date}."""
+        self.env["efund.fund.nav"].flush_model(["fund_id", "share_class_id", "date", "status"])
+        self.env.cr.execute(SQL(
+            """
+            SELECT DISTINCT ON (fund_id) fund_id, date
+              FROM efund_fund_nav
+             WHERE fund_id = ANY(%s) AND share_class_id IS NULL AND date < %s
+               AND status IN ('computed', 'posted')
+             ORDER BY fund_id, date DESC, id DESC
+            """,
+            list(fund_ids), accrual_date,
+        ))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _accrue_daily_fees(self, accrual_date, funds=None):
+        """Calcule les frais courus du jour des fonds et de leurs classes.
+
+        Frais du fonds (dépositaire, TAF, et gestion s'il n'a pas de classe) sur son actif
+        valorisé ; frais de gestion de chaque classe sur sa quote-part. Ces frais courent sur
+        les jours écoulés depuis la VL précédente (base 365).
+
+        La commission de performance est provisionnée au-delà du high-water mark de la
+        classe (relevé à chaque cristallisation, VL de lancement à défaut) : la ligne du jour porte la variation
+        de la provision, de sorte que le cumul des lignes depuis la dernière cristallisation
+        égale la commission due.
+
+        Les lignes sont écrites dans la valorisation du jour de chaque fonds soumis à des
+        frais (créée au besoin) ; sans ``funds``, seuls les fonds actifs ayant une VL à la date
+        sont traités. Les lignes automatiques d'un passage précédent sont remplacées, les
+        saisies manuelles conservées et déduites de l'assiette. Les valorisations validées ne
+        sont pas modifiées.
+
+        :return: efund.fund.valuation.fee créés
+        """
+        accrual_date = fields.Date.to_date(accrual_date)
+        Nav = self.env["efund.fund.nav"]
+        Class = self.env["efund.fund.class"]
+        if funds is None:
+            funds = Nav.search([
+                ("date", "=", accrual_date),
+                ("share_class_id", "=", False),
+                ("fund_id.state", "=", "active"),
+            ]).fund_id
+        classes = Class.search([("fund_id", "in", funds.ids)])
+        classes_by_fund = classes.grouped("fund_id")
+        funds = funds.filtered(lambda f: f.custody_fee_rate or f.taf_rate or f.management_fee_rate or any(
+            c.management_fee_rate or c.performance_fee_rate for c in classes_by_fund.get(f, Class)))
+        valuations = self.search([
+            ("fund_id", "in", funds.ids),
+            ("valuation_date", "=", accrual_date),
+            ("state", "!=", "cancelled"),
+        ])
+        valuation_by_fund = {val.fund_id.id: val for val in valuations}
+        missing = funds.filtered(lambda f: f.id not in valuation_by_fund)
+        for val in self.create([{"fund_id": fund.id, "valuation_date": accrual_date} for fund in missing]):
+            valuation_by_fund[val.fund_id.id] = val
+        funds = funds.filtered(lambda f: valuation_by_fund[f.id].state != "validated")
+        if not funds:
+            return self.env["efund.fund.valuation.fee"]
+        # Les lignes du jour entrent dans la VL en cours de calcul : seules les VL suivantes
+        # sont marquées, et uniquement si les montants changent (voir fin de méthode)
+        Fee = self.env["efund.fund.valuation.fee"].with_context(efund_fee_accrual=True)
+        previous_fees = Fee.search([
+            ("valuation_id", "in", [valuation_by_fund[fund.id].id for fund in funds]),
+            ("is_accrual", "=", True),
+        ])
+        previous_amounts = previous_fees._get_accrual_amounts()
+        previous_fees.unlink()
+
+        fund_values = Nav._compute_nav_values(accrual_date, funds)
+        previous_fund_navs = self._get_previous_fund_navs(accrual_date, funds.ids)
+        classes = classes.filtered(lambda c: c.fund_id in funds)
+        units_by_class = self.env["efund.account.part"]._query_units_by_class(accrual_date, funds.ids)
+        previous_class_navs = Class._get_previous_class_navs(accrual_date, classes.ids)
+        launch_navs = Class._get_launch_class_navs(classes.ids)
+        # Provision de performance déjà constituée (depuis la dernière cristallisation) avant ce jour
+        provisioned = Nav._query_class_fees(accrual_date - timedelta(days=1), classes.ids)
+
+        vals_list = []
+        for fund in funds:
+            valuation = valuation_by_fund[fund.id]
+            previous_date = previous_fund_navs.get(fund.id)
+            days = (accrual_date - previous_date).days if previous_date else 1
+
+            def accrual(fee_type, base, rate, share_class=None, description=None):
+                vals_list.append({
+                    "valuation_id": valuation.id,
+                    "share_class_id": share_class.id if share_class else False,
+                    "fee_type": fee_type,
+                    "description": description or _("Frais courus sur %s jour(s)") % days,
+                    "amount": base * rate / 100 * days / 365,
+                    "base_amount": base,
+                    "rate": rate,
+                    "days": days,
+                    "is_accrual": True,
+                })
+                return vals_list[-1]["amount"]
+
+            # Assiette : actif valorisé diminué des frais restant dus (hors lignes automatiques du jour)
+            base = fund_values[fund.id]["nav_total"]
+            fund_fees = accrual("custody", base, fund.custody_fee_rate) if fund.custody_fee_rate else 0.0
+            fund_fees += accrual("taf", base, fund.taf_rate) if fund.taf_rate else 0.0
+            fund_classes = classes_by_fund.get(fund, Class)
+            if not fund_classes:
+                if fund.management_fee_rate:
+                    accrual("management", base - fund_fees, fund.management_fee_rate)
+                continue
+
+            units = fund_classes._get_class_units(fund.id, units_by_class)
+            weights = fund_classes._get_allocation_weights(units, previous_class_navs)
+            for share_class in fund_classes:
+                class_base = (base - fund_fees) * weights[share_class.id]
+                management_fee = 0.0
+                if share_class.management_fee_rate and class_base:
+                    management_fee = accrual("management", class_base, share_class.management_fee_rate, share_class)
+                high_water_mark = share_class.high_water_mark or launch_navs.get(share_class.id, 0.0)
+                class_units = units[share_class.id]
+                previous_provision = provisioned.get(share_class.id, {}).get("performance", 0.0)
+                if not (share_class.performance_fee_rate and high_water_mark and class_units) \
+                        and not previous_provision:
+                    continue
+                provision = 0.0
+                excess = 0.0
+                if share_class.performance_fee_rate and high_water_mark and class_units:
+                    # VL avant commission de performance : la provision existante est réintégrée
+                    nav_before_performance = (class_base + previous_provision - management_fee) / class_units
+                    excess = max(nav_before_performance - high_water_mark, 0.0) * class_units
+                    provision = excess * share_class.performance_fee_rate / 100
+                if provision != previous_provision:
+                    vals_list.append({
+                        "valuation_id": valuation.id,
+                        "share_class_id": share_class.id,
+                        "fee_type": "performance",
+                        "description": _("Variation de la provision au-delà du high-water mark %.4f")
+                                       % high_water_mark,
+                        "amount": provision - previous_provision,
+                        "base_amount": excess,
+                        "rate": share_class.performance_fee_rate,
+                        "days": days,
+                        "is_accrual": True,
+                    })
+        fees = Fee.create(vals_list)
+        amounts = fees._get_accrual_amounts()
+        changed = self.browse([valuation_id for valuation_id in set(previous_amounts) | set(amounts)
+                               if previous_amounts.get(valuation_id) != amounts.get(valuation_id)])
+        self.env["efund.fund.nav.dirty"]._mark(changed.fund_id.ids, accrual_date + timedelta(days=1))
+        _logger.info("Frais courus au %s : %s fonds, %s ligne(s), %s fonds modifié(s)",
+                     accrual_date, len(funds), len(fees), len(changed.fund_id))
+        return fees
+
+    def action_accrue_fees(self):
+        """Recalcule les frais courus de la date de chaque valorisation sélectionnée."""
+        for valuation_date, valuations in self.grouped("valuation_date").items():
+            self._accrue_daily_fees(valuation_date, valuations.fund_id)
+        return True
+
     # ------------------------------
     # Accounting helper (placeholder)
     # ------------------------------
@@ -204,11 +471,43 @@ class FundValuation(models.Model):
     # ------------------------------
     # Logging helper
     # ------------------------------
-    def _log_action(self, action, message):
+    def _log_action(self, action, message=None, changed_fields=()):
+        """Met en attente une entrée de journal par valorisation.
+
+        Les entrées sont écrites en un seul lot juste avant la validation de la transaction
+        (annulées avec elle). Les mises à jour ("write") d'une même valorisation sont
+        fusionnées en une entrée qui liste l'ensemble des champs modifiés.
+        """
+        data = self.env.cr.precommit.data
+        if "efund.fund.valuation.log" not in data:
+            data["efund.fund.valuation.log"] = {}
+            self.env.cr.precommit.add(self._flush_log_buffer)
+        buffer = data["efund.fund.valuation.log"]
+        now = fields.Datetime.now()
         for rec in self:
-            self.env["efund.fund.valuation.log"].create({
+            key = (rec.id, "write") if action == "write" else (rec.id, action, len(buffer))
+            entry = buffer.setdefault(key, {
                 "valuation_id": rec.id,
                 "action": action,
                 "message": message,
                 "user_id": self.env.user.id,
+                "timestamp": now,
+                "fields": set(),
             })
+            entry["fields"].update(changed_fields)
+
+    def _flush_log_buffer(self):
+        """Crée en une fois les entrées de journal en attente (appelé au precommit)."""
+        buffer = self.env.cr.precommit.data.pop("efund.fund.valuation.log", {})
+        existing = set(self.browse({entry["valuation_id"] for entry in buffer.values()}).exists().ids)
+        vals_list = []
+        for entry in buffer.values():
+            if entry["valuation_id"] not in existing:
+                continue
+            changed = entry.pop("fields")
+            if entry["action"] == "write":
+                labels = sorted(self._fields[name].string for name in changed if name in self._fields)
+                entry["message"] = _("Valuation updated: %s.") % ", ".join(labels)
+            vals_list.append(entry)
+        if vals_list:
+            self.env["efund.fund.valuation.log"].sudo().create(vals_list)
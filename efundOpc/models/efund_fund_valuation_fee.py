@@ -9,9 +9,59 @@ class FundValuationFee(models.Model):
     fee_type = fields.Selection([
         ('management', 'Management Fee'),
         ('custody', 'Custody Fee'),
+        ('taf', 'TAF'),
+        ('performance', 'Performance Fee'),
         ('audit', 'Audit Fee'),
         ('other', 'Other')
     ], string="Fee Type", required=True)
     description = fields.Char()
     amount = fields.Monetary(currency_field='currency_id')
+    share_class_id = fields.Many2one('efund.fund.class', string="Share Class", index=True,
+                                     help="Frais propres à une classe de parts (gestion, performance).")
+    is_accrual = fields.Boolean(string="Automatic Accrual", readonly=True,
+                                help="Ligne calculée par le moteur de frais courus, recalculée à chaque passage.")
+    base_amount = fields.Monetary(string="Assiette", currency_field='currency_id', readonly=True)
+    rate = fields.Float(string="Taux annuel (%)", digits=(16, 4), readonly=True)
+    days = fields.Integer(string="Jours courus", readonly=True)
     currency_id = fields.Many2one(related='valuation_id.currency_id', store=True, readonly=True)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['efund.fund.valuation'].browse({vals.get('valuation_id') for vals in vals_list} - {None})._check_not_frozen()
+        fees = super().create(vals_list)
+        fees._mark_navs_dirty()
+        return fees
+
+    def write(self, vals):
+        self.valuation_id._check_not_frozen()
+        tracked = {'valuation_id', 'amount'} & set(vals)
+        if tracked:
+            self._mark_navs_dirty()
+        res = super().write(vals)
+        if tracked:
+            self._mark_navs_dirty()
+        return res
+
+    def unlink(self):
+        self.valuation_id._check_not_frozen()
+        self._mark_navs_dirty()
+        return super().unlink()
+
+    def _mark_navs_dirty(self):
+        """Les frais courus restent au passif de toutes les VL suivantes jusqu'à leur paiement.
+
+        Le moteur de frais courus (contexte ``efund_fee_accrual``) marque lui-même les VL
+        suivantes, et seulement si les montants du jour ont changé.
+        """
+        if self.env.context.get('efund_fee_accrual'):
+            return
+        for valuation in self.valuation_id:
+            self.env['efund.fund.nav.dirty']._mark(valuation.fund_id.ids, valuation.valuation_date)
+
+    def _get_accrual_amounts(self):
+        """:return: {valuation_id: montants (classe, type, montant) triés}, pour détecter un changement."""
+        amounts = {}
+        for fee in self:
+            amounts.setdefault(fee.valuation_id.id, []).append(
+                (fee.share_class_id.id, fee.fee_type, fee.currency_id.round(fee.amount)))
+        return {valuation_id: sorted(lines) for valuation_id, lines in amounts.items()}
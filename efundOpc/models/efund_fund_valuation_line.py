@@ -25,6 +25,19 @@ class FundValuationLine(models.Model):
             acc = rec.accrued_interest or 0.0
             rec.market_value = q * up + acc
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env["efund.fund.valuation"].browse({vals.get("valuation_id") for vals in vals_list} - {None})._check_not_frozen()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.valuation_id._check_not_frozen()
+        return super().write(vals)
+
+    def unlink(self):
+        self.valuation_id._check_not_frozen()
+        return super().unlink()
+
     def name_get(self):
         res = []
         for rec in self:
@@ -0,0 +1,153 @@
+import base64
+import csv
+import io
+import tempfile
+import unicodedata
+from datetime import date, datetime
+from itertools import islice
+
+from openpyxl import load_workbook
+from openpyxl.utils.datetime import from_excel
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+
+# Taille (multiple de 4) des tranches base64 décodées vers le fichier temporaire
+B64_CHUNK_SIZE = 4 * 64 * 1024
+
+
+class EfundStreamingImportMixin(models.AbstractModel):
+    _name = 'efund.streaming.import.mixin'
+    _description = "Lecture en flux des fichiers d'import (CSV / XLSX)"
+
+    def _decode_to_tempfile(self, data):
+        """Décode un contenu base64 par tranches dans un fichier temporaire."""
+        if isinstance(data, str):
+            data = data.encode()
+        tmp = tempfile.TemporaryFile()
+        for start in range(0, len(data), B64_CHUNK_SIZE):
+            tmp.write(base64.b64decode(data[start:start + B64_CHUNK_SIZE]))
+        tmp.seek(0)
+        return tmp
+
+    def _is_xlsx(self, filename):
+        return bool(filename) and filename.lower().endswith(('.xlsx', '.xlsm'))
+
+    def _iter_file_rows(self, data, filename):
+        """Itère sur (numéro de ligne, valeurs) d'un fichier CSV ou XLSX encodé en base64.
+
+        Le fichier est lu ligne à ligne : la mémoire utilisée ne dépend pas de sa taille.
+        Les lignes vides sont ignorées. Seule la première feuille d'un classeur est lue.
+        """
+        for __, rows in self._iter_file_sheets(data, filename, first_sheet_only=True):
+            yield from rows
+
+    def _iter_file_sheets(self, data, filename, sheet_names=None, first_sheet_only=False):
+        """Itère sur (nom de feuille, lignes) d'un fichier CSV ou XLSX encodé en base64.
+
+        Un CSV forme une seule feuille (nom None). Un classeur est lu feuille par feuille,
+        toutes par défaut ou celles de ``sheet_names`` ; chaque feuille a ses propres en-têtes.
+        Les lignes de chaque feuille doivent être consommées avant de passer à la suivante.
+        """
+        with self._decode_to_tempfile(data) as tmp:
+            if self._is_xlsx(filename):
+                sheets = self._iter_xlsx_sheets(tmp, sheet_names, first_sheet_only)
+            else:
+                sheets = [(None, self._iter_csv_rows(tmp))]
+            for sheet_name, rows in sheets:
+                yield sheet_name, (
+                    (line_number, values) for line_number, values in rows
+                    if any(value not in (None, '') for value in values)
+                )
+
+    def _iter_csv_rows(self, stream):
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        for line_number, row in enumerate(csv.reader(text, dialect), 1):
+            yield line_number, [value.strip() for value in row]
+        text.detach()
+
+    def _iter_xlsx_sheets(self, stream, sheet_names=None, first_sheet_only=False):
+        """Lit le classeur en mode read-only (streaming) : une ligne à la fois en mémoire.
+
+        Les cellules date sont renvoyées telles qu'Excel les stocke (datetime).
+        """
+        try:
+            workbook = load_workbook(stream, read_only=True, data_only=True)
+        except Exception as e:
+            raise UserError(_("Fichier Excel illisible : %s") % e)
+        try:
+            if sheet_names:
+                missing = [name for name in sheet_names if name not in workbook.sheetnames]
+                if missing:
+                    raise UserError(_("Feuille(s) absente(s) du classeur : %s") % ", ".join(missing))
+                worksheets = [workbook[name] for name in sheet_names]
+            else:
+                worksheets = workbook.worksheets[:1] if first_sheet_only else workbook.worksheets
+            for worksheet in worksheets:
+                yield worksheet.title, (
+                    (line_number, [value.strip() if isinstance(value, str) else value for value in row])
+                    for line_number, row in enumerate(worksheet.iter_rows(values_only=True), 1)
+                )
+        finally:
+            workbook.close()
+
+    def _normalize_header(self, value):
+        """En-tête normalisé : minuscules, sans accents, espaces remplacés par « _ »."""
+        value = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode()
+        return value.strip().lower().replace(' ', '_').replace('-', '_')
+
+    def _map_header(self, header, aliases):
+        """Position de chaque colonne connue : {clé: index} d'après ``aliases`` {clé: (noms acceptés)}."""
+        normalized = [self._normalize_header(value) for value in header]
+        columns = {}
+        for key, names in aliases.items():
+            for index, name in enumerate(normalized):
+                if name in names:
+                    columns[key] = index
+                    break
+        return columns
+
+    def _parse_float(self, value):
+        """Nombre issu d'une cellule : accepte la virgule décimale et les séparateurs de milliers."""
+        if value in (None, ''):
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        return float(str(value).replace('\xa0', '').replace(' ', '').replace(',', '.'))
+
+    def _parse_date(self, value):
+        """Date issue d'une cellule : date Excel native (ou numéro de série), ISO (AAAA-MM-JJ) ou JJ/MM/AAAA."""
+        if value in (None, ''):
+            return None
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if isinstance(value, (int, float)):
+            # Cellule date sans format : numéro de série Excel
+            return from_excel(value).date()
+        value = str(value).strip()
+        try:
+            return fields.Date.to_date(value[:10])
+        except ValueError:
+            return datetime.strptime(value, '%d/%m/%Y').date()
+
+    def _iter_chunks(self, iterable, size):
+        """Découpe un itérable en listes de ``size`` éléments au plus."""
+        iterator = iter(iterable)
+        while chunk := list(islice(iterator, size)):
+            yield chunk
+
+    def _make_error_report(self, errors):
+        """Rapport d'erreurs CSV (base64) à partir de tuples (ligne, valeur, message)."""
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=';')
+        writer.writerow([_("Ligne"), _("Valeur"), _("Erreur")])
+        writer.writerows(errors)
+        return base64.b64encode(output.getvalue().encode('utf-8-sig'))
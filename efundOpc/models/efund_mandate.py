@@ -27,6 +27,8 @@ class EfundMandate(models.Model):
     coupon_rate = fields.Float(string="Taux de coupon annuel (%)", required=True)
     currency_id = fields.Many2one(related='management_company_id.company_id.currency_id', store=True)
     capital_remaining = fields.Monetary(compute='_compute_financial_summary',currency_field='currency_id',)
+    total_deposit = fields.Monetary(string="Versements", compute='_compute_financial_summary',currency_field='currency_id',)
+    capital_returned = fields.Monetary(string="Capital remboursé", compute='_compute_financial_summary',currency_field='currency_id',)
     coupons_paid = fields.Monetary(compute='_compute_financial_summary',currency_field='currency_id',)
     cash_balance = fields.Monetary(compute='_compute_financial_summary',currency_field='currency_id',)
     state = fields.Selection([('draft', 'Brouillon'), ('active', 'Actif'), ('terminated', 'Terminé')], default='draft',
@@ -101,49 +103,33 @@ class EfundMandate(models.Model):
 
 
 
+    @api.depends('capital_committed', 'cash_move_ids.amount_signed', 'cash_move_ids.state')
     def _compute_financial_summary(self):
-        CashMove = self.env['efund.account.cash.move']
+        """Synthèse financière de tous les mandats de self en un seul regroupement SQL."""
+        summary = {}
+        groups = self.env['efund.account.cash.move']._read_group(
+            [('mandate_id', 'in', self._origin.ids), ('state', '=', 'posted')],
+            ['mandate_id', 'move_type'],
+            ['amount:sum', 'amount_signed:sum'],
+        )
+        for mandate, move_type, amount, amount_signed in groups:
+            totals = summary.setdefault(mandate.id, {'balance': 0.0})
+            totals[move_type] = amount or 0.0
+            totals['balance'] += amount_signed or 0.0
 
         for mandate in self:
-            if not mandate.id:
-                mandate.capital_remaining = 0.0
-                mandate.coupons_paid = 0.0
-                mandate.cash_balance = 0.0
-                continue
-
-            moves = CashMove.search([
-                ('mandate_id', '=', mandate.id),
-            ])
+            totals = summary.get(mandate._origin.id, {})
 
             # Dépôt initial / versements
-            total_deposit = sum(
-                m.amount for m in moves
-                if m.move_type == 'deposit'
-            )
-
+            mandate.total_deposit = totals.get('deposit', 0.0)
             # Coupons payés
-            total_coupon = sum(
-                m.amount for m in moves
-                if m.move_type == 'coupon'
-            )
-
+            mandate.coupons_paid = totals.get('coupon', 0.0)
             # Capital remboursé
-            total_capital_return = sum(
-                m.amount for m in moves
-                if m.move_type == 'capital_return'
-            )
-
+            mandate.capital_returned = totals.get('capital_return', 0.0)
             # Solde espèces réel
-            mandate.cash_balance = sum(
-                m.amount_signed for m in moves
-            )
-
+            mandate.cash_balance = totals.get('balance', 0.0)
             # Capital restant à rembourser
-            mandate.capital_remaining = (
-                    mandate.capital_committed - total_capital_return
-            )
-
-            mandate.coupons_paid = total_coupon
+            mandate.capital_remaining = mandate.capital_committed - mandate.capital_returned
 
     # -------------------------------------------------
     # ACTIVATION DU MANDAT
@@ -1,5 +1,6 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
 
 class FundOperation(models.AbstractModel):
     _name = 'efund.operation.base'
@@ -28,3 +29,34 @@ class FundOperation(models.AbstractModel):
 
     def action_execute(self):
         raise NotImplementedError("À implémenter dans les modèles enfants")
+
+    @api.model
+    def _write_settlement_values(self, values_by_order):
+        """Écrit en une seule requête les montants de règlement propres à chaque ordre.
+
+        Les montants écrits sont définitifs : ils ne sont pas recalculés par les champs
+        calculés qui en dépendent.
+
+        :param values_by_order: {ordre: {champ: montant}}, mêmes champs pour tous les ordres
+        """
+        if not values_by_order:
+            return
+        fnames = list(next(iter(values_by_order.values())))
+        orders = self.browse([order.id for order in values_by_order])
+        orders.flush_recordset()
+        self.env.cr.execute(SQL(
+            """
+            UPDATE %(table)s AS ord
+               SET %(assignments)s
+              FROM (VALUES %(values)s) AS v(%(columns)s)
+             WHERE ord.id = v.id
+            """,
+            table=SQL.identifier(self._table),
+            assignments=SQL(", ").join(SQL("%s = v.%s", SQL.identifier(fname), SQL.identifier(fname))
+                                       for fname in fnames),
+            values=SQL(", ").join(
+                SQL("(%s, %s)", order.id, SQL(", ").join(SQL("%s::float8", values[fname]) for fname in fnames))
+                for order, values in values_by_order.items()),
+            columns=SQL(", ").join(SQL.identifier(column) for column in ['id', *fnames]),
+        ))
+        orders.invalidate_recordset(fnames)
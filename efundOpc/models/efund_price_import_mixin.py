@@ -0,0 +1,299 @@
+import logging
+from datetime import date, datetime
+from itertools import chain, islice
+
+from odoo import models, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Colonnes reconnues dans les fichiers de cours et leurs libellés acceptés (mapping par défaut)
+PRICE_COLUMNS = {
+    'instrument_code': ('isin', 'ticker', 'code', 'code_instrument', 'instrument', 'symbole', 'symbol', 'mnemo'),
+    'price': ('cours', 'prix', 'price', 'cloture', 'close', 'dernier_cours'),
+    'date': ('date', 'date_cours', 'date_du_cours', 'seance'),
+    'currency': ('devise', 'currency'),
+    'open': ('ouverture', 'open'),
+    'high': ('plus_haut', 'haut', 'high'),
+    'low': ('plus_bas', 'bas', 'low'),
+    'volume': ('volume', 'quantite_echangee'),
+}
+
+# Fichiers sans en-tête : Code_Instrument, Prix, Date
+DEFAULT_PRICE_COLUMNS = {'instrument_code': 0, 'price': 1, 'date': 2}
+
+NUMERIC_TARGETS = ('price', 'close', 'open', 'high', 'low', 'volume')
+
+# Cible du mapping -> champ de efund.fund.instrument.price
+OHLCV_FIELDS = {'open': 'open_price', 'high': 'high_price', 'low': 'low_price', 'volume': 'volume'}
+
+
+class EfundPriceImportMixin(models.AbstractModel):
+    _name = 'efund.price.import.mixin'
+    _inherit = ['efund.streaming.import.mixin']
+    _description = "Import en masse des cours (upsert par lots)"
+
+    # -------------------------
+    # PRÉ-RÉSOLUTION
+    # -------------------------
+    def _prepare_price_lookup_maps(self):
+        """Instruments (par ISIN, ticker et nom) et devises, chargés une fois pour tout le fichier."""
+        instruments = self.env['efund.fund.instrument'].with_context(active_test=False).search_read(
+            [], ['isin', 'ticker', 'name', 'currency_id'], load=None)
+        by_code, by_name = {}, {}
+        for instrument in instruments:
+            values = (instrument['id'], instrument['currency_id'], instrument['name'])
+            # Le ticker ne masque jamais un ISIN identique
+            if instrument['ticker']:
+                by_code.setdefault(instrument['ticker'].strip().upper(), values)
+            if instrument['isin']:
+                by_code[instrument['isin'].strip().upper()] = values
+            if instrument['name']:
+                by_name.setdefault(instrument['name'].strip().upper(), values)
+        currencies = self.env['res.currency'].with_context(active_test=False).search_read([], ['name'], load=None)
+        return {
+            'instrument_by_code': by_code,
+            'instrument_by_name': by_name,
+            'currency_by_name': {currency['name'].upper(): currency['id'] for currency in currencies},
+        }
+
+    # -------------------------
+    # MOTEUR DE MAPPING
+    # -------------------------
+    def _default_price_specs(self, header):
+        """Mapping par défaut : colonnes reconnues par leur libellé, sinon format historique.
+
+        :return: (specs, True si ``header`` est bien une ligne d'en-tête)
+        """
+        columns = self._map_header(header, PRICE_COLUMNS)
+        is_header = 'instrument_code' in columns and 'price' in columns
+        if not is_header:
+            columns = DEFAULT_PRICE_COLUMNS
+        return [{'target': target, 'column_index': index} for target, index in columns.items()], is_header
+
+    def _compile_getter(self, spec, header):
+        """Accès à la valeur source d'une spec : position de colonne ou chemin JSON (a.b.0.c)."""
+        if spec.get('path'):
+            keys = [int(key) if key.isdigit() else key for key in spec['path'].split('.')]
+
+            def get_path(record):
+                try:
+                    for key in keys:
+                        record = record[key]
+                except (KeyError, IndexError, TypeError):
+                    return None
+                return record
+            return get_path
+
+        index = spec.get('column_index')
+        if spec.get('column_name'):
+            normalized = [self._normalize_header(value) for value in header or []]
+            name = self._normalize_header(spec['column_name'])
+            if name not in normalized:
+                if not spec.get('required'):
+                    return lambda values: None
+                raise UserError(_("Colonne « %s » absente de l'en-tête du fichier.") % spec['column_name'])
+            index = normalized.index(name)
+        if index is None:
+            raise UserError(_("Le mapping « %s » n'indique ni colonne ni chemin.") % spec['target'])
+        return lambda values: values[index] if index < len(values) else None
+
+    def _compile_converter(self, spec):
+        """Conversion de la valeur brute selon la cible et les formats déclarés."""
+        target = spec['target']
+        if target == 'date':
+            date_format = spec.get('date_format')
+            if not date_format:
+                return self._parse_date
+
+            def to_date(value):
+                if isinstance(value, datetime):
+                    return value.date()
+                if isinstance(value, date):
+                    return value
+                return datetime.strptime(str(value).strip(), date_format).date()
+            return to_date
+
+        if target in NUMERIC_TARGETS:
+            decimal_separator = spec.get('decimal_separator') or None
+            thousands_separator = spec.get('thousands_separator') or None
+            scale = spec.get('scale') or 1.0
+            if not decimal_separator and not thousands_separator:
+                parse = self._parse_float
+            else:
+                def parse(value):
+                    if isinstance(value, (int, float)):
+                        return float(value)
+                    text = str(value).replace('\xa0', '').replace(' ', '')
+                    if thousands_separator:
+                        text = text.replace(thousands_separator, '')
+                    if decimal_separator and decimal_separator != '.':
+                        text = text.replace(decimal_separator, '.')
+                    return float(text)
+            if scale == 1.0:
+                return parse
+            return lambda value: parse(value) * scale
+
+        return lambda value: str(value).strip()
+
+    def _compile_price_extractor(self, specs, header=None):
+        """Compile une fois les specs de mapping en une fonction ligne -> {cible: valeur convertie}.
+
+        Une spec est un dict : target, column_index / column_name ou path (JSON),
+        date_format, decimal_separator, thousands_separator, scale et required.
+        Accès et conversions sont résolus à la compilation : l'extraction d'une ligne
+        n'est plus qu'une suite d'appels directs.
+        """
+        steps = [(spec['target'], self._compile_getter(spec, header), self._compile_converter(spec))
+                 for spec in specs]
+
+        def extract(values):
+            record = {}
+            for target, get, convert in steps:
+                raw = get(values)
+                if raw is None or raw == '':
+                    continue
+                try:
+                    record[target] = convert(raw)
+                except (ValueError, TypeError, ArithmeticError):
+                    raise UserError(_("Valeur « %(value)s » invalide pour %(target)s.", value=raw, target=target))
+            return record
+        return extract
+
+    # -------------------------
+    # VALIDATION D'UNE LIGNE
+    # -------------------------
+    def _prepare_price_values(self, record, maps, default_date=None):
+        """Contrôle une ligne extraite et renvoie les valeurs du cours
+        (voir efund.fund.instrument.price._upsert_prices).
+
+        Lève une UserError dont le message alimente le rapport d'erreurs.
+        """
+        code = str(record.get('instrument_code') or '').strip().strip('"').upper()
+        instrument = maps['instrument_by_code'].get(code) if code else \
+            maps['instrument_by_name'].get(str(record.get('instrument_name') or '').upper())
+        if not instrument:
+            raise UserError(_("Instrument « %s » inconnu (ISIN ou ticker attendu).")
+                            % (code or record.get('instrument_name') or ''))
+        instrument_id, currency_id, name = instrument
+        price = record.get('close', record.get('price'))
+        price_date = record.get('date') or default_date
+        if not price or price <= 0:
+            raise UserError(_("Le cours doit être positif."))
+        if not price_date:
+            raise UserError(_("Date du cours manquante."))
+        currency = str(record.get('currency') or '').upper()
+        if currency:
+            currency_id = maps['currency_by_name'].get(currency)
+            if not currency_id:
+                raise UserError(_("Devise « %s » inconnue.") % currency)
+        vals = {
+            'instrument_id': instrument_id,
+            'date': price_date,
+            'price': price,
+            'currency_id': currency_id,
+            'display_name': f"{name} - {price_date} - {price:.4f}",
+        }
+        for target, field_name in OHLCV_FIELDS.items():
+            if target in record:
+                vals[field_name] = record[target]
+        return vals
+
+    # -------------------------
+    # IMPORT
+    # -------------------------
+    def _import_price_file(self, data, filename, default_date=None, chunk_size=5000, sheet_names=None,
+                           specs=None, header_rows=1):
+        """Lit un fichier de cours en flux et l'intègre par lots (upsert sur instrument et date).
+
+        Un classeur XLSX est lu feuille par feuille (une par marché, par exemple), toutes
+        par défaut ou celles de ``sheet_names``. Sans ``specs``, chaque feuille (ou le CSV)
+        peut avoir un en-tête (colonnes reconnues par leur libellé) ou suivre le format
+        historique Code_Instrument, Prix, Date. Les lignes rejetées n'empêchent pas
+        l'import des autres.
+
+        :param specs: mapping explicite (voir :meth:`_compile_price_extractor`)
+        :param header_rows: lignes d'en-tête précédant les données, avec un mapping explicite
+        :return: dict line_count, created, updated (ids) et errors [(ligne, valeur, message)]
+        """
+        maps = self._prepare_price_lookup_maps()
+        result = {'line_count': 0, 'created': [], 'updated': [], 'errors': []}
+        for sheet_name, rows in self._iter_file_sheets(data, filename, sheet_names):
+            if specs:
+                header_lines = list(islice(rows, header_rows))
+                extract = self._compile_price_extractor(specs, header_lines[-1][1] if header_lines else [])
+            else:
+                first = next(rows, None)
+                if first is None:
+                    continue
+                default_specs, is_header = self._default_price_specs(first[1])
+                extract = self._compile_price_extractor(default_specs)
+                if not is_header:
+                    rows = chain([first], rows)
+            self._import_price_rows(
+                ((line_number, sheet_name, values) for line_number, values in rows),
+                extract, maps, result, default_date, chunk_size)
+        if not result['line_count']:
+            raise UserError(_("Le fichier est vide."))
+        _logger.info("Import des cours (%s) : %s lignes, %s créés, %s mis à jour, %s rejets",
+                     filename, result['line_count'], len(result['created']), len(result['updated']),
+                     len(result['errors']))
+        return result
+
+    def _import_price_records(self, records, specs, default_date=None, chunk_size=5000, keyed=False):
+        """Intègre des enregistrements JSON (réponse d'API) via un mapping à chemins.
+
+        :param keyed: ``records`` est une suite de (code par défaut, enregistrement) ; le
+                      code sert lorsque la réponse n'identifie pas l'instrument
+        :return: même structure que :meth:`_import_price_file`
+        """
+        maps = self._prepare_price_lookup_maps()
+        result = {'line_count': 0, 'created': [], 'updated': [], 'errors': []}
+        extract = self._compile_price_extractor(specs)
+        if keyed:
+            extract_record = extract
+
+            def extract(item):
+                code, record = item
+                values = extract_record(record)
+                if code:
+                    values.setdefault('instrument_code', code)
+                return values
+        self._import_price_rows(
+            ((index, None, record) for index, record in enumerate(records, 1)),
+            extract, maps, result, default_date, chunk_size)
+        return result
+
+    def _import_price_rows(self, rows, extract, maps, result, default_date, chunk_size):
+        """Valide et intègre des lignes (n°, feuille, valeurs) par lots dans ``result``."""
+        Price = self.env['efund.fund.instrument.price']
+        for chunk in self._iter_chunks(rows, chunk_size):
+            by_key, line_by_key, errors = {}, {}, []
+            for line_number, sheet_name, values in chunk:
+                result['line_count'] += 1
+                line = '%s!%s' % (sheet_name, line_number) if sheet_name else line_number
+                record = {}
+                try:
+                    record = extract(values)
+                    vals = self._prepare_price_values(record, maps, default_date)
+                except UserError as e:
+                    code = record.get('instrument_code') or record.get('instrument_name') or ''
+                    errors.append((line_number, line, code, e.args[0]))
+                    continue
+                # Dernière occurrence retenue pour une même clé dans le lot
+                key = (vals['instrument_id'], vals['date'])
+                by_key[key] = vals
+                line_by_key[key] = (line_number, line, record.get('instrument_code') or '')
+            created, updated, skipped = Price._upsert_prices(list(by_key.values()))
+            result['created'] += created
+            result['updated'] += updated
+            for key in skipped:
+                errors.append(line_by_key[key] + (_("Cours déjà validé au %s : non modifié.") % key[1],))
+            errors.sort(key=lambda error: error[0])
+            result['errors'] += [error[1:] for error in errors]
+
+    def _format_price_import_summary(self, result):
+        """Résumé lisible d'un import (voir :meth:`_import_price_file`)."""
+        return _("%(lines)s lignes lues, %(created)s cours créés, %(updated)s mis à jour, %(errors)s rejetées.",
+                 lines=result['line_count'], created=len(result['created']), updated=len(result['updated']),
+                 errors=len(result['errors']))
@@ -0,0 +1,208 @@
+import logging
+from array import array
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+
+_logger = logging.getLogger(__name__)
+
+
+class StressScenario(models.Model):
+    _name = 'efund.stress.scenario'
+    _description = 'Scénario de stress test'
+    _order = 'sequence, name'
+
+    name = fields.Char(string="Scénario", required=True)
+    sequence = fields.Integer(default=10)
+    description = fields.Text(string="Description")
+    active = fields.Boolean(default=True)
+    shock_ids = fields.One2many('efund.stress.shock', 'scenario_id', string="Chocs", copy=True)
+    result_ids = fields.One2many('efund.stress.result', 'scenario_id', string="Résultats", readonly=True)
+    last_run_date = fields.Date(string="Dernier calcul", readonly=True)
+
+    # -------------------------
+    # CHARGEMENT DES PORTEFEUILLES
+    # -------------------------
+    @api.model
+    def _load_portfolios(self, at_date, funds):
+        """Charge une fois toutes les lignes de portefeuille des fonds, sous forme de tableaux.
+
+        Les lignes sont valorisées comme dans la VL (efund.fund.nav._get_position_lines),
+        coupons courus compris.
+
+        :return: dict de tableaux alignés (une entrée par ligne) : fonds, valeur de marché,
+                 classe d'actif, émetteur, secteur et duration modifiée.
+        """
+        lines = self.env['efund.fund.nav']._get_position_lines(at_date, funds.ids)
+        instruments = self.env['efund.fund.instrument'].browse({line[1] for line in lines})
+        instruments.fetch(['instrument_type', 'asset_class_id', 'issuer_id', 'sector', 'coupon_rate',
+                           'coupon_frequency', 'maturity_date', 'tcn_rate', 'tcn_maturity_date'])
+        attributes = {
+            instrument.id: (instrument.asset_class_id.id, instrument.issuer_id.id, instrument.sector or '',
+                            instrument._get_modified_duration(at_date))
+            for instrument in instruments
+        }
+        portfolio = {
+            'fund_id': array('l'), 'market_value': array('d'), 'asset_class_id': array('l'),
+            'issuer_id': array('l'), 'sector': [], 'duration': array('d'),
+        }
+        for fund_id, instrument_id, quantity, price, accrued_interest in lines:
+            asset_class_id, issuer_id, sector, duration = attributes[instrument_id]
+            portfolio['fund_id'].append(fund_id)
+            portfolio['market_value'].append(quantity * (price or 0.0) + accrued_interest)
+            portfolio['asset_class_id'].append(asset_class_id or 0)
+            portfolio['issuer_id'].append(issuer_id or 0)
+            portfolio['sector'].append(sector)
+            portfolio['duration'].append(duration)
+        return portfolio
+
+    def _get_shock_tables(self):
+        """Tables de chocs du scénario : {clé: variation} par axe, et choc de taux en décimal."""
+        self.ensure_one()
+        tables = {'asset_class': {}, 'issuer': {}, 'sector': {}, 'rate': 0.0}
+        for shock in self.shock_ids:
+            if shock.shock_type == 'rate':
+                tables['rate'] += shock.rate_shift_bp / 10000
+                continue
+            key = {
+                'asset_class': shock.asset_class_id.id,
+                'issuer': shock.issuer_id.id,
+                'sector': shock.sector,
+            }[shock.shock_type]
+            tables[shock.shock_type][key] = tables[shock.shock_type].get(key, 0.0) + shock.price_shock / 100
+        return tables
+
+    # -------------------------
+    # CALCUL
+    # -------------------------
+    @api.model
+    def _run_stress(self, scenarios, funds=None, at_date=None):
+        """Applique tous les scénarios à tous les fonds en un passage sur les portefeuilles.
+
+        Les chocs de prix d'une ligne s'additionnent (classe d'actif, émetteur, secteur) ;
+        le choc de taux s'applique par la duration modifiée (ΔP/P = -D × Δy). La perte d'une
+        ligne est plafonnée à sa valeur de marché. L'impact est ensuite réparti entre les
+        classes de parts au prorata de leur actif net à la date du scénario.
+
+        :return: efund.stress.result créés
+        """
+        at_date = at_date or fields.Date.context_today(self)
+        if funds is None:
+            funds = self.env['efund.fund'].search([('state', '=', 'active')])
+        if not scenarios or not funds:
+            raise UserError(_("Sélectionnez au moins un scénario et un fonds actif."))
+
+        portfolio = self._load_portfolios(at_date, funds)
+        tables = [scenario._get_shock_tables() for scenario in scenarios]
+        impacts = [dict.fromkeys(funds.ids, 0.0) for __ in scenarios]
+
+        columns = zip(portfolio['fund_id'], portfolio['market_value'], portfolio['asset_class_id'],
+                      portfolio['issuer_id'], portfolio['sector'], portfolio['duration'])
+        for fund_id, market_value, asset_class_id, issuer_id, sector, duration in columns:
+            if not market_value:
+                continue
+            for table, fund_impacts in zip(tables, impacts):
+                change = (table['asset_class'].get(asset_class_id, 0.0)
+                          + table['issuer'].get(issuer_id, 0.0)
+                          + table['sector'].get(sector, 0.0)
+                          - duration * table['rate'])
+                fund_impacts[fund_id] += market_value * max(change, -1.0)
+
+        fund_values = self.env['efund.fund.nav']._compute_nav_values(at_date, funds)
+        classes = self.env['efund.fund.class'].search([('fund_id', 'in', funds.ids)])
+        classes_by_fund = classes.grouped('fund_id')
+        class_navs = self.env['efund.fund.class']._get_latest_class_navs(classes.ids, at_date)
+
+        Result = self.env['efund.stress.result']
+        Result.search([('scenario_id', 'in', scenarios.ids), ('run_date', '=', at_date)]).unlink()
+        vals_list = []
+        for scenario, fund_impacts in zip(scenarios, impacts):
+            for fund in funds:
+                values = fund_values[fund.id]
+                impact = fund_impacts[fund.id]
+                vals_list.append(self._prepare_result_values(
+                    scenario, fund, False, at_date, values['nav_total'], values['total_shares'], impact))
+                fund_classes = classes_by_fund.get(fund, classes.browse())
+                class_total = sum(class_navs.get(c.id, (None, 0.0, 0.0))[2] for c in fund_classes)
+                for share_class in fund_classes:
+                    __, units, net_assets = class_navs.get(share_class.id, (None, 0.0, 0.0))
+                    class_impact = impact * net_assets / class_total if class_total else 0.0
+                    vals_list.append(self._prepare_result_values(
+                        scenario, fund, share_class, at_date, net_assets, units, class_impact))
+        scenarios.write({'last_run_date': at_date})
+        _logger.info("Stress test au %s : %s scénario(s), %s fonds, %s lignes de portefeuille",
+                     at_date, len(scenarios), len(funds), len(portfolio['fund_id']))
+        return Result.create(vals_list)
+
+    @api.model
+    def _prepare_result_values(self, scenario, fund, share_class, at_date, net_assets, units, impact):
+        return {
+            'scenario_id': scenario.id,
+            'fund_id': fund.id,
+            'share_class_id': share_class.id if share_class else False,
+            'run_date': at_date,
+            'net_assets': net_assets,
+            'impact_amount': impact,
+            'impact_pct': impact / net_assets * 100 if net_assets else 0.0,
+            'nav_per_share': net_assets / units if units else 0.0,
+            'stressed_nav_per_share': (net_assets + impact) / units if units else 0.0,
+        }
+
+    def action_run(self):
+        """Lance les scénarios sélectionnés sur tous les fonds actifs."""
+        results = self._run_stress(self)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Résultats des stress tests"),
+            'res_model': 'efund.stress.result',
+            'view_mode': 'list,pivot',
+            'domain': [('id', 'in', results.ids)],
+        }
+
+
+class StressShock(models.Model):
+    _name = 'efund.stress.shock'
+    _description = 'Choc de stress test'
+
+    scenario_id = fields.Many2one('efund.stress.scenario', required=True, index=True, ondelete='cascade')
+    shock_type = fields.Selection([
+        ('asset_class', "Classe d'actif"),
+        ('issuer', 'Émetteur'),
+        ('sector', 'Secteur'),
+        ('rate', 'Taux'),
+    ], string="Axe", required=True, default='asset_class')
+    asset_class_id = fields.Many2one('efund.asset.class', string="Classe d'actif")
+    issuer_id = fields.Many2one('efund.instrument.issuer', string="Émetteur")
+    sector = fields.Selection(selection=lambda self: self.env['efund.fund.instrument']._fields['sector'].selection,
+                              string="Secteur")
+    price_shock = fields.Float(string="Variation de prix (%)", help="Ex. : -20 pour une baisse de 20 %.")
+    rate_shift_bp = fields.Float(string="Choc de taux (pb)", help="Ex. : 200 pour une hausse de 2 %.")
+
+    @api.constrains('shock_type', 'asset_class_id', 'issuer_id', 'sector')
+    def _check_shock_target(self):
+        for shock in self:
+            target = {
+                'asset_class': shock.asset_class_id,
+                'issuer': shock.issuer_id,
+                'sector': shock.sector,
+                'rate': True,
+            }[shock.shock_type]
+            if not target:
+                raise ValidationError(_("Le choc « %s » doit préciser sa cible.") % shock.scenario_id.name)
+
+
+class StressResult(models.Model):
+    _name = 'efund.stress.result'
+    _description = 'Résultat de stress test'
+    _order = 'run_date desc, scenario_id, fund_id, share_class_id'
+
+    scenario_id = fields.Many2one('efund.stress.scenario', string="Scénario", required=True, index=True,
+                                  ondelete='cascade')
+    fund_id = fields.Many2one('efund.fund', string="Fonds", required=True, index=True, ondelete='cascade')
+    share_class_id = fields.Many2one('efund.fund.class', string="Classe de parts", ondelete='cascade')
+    run_date = fields.Date(string="Date", required=True, index=True)
+    net_assets = fields.Float(string="Actif net")
+    impact_amount = fields.Float(string="Impact")
+    impact_pct = fields.Float(string="Impact (%)", digits=(16, 2))
+    nav_per_share = fields.Float(string="VL")
+    stressed_nav_per_share = fields.Float(string="VL stressée")
@@ -0,0 +1,57 @@
+from datetime import date
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestOrderClassNav(TransactionCase):
+    """Les ordres d'un fonds à classes sont réglés à la VL de leur classe, jamais à une VL de classe
+    confondue avec celle du fonds."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not cls.env['efund.management.company'].search_count([]):
+            cls.env['efund.management.company'].create({'company_id': cls.env.company.id})
+        fund_type = cls.env['efund.fund.type'].create({'name': "Type test", 'code': 'TST'})
+        cls.fund = cls.env['efund.fund'].create({
+            'name': "Fonds test classes VL",
+            'code': 'FTCV',
+            'fund_type': 'equity',
+            'fund_type_id': fund_type.id,
+            'initial_price': 'Cours Inconnu',
+            'current_vl': 1.0,
+        })
+        cls.class_a, cls.class_i = cls.env['efund.fund.class'].create([
+            {'name': "Classe A", 'sequence': 1, 'fund_id': cls.fund.id},
+            {'name': "Classe I", 'sequence': 2, 'fund_id': cls.fund.id},
+        ])
+        cls.nav_date = date(2025, 6, 30)
+        # La VL de classe est créée d'abord : une recherche sans filtre de classe la trouverait
+        cls.env['efund.fund.nav'].create([
+            {'fund_id': cls.fund.id, 'share_class_id': cls.class_i.id, 'date': cls.nav_date,
+             'nav_per_share': 250.0, 'status': 'posted'},
+            {'fund_id': cls.fund.id, 'share_class_id': cls.class_a.id, 'date': cls.nav_date,
+             'nav_per_share': 120.0, 'status': 'posted'},
+            {'fund_id': cls.fund.id, 'date': cls.nav_date, 'nav_per_share': 100.0, 'status': 'posted'},
+        ])
+
+    def test_fund_nav_per_share_ignores_class_navs(self):
+        self.assertEqual(self.fund._get_nav_per_share(self.nav_date), 100.0)
+
+    def test_class_nav_per_share(self):
+        self.assertEqual(self.fund._get_nav_per_share(self.nav_date, self.class_a), 120.0)
+        self.assertEqual(self.fund._get_nav_per_share(self.nav_date, self.class_i), 250.0)
+
+    def test_batch_navs_by_class(self):
+        batch = self.env['efund.fund.order.batch'].create({
+            'name': 'FTCV/test',
+            'fund_id': self.fund.id,
+            'cutoff_date': self.nav_date,
+            'cutoff_datetime': '2025-06-30 16:00:00',
+            'nav_date': self.nav_date,
+        })
+        self.assertEqual(batch._get_batch_nav(), 100.0)
+        self.assertEqual(batch._get_batch_nav(self.class_i), 250.0)
+        # Lot sans ordres : réglé à la VL du fonds
+        self.assertEqual(batch._get_batch_navs(), {self.env['efund.fund.class']: 100.0})
@@ -0,0 +1 @@
+from . import price_fetcher
@@ -0,0 +1,160 @@
+"""Serveur de cours simulé, pour tester et mesurer l'import API hors ligne.
+
+Répond au format Yahoo Finance (quoteResponse.result), avec latence, taux d'erreurs
+et limite de débit réglables :
+
+    GET /quote/<symbole>             un cours
+    GET /quote?symbols=A,B,C         plusieurs cours
+
+Lancement et mesure (sans Odoo) :
+
+    python efundOpc/tools/mock_price_server.py serve --port 8765 --error-rate 0.1
+    python efundOpc/tools/mock_price_server.py bench --symbols 1000 --workers 16
+
+Dans une configuration d'import : URL ``http://127.0.0.1:8765/quote/{symbol}``.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def quote(symbol, on_date=None):
+    """Cours déterministe d'un symbole pour une date (stable d'un appel à l'autre)."""
+    on_date = on_date or date.today()
+    seed = int(hashlib.sha256(f"{symbol}:{on_date.isoformat()}".encode()).hexdigest()[:8], 16)
+    base = 1000 + int(hashlib.sha256(symbol.encode()).hexdigest()[:4], 16) % 50000
+    return {
+        'symbol': symbol,
+        'regularMarketPrice': round(base * (1 + (seed % 2001 - 1000) / 100000), 2),
+        'currency': 'XOF',
+        'regularMarketTime': int(time.time()),
+    }
+
+
+class MockPriceHandler(BaseHTTPRequestHandler):
+    server_version = 'EfundMockPrices/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(random.uniform(0.5, 1.5) * server.latency)
+        if server.max_rps and not server.take_token():
+            return self._send(429, {'error': 'Too Many Requests'}, {'Retry-After': '1'})
+        if server.error_rate and random.random() < server.error_rate:
+            return self._send(random.choice((500, 502, 503)), {'error': 'Simulated failure'})
+
+        url = urlsplit(self.path)
+        if url.path.startswith('/quote/'):
+            symbols = [url.path[len('/quote/'):]]
+        elif url.path == '/quote':
+            symbols = [s for s in parse_qs(url.query).get('symbols', [''])[0].split(',') if s]
+        else:
+            return self._send(404, {'error': 'Not found'})
+        self._send(200, {'quoteResponse': {'result': [quote(symbol) for symbol in symbols], 'error': None}})
+
+
+class MockPriceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, max_rps=0, verbose=False):
+        super().__init__(address, MockPriceHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.verbose = verbose
+        self._window = (0, 0)
+        self._lock = threading.Lock()
+
+    def take_token(self):
+        """Limite de débit par fenêtre d'une seconde."""
+        with self._lock:
+            second, count = self._window
+            now = int(time.monotonic())
+            if now != second:
+                second, count = now, 0
+            self._window = (second, count + 1)
+            return count < self.max_rps
+
+
+def start_in_thread(host='127.0.0.1', port=0, **options):
+    """Démarre le serveur en tâche de fond. :return: (serveur, URL de base)"""
+    server = MockPriceServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://%s:%s' % server.server_address[:2]
+
+
+def benchmark(symbols=500, workers=16, latency=0.02, error_rate=0.1, max_rps=0, rate_limit=0, max_retries=3):
+    """Mesure débit et gestion des erreurs du PriceFetcher face au serveur simulé."""
+    try:
+        from .price_fetcher import PriceFetcher
+    except ImportError:
+        from price_fetcher import PriceFetcher
+
+    server, url = start_in_thread(latency=latency, error_rate=error_rate, max_rps=max_rps)
+    try:
+        jobs = [('SYM%04d' % i, url + '/quote/SYM%04d' % i, None) for i in range(symbols)]
+        start = time.monotonic()
+        with PriceFetcher(max_workers=workers, max_retries=max_retries, backoff=0.05,
+                          rate_limit=rate_limit, burst=workers) as fetcher:
+            failed = sum(1 for __, __, error in fetcher.fetch_all(jobs) if error)
+            stats = dict(fetcher.stats)
+        elapsed = time.monotonic() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return dict(stats, symbols=symbols, failed=failed, elapsed=round(elapsed, 3),
+                throughput=round(symbols / elapsed, 1) if elapsed else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=('serve', 'bench'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.02, help="latence moyenne par requête (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="part des requêtes en erreur 5xx")
+    parser.add_argument('--max-rps', type=int, default=0, help="débit maximal avant 429 (0 : illimité)")
+    parser.add_argument('--symbols', type=int, default=500, help="bench : nombre de symboles")
+    parser.add_argument('--workers', type=int, default=16, help="bench : requêtes simultanées")
+    parser.add_argument('--rate-limit', type=float, default=0, help="bench : débit côté client (req/s)")
+    parser.add_argument('--retries', type=int, default=3, help="bench : tentatives supplémentaires")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        print(json.dumps(benchmark(args.symbols, args.workers, args.latency, args.error_rate, args.max_rps,
+                                   args.rate_limit, args.retries), indent=2))
+        return
+    server = MockPriceServer((args.host, args.port), latency=args.latency, error_rate=args.error_rate,
+                             max_rps=args.max_rps, verbose=args.verbose)
+    print("Serveur de cours simulé sur http://%s:%s" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Récupération concurrente des cours auprès des fournisseurs de données de marché.
+
+Indépendant de l'ORM : les requêtes HTTP s'exécutent dans des threads, sans accès à
+l'environnement Odoo ; seules les réponses JSON sont rendues à l'appelant, qui les
+intègre ensuite dans sa transaction.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+# Codes HTTP pour lesquels une nouvelle tentative a un sens
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class RateLimiter:
+    """Seau à jetons partagé entre threads : au plus ``rate`` requêtes par seconde, par rafales de ``burst``."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Limiteurs par fournisseur (hôte), communs à tous les imports du processus
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(url, rate, burst=1):
+    """Limiteur du fournisseur de ``url`` ; recréé si son débit autorisé a changé."""
+    host = urlsplit(url).netloc
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None or (limiter.rate, limiter.burst) != (rate, max(burst, 1)):
+            limiter = _limiters[host] = RateLimiter(rate, burst)
+        return limiter
+
+
+class FetchError(Exception):
+    """Échec définitif d'une requête, après épuisement des tentatives."""
+
+
+class PriceFetcher:
+    """Exécute des requêtes GET en parallèle sur une session HTTP commune.
+
+    Connexions réutilisées (pool dimensionné sur le parallélisme), débit limité par
+    fournisseur, et nouvelles tentatives à délai exponentiel (avec aléa) sur les erreurs
+    réseau, les 5xx et les 429 (en respectant l'en-tête Retry-After).
+    """
+
+    def __init__(self, headers=None, timeout=10, max_workers=8, max_retries=3, backoff=0.5, max_backoff=30,
+                 rate_limit=0, burst=1):
+        self.timeout = timeout
+        self.max_workers = max(max_workers, 1)
+        self.max_retries = max(max_retries, 0)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+        self._stats_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _delay(self, attempt, response=None):
+        retry_after = response is not None and response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                try:
+                    return min(max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0), self.max_backoff)
+                except (TypeError, ValueError):
+                    pass
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1)
+
+    def get_json(self, url, params=None):
+        """GET avec limitation de débit et nouvelles tentatives ; lève FetchError en cas d'échec définitif."""
+        limiter = get_rate_limiter(url, self.rate_limit, self.burst)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            self._count('requests')
+            response = None
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    if response.status_code != 200:
+                        raise FetchError("HTTP %s : %s" % (response.status_code, response.text[:200]))
+                    return response.json()
+                error = "HTTP %s" % response.status_code
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            except ValueError as e:
+                raise FetchError("Réponse JSON invalide : %s" % e)
+            if attempt >= self.max_retries:
+                raise FetchError(error)
+            delay = self._delay(attempt, response)
+            _logger.debug("Nouvelle tentative dans %.2fs pour %s (%s)", delay, url, error)
+            self._count('retries')
+            attempt += 1
+            time.sleep(delay)
+
+    def fetch_all(self, jobs):
+        """Exécute les requêtes ``jobs`` [(clé, url, params)] en parallèle.
+
+        :return: générateur de (clé, données JSON ou None, message d'erreur ou None),
+                 dans l'ordre d'achèvement
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs)),
+                                thread_name_prefix='efund_price_fetch') as executor:
+            futures = {executor.submit(self.get_json, url, params): key for key, url, params in jobs}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except FetchError as e:
+                    self._count('failures')
+                    yield futures[future], None, str(e)
+                except Exception as e:
+                    self._count('failures')
+                    _logger.warning("Erreur inattendue lors de la récupération de %s", futures[future], exc_info=True)
+                    yield futures[future], None, str(e)
+
@@ -1,4 +1,4 @@
 from . import efund_bond_amortization_wizard, efund_bond_yield_wizard, efund_fund_instrument_price_wizard, \
     efund_position_wizard, efund_cash_deposit_wizard, efund_bourse_order_execution_wizard, \
     efund_account_activate_wizard, efund_fund_redemption_wizard, efund_fund_subscription_wizard, \
-    efund_mandate_termination_wizard, efund_confirm_wizard
+    efund_mandate_termination_wizard, efund_confirm_wizard, efund_fund_order_import_wizard
@@ -1,15 +1,13 @@
 # efund_fund_import_price_wizard.py
 import logging
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, _, Command
 from odoo.exceptions import UserError
-import base64
-import io
-import csv
 _logger = logging.getLogger(__name__)
 
 class FundImportPriceWizard(models.TransientModel):
     _name = "efund.fund.import.price.wizard"
+    _inherit = ["efund.price.import.mixin"]
     _description = "Assistant d'import des cours"
 
     import_type = fields.Selection([
@@ -25,8 +23,13 @@ class FundImportPriceWizard(models.TransientModel):
     currency_id = fields.Many2one('res.currency', string="Devise")
 
     # Pour import fichier
-    import_file = fields.Binary(string="Fichier CSV", required=False)
+    import_file = fields.Binary(string="Fichier (CSV / XLSX)", required=False)
     filename = fields.Char(string="Nom du fichier")
+    state = fields.Selection([('draft', 'Paramétrage'), ('done', 'Terminé')], default='draft')
+    import_summary = fields.Char(string="Résultat", readonly=True)
+    price_ids = fields.Many2many('efund.fund.instrument.price', string="Cours importés", readonly=True)
+    error_file = fields.Binary(string="Rapport d'erreurs", readonly=True, attachment=False)
+    error_filename = fields.Char(readonly=True)
 
     # Pour import API
     api_config_id = fields.Many2one('efund.fund.instrument.price.import', string="Configuration API")
@@ -83,95 +86,36 @@ class FundImportPriceWizard(models.TransientModel):
         }
 
     def _import_from_file(self):
-        """Importer depuis un fichier CSV"""
+        """Importer depuis un fichier (lecture en flux, upsert par lots)"""
         if not self.import_file:
             raise UserError(_("Veuillez sélectionner un fichier"))
 
-        try:
-            file_content = base64.b64decode(self.import_file)
-            text_content = file_content.decode('utf-8', errors='ignore')
-
-            csv_file = io.StringIO(text_content)
-            reader = csv.reader(csv_file, delimiter=',')
-
-            imported = 0
-            errors = []
-
-            for i, row in enumerate(reader, 1):
-                try:
-                    if i == 1 and len(row) > 0 and 'instrument' in row[0].lower():
-                        continue  # Sauter l'en-tête
-
-
-                    if len(row) >= 3:
-                        instrument_code = row[0].strip().strip('"')
-                        price_value = float(row[1].replace(',', '.').strip())
-                        price_date = row[2].strip()
-
-
-                        instrument_code = instrument_code.strip().strip('"')
-                        # Chercher l'instrument
-                        instrument = self.env['efund.fund.instrument'].search([('isin', '=', instrument_code)], limit=1)
-
-
-
-                        if not instrument:
-                            errors.append(f"Ligne {i}: Instrument '{instrument_code}' non trouvé")
-                            continue
-
-                        # Convertir la date
-                        from datetime import datetime
-                        try:
-                            date_obj = datetime.strptime(price_date, '%Y-%m-%d').date()
-                        except:
-                            date_obj = fields.Date.today()
-
-                        # Créer ou mettre à jour le prix
-                        existing = self.env['efund.fund.instrument.price'].search([
-                            ('instrument_id', '=', instrument.id),
-                            ('date', '=', date_obj)
-                        ], limit=1)
-
-                        if existing:
-                            existing.write({
-                                'price': price_value,
-                                'currency_id': instrument.currency_id.id,
-                            })
-                        else:
-                            self.env['efund.fund.instrument.price'].create({
-                                'instrument_id': instrument.id,
-                                'date': date_obj,
-                                'price': price_value,
-                                'currency_id': instrument.currency_id.id,
-                                'is_validated': False,
-                            })
-
-                        imported += 1
-
-                except Exception as e:
-                    errors.append(f"Ligne {i}: {str(e)}")
-
-            # Message de résultat
-            message = f"{imported} cours importés/mis à jour."
-            if errors:
-                message += f"\n{len(errors)} erreurs."
-                if len(errors) <= 5:
-                    for error in errors:
-                        message += f"\n- {error}"
-
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Import terminé'),
-                    'message': message,
-                    'type': 'info' if errors else 'success',
-                    'sticky': True,
-                }
-            }
+        result = self._import_price_file(self.import_file, self.filename, default_date=self.price_date)
+        errors = result['errors']
+        self.write({
+            'state': 'done',
+            'import_summary': self._format_price_import_summary(result),
+            'price_ids': [Command.set(result['created'] + result['updated'])],
+            'error_file': self._make_error_report(errors) if errors else False,
+            'error_filename': 'erreurs_%s.csv' % (self.filename or 'cours').rsplit('.', 1)[0] if errors else False,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
 
-        except Exception as e:
-            raise UserError(_("Erreur lors de l'import: %s") % str(e))
+    def action_view_prices(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Cours importés"),
+            'res_model': 'efund.fund.instrument.price',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', self.price_ids.ids)],
+        }
 
     def _import_from_api(self):
         """Importer depuis une API"""
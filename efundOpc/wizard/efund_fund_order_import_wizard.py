@@ -0,0 +1,240 @@
+import logging
+
+from odoo import models, fields, api, _, Command
+from odoo.exceptions import UserError
+from odoo.tools import float_compare
+
+_logger = logging.getLogger(__name__)
+
+# Colonnes reconnues dans les fichiers distributeurs et leurs libellés acceptés
+ORDER_COLUMNS = {
+    'account': ('compte', 'numero_compte', 'account', 'account_number'),
+    'order_type': ('type', 'sens', 'type_ordre', 'order_type'),
+    'amount': ('montant', 'amount'),
+    'parts': ('parts', 'nombre_parts', 'quantite', 'units'),
+    'nav_date': ('date_vl', 'nav_date'),
+}
+
+ORDER_TYPES = {
+    's': 'subscription', 'souscription': 'subscription', 'subscription': 'subscription',
+    'r': 'redemption', 'rachat': 'redemption', 'redemption': 'redemption',
+    'rt': 'total', 'rachat_total': 'total', 'total': 'total',
+}
+
+
+class FundOrderImportWizard(models.TransientModel):
+    _name = 'efund.fund.order.import.wizard'
+    _inherit = ['efund.streaming.import.mixin']
+    _description = "Import en masse des ordres distributeurs"
+
+    fund_id = fields.Many2one('efund.fund', string="Fonds", required=True)
+    import_file = fields.Binary(string="Fichier (CSV / XLSX)", required=True)
+    filename = fields.Char(string="Nom du fichier")
+    nav_date = fields.Date(string="Date VL par défaut", default=fields.Date.context_today, required=True,
+                           help="Utilisée pour les lignes sans colonne « date_vl ».")
+    chunk_size = fields.Integer(string="Taille des lots", default=1000)
+
+    state = fields.Selection([('draft', 'Paramétrage'), ('done', 'Terminé')], default='draft')
+    line_count = fields.Integer(string="Lignes lues", readonly=True)
+    error_count = fields.Integer(string="Lignes rejetées", readonly=True)
+    subscription_ids = fields.Many2many('efund.fund.subscription', string="Souscriptions créées", readonly=True)
+    redemption_ids = fields.Many2many('efund.fund.redemption', string="Rachats créés", readonly=True)
+    subscription_count = fields.Integer(compute='_compute_order_counts')
+    redemption_count = fields.Integer(compute='_compute_order_counts')
+    error_file = fields.Binary(string="Rapport d'erreurs", readonly=True, attachment=False)
+    error_filename = fields.Char(readonly=True)
+
+    @api.depends('subscription_ids', 'redemption_ids')
+    def _compute_order_counts(self):
+        for wizard in self:
+            wizard.subscription_count = len(wizard.subscription_ids)
+            wizard.redemption_count = len(wizard.redemption_ids)
+
+    # -------------------------
+    # PRÉ-RÉSOLUTION
+    # -------------------------
+    def _prepare_lookup_maps(self):
+        """Charge en une requête par modèle tout ce dont la validation des lignes a besoin.
+
+        La taille de ces tables dépend du nombre de comptes du fonds, pas de celle du fichier.
+        """
+        fund = self.fund_id
+        part_model = self.env['efund.account.part']
+        cash_accounts = self.env['efund.account.cash'].search_read(
+            [('fund_id', '=', fund.id), ('state', '=', 'active')],
+            ['account_number', 'investor_id', 'balance'], load=None)
+        part_accounts = part_model.search_read(
+            [('fund_id', '=', fund.id), ('state', '=', 'active')],
+            ['account_number', 'investor_id'], load=None)
+        validated = self.env['efund.fund.investor'].search_read(
+            [('fund_id', '=', fund.id), ('state', '=', 'validated')], ['investor_id'], load=None)
+        return {
+            'cash_by_number': {acc['account_number']: acc['investor_id'] for acc in cash_accounts},
+            'part_by_number': {acc['account_number']: acc['investor_id'] for acc in part_accounts},
+            'cash_by_investor': {acc['investor_id']: acc['id'] for acc in cash_accounts},
+            'part_by_investor': {acc['investor_id']: acc['id'] for acc in part_accounts},
+            'validated': {rec['investor_id'] for rec in validated},
+            # Disponibles décrémentés au fil du fichier pour refuser les ordres qui se cumulent
+            'balance': {acc['id']: acc['balance'] for acc in cash_accounts},
+            'holdings': part_model._query_holdings_at(fields.Date.context_today(self), fund_ids=[fund.id]),
+        }
+
+    # -------------------------
+    # VALIDATION D'UNE LIGNE
+    # -------------------------
+    def _cell(self, values, columns, key):
+        index = columns.get(key)
+        if index is None or index >= len(values):
+            return None
+        return values[index]
+
+    def _prepare_order_values(self, values, columns, maps):
+        """Contrôle une ligne et renvoie (modèle, valeurs de l'ordre brouillon).
+
+        Lève une UserError dont le message alimente le rapport d'erreurs.
+        """
+        fund = self.fund_id
+        number = str(self._cell(values, columns, 'account') or '').strip()
+        investor_id = maps['part_by_number'].get(number) or maps['cash_by_number'].get(number)
+        if not investor_id:
+            raise UserError(_("Compte « %s » inconnu ou inactif pour ce fonds.") % number)
+        if investor_id not in maps['validated']:
+            raise UserError(_("Investisseur non validé pour ce fonds."))
+        cash_id = maps['cash_by_investor'].get(investor_id)
+        part_id = maps['part_by_investor'].get(investor_id)
+        if not cash_id or not part_id:
+            raise UserError(_("L'investisseur doit disposer d'un compte espèces et d'un compte titres actifs."))
+
+        order_type = ORDER_TYPES.get(self._normalize_header(self._cell(values, columns, 'order_type')))
+        if not order_type:
+            raise UserError(_("Type d'ordre inconnu (S, R ou RT attendu)."))
+        try:
+            nav_date = self._parse_date(self._cell(values, columns, 'nav_date')) or self.nav_date
+            amount = self._parse_float(self._cell(values, columns, 'amount'))
+            parts = self._parse_float(self._cell(values, columns, 'parts'))
+        except ValueError:
+            raise UserError(_("Valeur numérique ou date invalide."))
+
+        if order_type == 'subscription':
+            if not amount or amount <= 0:
+                raise UserError(_("Le montant de souscription doit être positif."))
+            if float_compare(maps['balance'][cash_id], amount, precision_digits=2) < 0:
+                raise UserError(_("Solde espèces insuffisant (%.2f disponible).") % maps['balance'][cash_id])
+            maps['balance'][cash_id] -= amount
+            return 'efund.fund.subscription', {
+                'fund_id': fund.id,
+                'investor_id': investor_id,
+                'cash_account_id': cash_id,
+                'part_account_id': part_id,
+                'amount': amount,
+                'unit_value': fund.current_vl,
+                'nav_date': nav_date,
+                'state': 'draft',
+            }
+
+        available = maps['holdings'].get(part_id, 0.0)
+        if order_type == 'total':
+            parts = available
+        if not parts or parts <= 0:
+            raise UserError(_("Le nombre de parts à racheter doit être positif."))
+        if not fund.allow_fractional_parts and parts % 1:
+            raise UserError(_("Ce fonds n'accepte que des rachats de parts entières."))
+        if float_compare(available, parts, precision_digits=4) < 0:
+            raise UserError(_("Nombre de parts insuffisant (%.4f disponibles).") % available)
+        maps['holdings'][part_id] = available - parts
+        return 'efund.fund.redemption', {
+            'fund_id': fund.id,
+            'investor_id': investor_id,
+            'cash_account_id': cash_id,
+            'part_account_id': part_id,
+            'redemption_type': 'total' if order_type == 'total' else 'partial',
+            'parts_to_redeem': parts,
+            'estimated_nav': fund.current_vl,
+            'nav_date': nav_date,
+            'state': 'draft',
+        }
+
+    # -------------------------
+    # IMPORT
+    # -------------------------
+    def action_import(self):
+        """Lit le fichier en flux, valide les lignes par lots et crée les ordres en brouillon.
+
+        Chaque lot est créé en une fois puis le cache est vidé : la mémoire reste stable
+        quelle que soit la taille du fichier. Les lignes rejetées n'empêchent pas l'import
+        des autres et sont listées dans un rapport CSV téléchargeable.
+        """
+        self.ensure_one()
+        if self.fund_id.current_vl <= 0:
+            raise UserError(_("La valeur liquidative du fonds doit être positive."))
+        fund_id, import_file, filename = self.fund_id.id, self.import_file, self.filename
+        chunk_size = max(self.chunk_size, 1)
+
+        rows = self._iter_file_rows(import_file, filename)
+        header = next(rows, None)
+        columns = self._map_header(header[1] if header else [], ORDER_COLUMNS)
+        if 'account' not in columns or 'order_type' not in columns:
+            raise UserError(_("Le fichier doit contenir au moins les colonnes « compte » et « type »."))
+
+        maps = self._prepare_lookup_maps()
+        orders = self.env['efund.fund.subscription'].with_context(
+            tracking_disable=True, mail_create_nolog=True, mail_create_nosubscribe=True)
+        created = {'efund.fund.subscription': [], 'efund.fund.redemption': []}
+        errors = []
+        line_count = 0
+
+        for chunk in self._iter_chunks(rows, chunk_size):
+            to_create = {'efund.fund.subscription': [], 'efund.fund.redemption': []}
+            for line_number, values in chunk:
+                line_count += 1
+                try:
+                    model, vals = self._prepare_order_values(values, columns, maps)
+                except UserError as e:
+                    errors.append((line_number, self._cell(values, columns, 'account') or '', e.args[0]))
+                    continue
+                to_create[model].append(vals)
+            for model, vals_list in to_create.items():
+                if vals_list:
+                    created[model] += orders.env[model].create(vals_list).ids
+            self.env.flush_all()
+            self.env.invalidate_all()
+
+        _logger.info("Import ordres fonds %s (%s) : %s lignes, %s souscriptions, %s rachats, %s rejets",
+                     fund_id, filename, line_count, len(created['efund.fund.subscription']),
+                     len(created['efund.fund.redemption']), len(errors))
+        self.write({
+            'state': 'done',
+            'line_count': line_count,
+            'error_count': len(errors),
+            'subscription_ids': [Command.set(created['efund.fund.subscription'])],
+            'redemption_ids': [Command.set(created['efund.fund.redemption'])],
+            'error_file': self._make_error_report(errors) if errors else False,
+            'error_filename': 'erreurs_%s.csv' % (filename or 'import').rsplit('.', 1)[0] if errors else False,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def action_view_subscriptions(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Souscriptions importées"),
+            'res_model': 'efund.fund.subscription',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', self.subscription_ids.ids)],
+        }
+
+    def action_view_redemptions(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Rachats importés"),
+            'res_model': 'efund.fund.redemption',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', self.redemption_ids.ids)],
+        }